@@ -0,0 +1,146 @@
+"""
+End-to-end benchmark of a full run against the local mock Atlas server.
+
+Runs `main.main` in a scratch tree (`FGA_ROOT`) with `SERVANT_URL` and
+`CE_URL` pointing at `mock_atlas.MockAtlas`, and reports the throughput and
+tail latency of the download pipeline.
+
+Usage:
+    uv run benchmarks/bench_e2e.py [--servants N] [--ces N] [--latency S]
+        [--bandwidth B] [--error-rate R] [--throttle-rate R] [--retry-after S]
+"""
+
+import argparse
+import importlib
+import os
+import platform
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import UTC, datetime
+from pathlib import Path
+
+import anyio
+import orjson
+from mock_atlas import MockAtlas, MockConfig
+
+ROOT = Path(__file__).parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+def _quantiles(samples: list[float]) -> dict[str, float]:
+    samples = sorted(samples)
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+    def _at(q: float) -> float:
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    return {"p50": _at(0.5), "p95": _at(0.95), "p99": _at(0.99), "max": samples[-1]}
+
+
+def run(config: MockConfig) -> dict:
+    """
+    Run the pipeline against the mock server in a scratch tree.
+
+    Returns:
+        dict: The download and run figures.
+    """
+    with MockAtlas(config) as server, tempfile.TemporaryDirectory() as root:
+        (Path(root) / "fga-support").mkdir()
+
+        # Read by the modules on import, so they are imported afterwards
+        os.environ["FGA_ROOT"] = root
+        os.environ["SERVANT_URL"] = f"{server.url}/export/servant.json"
+        os.environ["CE_URL"] = f"{server.url}/export/ce.json"
+        sys.path.insert(0, str(ROOT / "src"))
+
+        from loguru import logger
+
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+
+        main = importlib.import_module("main")
+        metrics_module = importlib.import_module("metrics")
+        metrics = metrics_module.metrics
+        Stage = metrics_module.Stage
+
+        start = time.perf_counter()
+        anyio.run(main.main, False, False, False)
+        elapsed = time.perf_counter() - start
+
+        download = metrics.get(Stage.DOWNLOAD)
+        window = metrics.report()["gauges"].get("download_window", {})
+        stats = dict(server.stats)
+
+    return {
+        "entities": config.servants + config.ces,
+        "run_seconds": elapsed,
+        "downloads": len(download.durations),
+        "bytes": download.bytes,
+        "downloads_per_second": len(download.durations) / elapsed,
+        "bytes_per_second": download.bytes / elapsed,
+        "latency": _quantiles(download.durations),
+        "server_latency": _quantiles(server.latencies),
+        "server": stats,
+        "download_window": window,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--servants", type=int, default=20)
+    parser.add_argument("--ces", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--bandwidth", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        servants=args.servants,
+        ces=args.ces,
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+    )
+    result = run(config)
+
+    latency = result["latency"]
+    print(
+        f"entities={result['entities']} run={result['run_seconds']:.1f}s "
+        f"downloads={result['downloads']} "
+        f"({result['downloads_per_second']:.1f}/s, "
+        f"{result['bytes_per_second'] / 1024:.1f} KiB/s)\n"
+        f"download latency p50={latency['p50'] * 1000:.1f}ms "
+        f"p95={latency['p95'] * 1000:.1f}ms p99={latency['p99'] * 1000:.1f}ms "
+        f"max={latency['max'] * 1000:.1f}ms\n"
+        f"download window: {result['download_window']}\n"
+        f"server responses: {result['server']}"
+    )
+
+    output = args.output or RESULTS_DIR / "e2e.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(
+        orjson.dumps(
+            {
+                "created": datetime.now(UTC).isoformat(),
+                "python": platform.python_version(),
+                "config": asdict(config),
+                "result": result,
+            },
+            option=orjson.OPT_INDENT_2,
+        )
+    )
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Micro-benchmark for the model classes over the full local dataset.
+
+Measures the load time (JSON parse + dataclass construction), the cost of
+`sanitized_name` access and the memory held by the constructed objects.
+
+Usage:
+    uv run benchmarks/bench_models.py [--repeat N]
+"""
+
+import argparse
+import gc
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import orjson
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from models import BaseData, CraftEssenceData, ServantData  # noqa: E402
+
+DATASETS: list[tuple[str, Path, type[BaseData]]] = [
+    ("servant", ROOT / "data" / "local-servant", ServantData),
+    ("ce", ROOT / "data" / "local-ce", CraftEssenceData),
+]
+
+
+def _read_raw(path: Path) -> bytes:
+    """Read the local data as a single JSON array, sharded or not."""
+    if path.is_dir():
+        items = []
+        for shard_path in sorted(path.glob("*.json")):
+            items.extend(orjson.loads(shard_path.read_bytes()))
+        return orjson.dumps(items)
+
+    return path.with_suffix(".json").read_bytes()
+
+
+def _build(raw_data: list[dict], class_type: type[BaseData]) -> list[BaseData]:
+    # Mirrors `store.LocalDataStore.get`, older revisions have no `from_dict`
+    from_dict = getattr(class_type, "from_dict", None)
+    if from_dict is None:
+        return [class_type(**item) for item in raw_data]
+    return [from_dict(item) for item in raw_data]
+
+
+def _time(func, repeat: int) -> tuple[float, float]:
+    samples: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), min(samples)
+
+
+def bench_dataset(name: str, path: Path, class_type: type[BaseData], repeat: int):
+    if not path.exists() and not path.with_suffix(".json").exists():
+        print(f"{name:<8} skipped, {path} does not exist")
+        return
+
+    raw_bytes = _read_raw(path)
+    raw_data = orjson.loads(raw_bytes)
+
+    load_median, load_min = _time(
+        lambda: _build(orjson.loads(raw_bytes), class_type), repeat
+    )
+
+    items = _build(raw_data, class_type)
+
+    def _access():
+        # `_process_generic_data` reads the name several times per entity
+        for _ in range(4):
+            for item in items:
+                _ = item.sanitized_name
+
+    access_median, access_min = _time(_access, repeat)
+
+    gc.collect()
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    kept = _build(raw_data, class_type)
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    memory = sum(
+        stat.size_diff
+        for stat in snapshot_after.compare_to(snapshot_before, "filename")
+    )
+    del kept
+
+    print(
+        f"{name:<8} entities={len(items):>5} "
+        f"load={load_median * 1000:8.2f}ms (min {load_min * 1000:.2f}ms) "
+        f"sanitized_name x4={access_median * 1000:7.2f}ms "
+        f"(min {access_min * 1000:.2f}ms) "
+        f"memory={memory / 1024:9.1f}KiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, path, class_type in DATASETS:
+        bench_dataset(name, path, class_type, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Benchmark suite over synthetic datasets at production scale, see `fixtures`.
+
+Covers the export preprocessing, the local data store, the model
+construction and the image pipeline. The results are saved as JSON keyed by
+the benchmark name, so the runs of two commits can be compared.
+
+Usage:
+    uv run benchmarks/bench_suite.py [--repeat N] [--sample N]
+    uv run benchmarks/bench_suite.py --compare benchmarks/results/<commit>.json
+"""
+
+import argparse
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from pathlib import Path
+
+import anyio
+import orjson
+from loguru import logger
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import fixtures  # noqa: E402
+
+from image import (  # noqa: E402
+    _process_servant_images,
+    _read_images,
+    create_support_ce_img,
+)
+from models import BaseData, CraftEssenceData, ServantData  # noqa: E402
+from preprocess import (  # noqa: E402
+    _fetch_local_data,
+    _preprocess_ce,
+    _preprocess_servant,
+)
+from store import LocalDataStore  # noqa: E402
+
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+# Relative slowdown of the fastest run reported as a regression, the
+# fastest run is less sensitive to noise from the machine than the median
+REGRESSION_THRESHOLD = 0.10
+
+
+async def _time(
+    func: Callable[[], Awaitable[None] | None], repeat: int
+) -> tuple[float, float]:
+    # One untimed run, so the first sample does not pay for the warm-up
+    result = func()
+    if result is not None:
+        await result
+
+    samples: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        if result is not None:
+            await result
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), min(samples)
+
+
+async def _collect[T](iterator) -> list[T]:
+    return [item async for item in iterator]
+
+
+class Suite:
+    def __init__(self, repeat: int, sample: int, work_dir: Path):
+        self.repeat = repeat
+        self.sample = sample
+        self.work_dir = work_dir
+        self.results: dict[str, dict] = {}
+
+    async def bench(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[None] | None],
+        items: int,
+        repeat: int | None = None,
+    ):
+        repeat = repeat or self.repeat
+        median, minimum = await _time(func, repeat)
+        self.results[name] = {
+            "median": median,
+            "min": minimum,
+            "repeat": repeat,
+            "items": items,
+        }
+        print(
+            f"{name:<28} items={items:>5} "
+            f"median={median * 1000:9.2f}ms min={minimum * 1000:9.2f}ms "
+            f"per item={median / items * 1e6:9.1f}us"
+        )
+
+    async def run(self):
+        servant_export = fixtures.servant_export()
+        ce_export = fixtures.ce_export()
+
+        await self.bench(
+            "preprocess_servant",
+            lambda: _collect(_preprocess_servant(servant_export)),
+            len(servant_export),
+        )
+        await self.bench(
+            "preprocess_ce",
+            lambda: _collect(_preprocess_ce(ce_export)),
+            len(ce_export),
+        )
+
+        servants: list[ServantData] = await _collect(
+            _preprocess_servant(servant_export)
+        )
+        ces: list[CraftEssenceData] = await _collect(_preprocess_ce(ce_export))
+
+        await self._bench_models("servant", servants, ServantData)
+        await self._bench_models("ce", ces, CraftEssenceData)
+
+        await self._bench_local_data("servant", servants, ServantData)
+        await self._bench_local_data("ce", ces, CraftEssenceData)
+
+        await self._bench_images(servants)
+
+    async def _bench_models[T: BaseData](
+        self, name: str, items: list[T], class_type: type[T]
+    ):
+        records: list[dict] = orjson.loads(orjson.dumps(items))
+
+        def _build():
+            for record in records:
+                class_type.from_dict(record)
+
+        await self.bench(f"base_data_{name}", _build, len(records))
+
+    async def _bench_local_data[T: BaseData](
+        self, name: str, items: list[T], class_type: type[T]
+    ):
+        root = self.work_dir / f"local-{name}"
+        store = LocalDataStore(name=name, root=root, class_type=class_type)
+        for item in items:
+            await store.put(item)
+        await store.flush()
+
+        async def _load():
+            local_data = await _fetch_local_data(name, root, class_type)
+            for idx in await local_data.indices():
+                await local_data.get(idx)
+
+        await self.bench(f"fetch_local_data_{name}", _load, len(items))
+
+    async def _bench_images(self, servants: list[ServantData]):
+        # An evenly spread sample keeps the distribution of face counts
+        step = max(len(servants) // self.sample, 1)
+        sample = servants[::step][: self.sample]
+        face_counts = [len(servant.assets) for servant in sample]
+
+        servant_dirs: list[Path] = []
+        for servant in sample:
+            directory = self.work_dir / "servant" / f"{servant.idx:04d}"
+            fixtures.write_faces(directory, len(servant.assets), seed=servant.idx)
+            servant_dirs.append(directory)
+
+        ce_dirs: list[Path] = []
+        for i in range(self.sample):
+            directory = self.work_dir / "ce" / f"{i:04d}"
+            fixtures.write_faces(directory, 1, seed=10000 + i)
+            ce_dirs.append(directory)
+
+        # Image benchmarks are slower, fewer repeats keep the suite short
+        repeat = max(self.repeat // 4, 3)
+        total_faces = sum(face_counts)
+
+        def _read():
+            for directory in servant_dirs:
+                _read_images(directory)
+
+        await self.bench("read_images", _read, total_faces, repeat)
+
+        decoded = [_read_images(directory) for directory in servant_dirs]
+
+        def _process():
+            for images in decoded:
+                _process_servant_images(images)
+
+        await self.bench("process_servant_images", _process, total_faces, repeat)
+
+        output_dir = self.work_dir / "output"
+
+        def _create_ce():
+            for directory in ce_dirs:
+                create_support_ce_img(
+                    directory,
+                    output_dir / directory.name / "ce.png",
+                    output_dir / f"{directory.name}-color" / "ce.png",
+                )
+
+        await self.bench("create_support_ce_img", _create_ce, len(ce_dirs), repeat)
+
+
+def _commit() -> str:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return result.stdout.strip()
+
+
+def compare(results: dict[str, dict], baseline_path: Path, threshold: float) -> bool:
+    """
+    Print the change of every benchmark against a baseline.
+
+    Returns:
+        bool: True if any benchmark regressed by more than the threshold.
+    """
+    baseline = orjson.loads(baseline_path.read_bytes())
+    print(f"\nCompared to {baseline.get('commit', baseline_path.stem)}:")
+
+    regressed = False
+    for name, entry in results.items():
+        base_entry = baseline["results"].get(name)
+        if base_entry is None:
+            print(f"{name:<28} new")
+            continue
+
+        change = entry["min"] / base_entry["min"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:<28} {change:+7.1%}{flag}")
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=30,
+        help="Servants and CEs rendered in the image benchmarks.",
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    # The pipeline logs every entity, which would dominate the timings
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        suite = Suite(args.repeat, args.sample, Path(work_dir))
+        anyio.run(suite.run)
+
+    commit = _commit()
+    output = args.output or RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(
+        orjson.dumps(
+            {
+                "commit": commit,
+                "created": datetime.now(UTC).isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": suite.results,
+            },
+            option=orjson.OPT_INDENT_2,
+        )
+    )
+    print(f"\nResults written to {output}")
+
+    if args.compare is not None and compare(
+        suite.results, args.compare, args.threshold
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
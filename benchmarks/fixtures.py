@@ -0,0 +1,163 @@
+"""
+Synthetic datasets at production scale for the benchmarks.
+
+Everything is generated from a fixed seed, so every commit is benchmarked on
+the same data.
+"""
+
+import random
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+SEED = 20240601
+
+SERVANT_COUNT = 450
+SERVANT_MAX_FACES = 25
+CE_COUNT = 2500
+
+# Size of the face and CE images served by Atlas
+FACE_SIZE = 256
+
+CLASS_NAMES = [
+    "saber",
+    "archer",
+    "lancer",
+    "rider",
+    "caster",
+    "assassin",
+    "berserker",
+    "ruler",
+    "avenger",
+    "alterego",
+    "mooncancer",
+    "foreigner",
+    "pretender",
+]
+
+NAME_PARTS = [
+    "Artoria",
+    "Gilgamesh",
+    "Cú Chulainn",
+    "Medusa",
+    "Jeanne d'Arc",
+    "Scáthach",
+    "Nero Claudius",
+    "Okita Sōji",
+    "Ishtar",
+    "Mash Kyrielight",
+    "Tamamo-no-Mae",
+    "Sei Shōnagon",
+]
+
+NAME_SUFFIXES = ["", " (Alter)", " (Lily)", " (Santa)", " [Summer]", ": Ver. 2"]
+
+URL = "https://static.atlasacademy.io/JP/Faces"
+
+
+def _name(rng: random.Random) -> str:
+    return rng.choice(NAME_PARTS) + rng.choice(NAME_SUFFIXES)
+
+
+def servant_export(
+    count: int = SERVANT_COUNT, seed: int = SEED, base_url: str = URL
+) -> list[dict]:
+    """
+    Generate a servant export in the Atlas format, with 1 to
+    `SERVANT_MAX_FACES` faces per servant and duplicate names.
+    """
+    rng = random.Random(seed)
+    export: list[dict] = []
+    for collection_no in range(1, count + 1):
+        face_count = rng.randint(1, SERVANT_MAX_FACES)
+        ascensions = min(face_count, 4)
+        faces = {
+            "ascension": {
+                str(i + 1): f"{base_url}/f_{collection_no}_{i}.png"
+                for i in range(ascensions)
+            },
+            "costume": {
+                str(collection_no * 100 + i): f"{base_url}/c_{collection_no}_{i}.png"
+                for i in range(face_count - ascensions)
+            },
+        }
+        export.append(
+            {
+                "id": 100000 + collection_no,
+                "collectionNo": collection_no,
+                "name": _name(rng),
+                "type": rng.choice(["normal", "normal", "normal", "heroine"]),
+                "gender": rng.choice(["male", "female"]),
+                "className": rng.choice(CLASS_NAMES),
+                "rarity": rng.randint(0, 5),
+                "extraAssets": {"faces": faces},
+            }
+        )
+
+    # Enemy-only entries are in the export but skipped by the preprocessing
+    export.append({"collectionNo": 0, "name": "Enemy", "type": "enemy"})
+    rng.shuffle(export)
+    return export
+
+
+def ce_export(
+    count: int = CE_COUNT, seed: int = SEED, base_url: str = URL
+) -> list[dict]:
+    """Generate a craft essence export in the Atlas format."""
+    rng = random.Random(seed + 1)
+    export: list[dict] = []
+    for collection_no in range(1, count + 1):
+        export.append(
+            {
+                "id": 9400000 + collection_no,
+                "collectionNo": collection_no,
+                "name": f"{_name(rng)} {collection_no}",
+                "rarity": rng.randint(1, 5),
+                "extraAssets": {
+                    "equipFace": {
+                        "equip": {
+                            str(9400000 + collection_no): (
+                                f"{base_url}/e_{collection_no}.png"
+                            )
+                        }
+                    }
+                },
+            }
+        )
+    rng.shuffle(export)
+    return export
+
+
+def face_image(rng: np.random.Generator) -> np.ndarray:
+    """
+    Generate a face image, smooth shapes over noise so the PNG compresses
+    like a real face rather than like pure noise.
+    """
+    image = rng.integers(0, 64, (FACE_SIZE, FACE_SIZE, 3), dtype=np.uint8)
+    for _ in range(12):
+        center = tuple(int(x) for x in rng.integers(0, FACE_SIZE, 2))
+        radius = int(rng.integers(8, FACE_SIZE // 3))
+        color = tuple(int(x) for x in rng.integers(0, 256, 3))
+        cv2.circle(image, center, radius, color, thickness=-1)
+    return cv2.GaussianBlur(image, (5, 5), 0)
+
+
+def write_faces(directory: Path, count: int, seed: int = SEED) -> list[Path]:
+    """Write `count` face images into a directory."""
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths: list[Path] = []
+    for i in range(count):
+        path = directory / f"face_{i:02d}.png"
+        cv2.imwrite(str(path), face_image(rng))
+        paths.append(path)
+    return paths
+
+
+def face_png(seed: int) -> bytes:
+    """Generate an encoded face image."""
+    ok, buffer = cv2.imencode(".png", face_image(np.random.default_rng(seed)))
+    if not ok:
+        raise RuntimeError("Failed to encode the face image")
+    return buffer.tobytes()
@@ -0,0 +1,267 @@
+"""
+Local stand-in for the Atlas exports and the face/CE image CDN.
+
+Serves the synthetic exports of `fixtures` at `/export/servant.json` and
+`/export/ce.json`, with every asset URL pointing back at the server. The
+latency, bandwidth, error rate, 429 rate and ETag behavior are configurable.
+
+Usage:
+    uv run benchmarks/mock_atlas.py [--port N] [--latency S] [--error-rate R]
+        [--throttle-rate R] [--retry-after S]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fixtures
+import orjson
+
+CHUNK_SIZE = 16 * 1024
+
+
+@dataclass(slots=True)
+class MockConfig:
+    """
+    Behavior of the mock server.
+
+    Attributes:
+        servants (int): The number of servants in the export.
+        ces (int): The number of craft essences in the export.
+        latency (float): The seconds before every response.
+        jitter (float): The maximum random seconds added to the latency.
+        bandwidth (float): The bytes per second of every response, 0 for
+            unlimited.
+        error_rate (float): The fraction of asset requests answered with 500.
+        throttle_rate (float): The fraction of asset requests answered with
+            429 and `Retry-After`.
+        retry_after (int): The `Retry-After` seconds of the 429 responses.
+        etag (bool): Send ETags and answer `If-None-Match` with 304.
+        seed (int): The seed of the data and of the random failures.
+    """
+
+    servants: int = fixtures.SERVANT_COUNT
+    ces: int = fixtures.CE_COUNT
+    latency: float = 0.0
+    jitter: float = 0.0
+    bandwidth: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: int = 1
+    etag: bool = True
+    seed: int = fixtures.SEED
+
+
+class MockAtlas:
+    """
+    The mock server, run in a background thread.
+
+    Attributes:
+        config (MockConfig): The behavior of the server.
+        stats (Counter[str]): The responses served, by status and kind.
+        latencies (list[float]): The seconds spent on every asset response.
+    """
+
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 0):
+        self.config = config
+        self.stats: Counter[str] = Counter()
+        self.latencies: list[float] = []
+
+        self._lock = threading.Lock()
+        self._random = random.Random(config.seed)
+        self._images: dict[str, bytes] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+        self._exports = {
+            "/export/servant.json": orjson.dumps(
+                fixtures.servant_export(
+                    config.servants, config.seed, f"{self.url}/assets"
+                )
+            ),
+            "/export/ce.json": orjson.dumps(
+                fixtures.ce_export(config.ces, config.seed, f"{self.url}/assets")
+            ),
+        }
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mock-atlas", daemon=True
+        )
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockAtlas":
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def _image(self, path: str) -> bytes:
+        with self._lock:
+            image = self._images.get(path)
+        if image is None:
+            image = fixtures.face_png(zlib.crc32(path.encode()))
+            with self._lock:
+                self._images[path] = image
+        return image
+
+    def _failure(self) -> int | None:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.config.throttle_rate:
+            return 429
+        if roll < self.config.throttle_rate + self.config.error_rate:
+            return 500
+        return None
+
+    def _delay(self):
+        delay = self.config.latency
+        if self.config.jitter:
+            with self._lock:
+                delay += self._random.uniform(0, self.config.jitter)
+        if delay:
+            time.sleep(delay)
+
+    def _record(self, key: str, seconds: float | None = None):
+        with self._lock:
+            self.stats[key] += 1
+            if seconds is not None:
+                self.latencies.append(seconds)
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._respond()
+
+            def do_HEAD(self):
+                self._respond(head=True)
+
+            def _respond(self, head: bool = False):
+                start = time.perf_counter()
+                server._delay()
+
+                if self.path in server._exports:
+                    kind = "export"
+                    body = server._exports[self.path]
+                    content_type = "application/json"
+                elif self.path.startswith("/assets/") and self.path.endswith(".png"):
+                    kind = "asset"
+                    failure = server._failure()
+                    if failure is not None:
+                        self._send_error(failure)
+                        server._record(f"asset_{failure}")
+                        return
+                    body = server._image(self.path)
+                    content_type = "image/png"
+                else:
+                    self._send_error(404)
+                    server._record("404")
+                    return
+
+                etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+                if server.config.etag and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    server._record(f"{kind}_304")
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if server.config.etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                if head:
+                    server._record(f"{kind}_head")
+                    return
+                self._write(body)
+
+                server._record(
+                    f"{kind}_200",
+                    time.perf_counter() - start if kind == "asset" else None,
+                )
+
+            def _write(self, body: bytes):
+                bandwidth = server.config.bandwidth
+                for offset in range(0, len(body), CHUNK_SIZE):
+                    chunk = body[offset : offset + CHUNK_SIZE]
+                    self.wfile.write(chunk)
+                    if bandwidth:
+                        time.sleep(len(chunk) / bandwidth)
+
+            def _send_error(self, status: int):
+                body = f"{status}".encode()
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", str(server.config.retry_after))
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--servants", type=int, default=fixtures.SERVANT_COUNT)
+    parser.add_argument("--ces", type=int, default=fixtures.CE_COUNT)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--no-etag", action="store_true")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        servants=args.servants,
+        ces=args.ces,
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        etag=not args.no_etag,
+    )
+    with MockAtlas(config, port=args.port) as server:
+        print(f"SERVANT_URL={server.url}/export/servant.json")
+        print(f"CE_URL={server.url}/export/ce.json")
+        with contextlib.suppress(KeyboardInterrupt):
+            threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+import numpy as np
+from anyio import to_thread
+from loguru import logger
+
+from enums import SupportKind
+from layout import layout
+from manifest import digest, manifest
+from metrics import Stage, metrics
+from region import REGIONS
+
+# The grayscale image of every entity, the one the app matches against
+IMAGE_FILENAMES = {
+    SupportKind.SERVANT: "support.png",
+    SupportKind.CRAFT_ESSENCE: "ce.png",
+}
+
+MAGIC = b"FGABNDL\x00"
+
+VERSION = 1
+
+# Magic, version, entry size and entry count, padded to 32 bytes
+HEADER = struct.Struct("<8sIII12x")
+
+# Index, height, width, offset of the plane from the start of the file and
+# the hash of the image the plane was decoded from, 32 bytes
+ENTRY = struct.Struct("<IHHQ16s")
+
+# Every plane starts on a cache line
+ALIGNMENT = 64
+
+# Entities per bundle, so a changed image only rewrites its shard in the
+# repository. A servant image is 157x50 and a CE image 150x68, about 8 and
+# 10 KB, so a shard is about 0.8 and 1 MB, the ~1.9k servants and ~2.5k CEs
+# about 40 MB in all
+SHARD_SIZE = 100
+
+
+class BundleError(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class BundleEntry:
+    """
+    The plane of an entity in a bundle.
+
+    Attributes:
+        idx (int): The index of the entity.
+        height (int): The rows of the plane.
+        width (int): The columns of the plane.
+        offset (int): The offset of the plane from the start of the file.
+        digest (bytes): The build manifest hash of the image, see
+            `manifest.digest`.
+    """
+
+    idx: int
+    height: int
+    width: int
+    offset: int
+    digest: bytes
+
+    @property
+    def size(self) -> int:
+        return self.height * self.width
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class SupportBundle:
+    """
+    The grayscale images of a shard of `SHARD_SIZE` entities packed into
+    one memory-mappable file, so a consumer can load every template of a
+    kind from a few files without opening and decoding a PNG per entity,
+    see `open_bundles`.
+
+    The layout, little-endian:
+
+    - the header, see `HEADER`
+    - one entry per entity sorted by index, see `ENTRY`
+    - the planes, raw row-major uint8, each aligned to `ALIGNMENT`
+
+    The images are read-only views of the memory map, they have to be
+    dropped before the bundle is closed.
+
+    Attributes:
+        path (Path): The path to the bundle.
+        entries (dict[int, BundleEntry]): The planes by index.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise BundleError(f"{path.name} is empty") from e
+
+        try:
+            self.entries = self._read_entries()
+        except BundleError:
+            self._map.close()
+            raise
+
+    def _read_entries(self) -> dict[int, BundleEntry]:
+        if len(self._map) < HEADER.size:
+            raise BundleError(f"{self.path.name} is truncated")
+
+        magic, version, entry_size, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise BundleError(f"{self.path.name} is not a support bundle")
+        if version != VERSION or entry_size != ENTRY.size:
+            raise BundleError(f"{self.path.name} has unsupported version {version}")
+
+        end = HEADER.size + count * ENTRY.size
+        if end > len(self._map):
+            raise BundleError(f"{self.path.name} is truncated")
+
+        entries: dict[int, BundleEntry] = {}
+        for values in ENTRY.iter_unpack(self._map[HEADER.size : end]):
+            entry = BundleEntry(*values)
+            if entry.offset + entry.size > len(self._map):
+                raise BundleError(f"{self.path.name} is truncated at {entry.idx}")
+            entries[entry.idx] = entry
+        return entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, idx: int) -> bool:
+        return idx in self.entries
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.entries)
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        """Get the image of an entity, without copying it."""
+        entry = self.entries[idx]
+        return np.frombuffer(
+            self._map, dtype=np.uint8, count=entry.size, offset=entry.offset
+        ).reshape(entry.height, entry.width)
+
+    def plane(self, idx: int) -> bytes:
+        """Get a copy of the raw plane of an entity."""
+        entry = self.entries[idx]
+        return self._map[entry.offset : entry.offset + entry.size]
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _list_images(source_dir: Path, filename: str) -> dict[int, Path]:
+    if not source_dir.exists():
+        return {}
+
+    images: dict[int, Path] = {}
+    for directory in os.scandir(source_dir):
+        if directory.is_dir() and directory.name.isdigit():
+            image_path = Path(directory.path) / filename
+            if image_path.exists():
+                images[int(directory.name)] = image_path
+    return images
+
+
+def _image_digest(image_path: Path) -> bytes:
+    """Get the hash of an image, from the build manifest if recorded."""
+    key = manifest.key_for(image_path)
+    value = None if key is None else manifest.get(key)
+    if value is None:
+        value = digest(image_path.read_bytes())
+    return bytes.fromhex(value)
+
+
+def _open_previous(path: Path) -> SupportBundle | None:
+    if not path.exists():
+        return None
+    try:
+        return SupportBundle(path)
+    except BundleError as e:
+        logger.warning(f"Rebuilding the invalid bundle: {e}")
+        return None
+
+
+def _build_shard(
+    images: dict[int, Path], digests: dict[int, bytes], path: Path
+) -> int | None:
+    """
+    Pack the images of a shard into its bundle, copying the unchanged
+    planes from the previous bundle.
+
+    Returns:
+        int | None: The number of decoded images, None if the bundle was
+            left as is.
+    """
+    previous = _open_previous(path)
+    temp_path = path.with_name(f"{path.name}.part")
+    decoded = 0
+    try:
+        if previous is not None and digests == {
+            idx: entry.digest for idx, entry in previous.entries.items()
+        }:
+            return None
+
+        entries: list[BundleEntry] = []
+        with open(layout.ensure_parent(temp_path), "wb") as f:
+            # The planes are written first, the table once their shapes are
+            # known
+            offset = _align(HEADER.size + len(images) * ENTRY.size)
+            for idx in sorted(images):
+                reused = None if previous is None else previous.entries.get(idx)
+                if (
+                    previous is not None
+                    and reused is not None
+                    and reused.digest == digests[idx]
+                ):
+                    height, width = reused.height, reused.width
+                    plane = previous.plane(idx)
+                else:
+                    image = cv2.imdecode(
+                        np.fromfile(images[idx], dtype=np.uint8), cv2.IMREAD_GRAYSCALE
+                    )
+                    if image is None:
+                        logger.warning(f"Leaving out unreadable image: {images[idx]}")
+                        continue
+                    height, width = image.shape
+                    plane = image.tobytes()
+                    decoded += 1
+
+                f.seek(offset)
+                f.write(plane)
+                entries.append(BundleEntry(idx, height, width, offset, digests[idx]))
+                offset = _align(offset + len(plane))
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, ENTRY.size, len(entries)))
+            for entry in entries:
+                f.write(
+                    ENTRY.pack(
+                        entry.idx, entry.height, entry.width, entry.offset, entry.digest
+                    )
+                )
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if previous is not None:
+            previous.close()
+
+    # Replaced once written, so readers never see a partial bundle
+    temp_path.replace(path)
+    return decoded
+
+
+def shard_path(bundle_dir: Path, idx: int) -> Path:
+    """Get the bundle an entity is packed into, e.g. `012.bundle`."""
+    return bundle_dir / f"{idx // SHARD_SIZE:03d}.bundle"
+
+
+def build_bundles(source_dir: Path, filename: str, bundle_dir: Path) -> int | None:
+    """
+    Pack the grayscale images of a kind into bundles of `SHARD_SIZE`
+    entities each.
+
+    Only the bundles of the shards with a new, changed or removed image are
+    rewritten, and in them only the new and changed images are decoded.
+
+    Args:
+        source_dir (Path): The directory of the entity directories.
+        filename (str): The name of the image in every entity directory.
+        bundle_dir (Path): The directory of the bundles.
+
+    Returns:
+        int | None: The number of decoded images, None if every bundle was
+            left as is.
+    """
+    shards: dict[Path, dict[int, Path]] = {}
+    for idx, image_path in _list_images(source_dir, filename).items():
+        shards.setdefault(shard_path(bundle_dir, idx), {})[idx] = image_path
+
+    decoded: int | None = None
+    for path, images in sorted(shards.items()):
+        digests = {idx: _image_digest(image_path) for idx, image_path in images.items()}
+        shard_decoded = _build_shard(images, digests, path)
+        if shard_decoded is not None:
+            decoded = (decoded or 0) + shard_decoded
+
+    # The shards without any entity left
+    if bundle_dir.exists():
+        for path in bundle_dir.glob("*.bundle"):
+            if path not in shards:
+                path.unlink()
+                decoded = decoded or 0
+    return decoded
+
+
+def open_bundles(bundle_dir: Path) -> list[SupportBundle]:
+    """Open every bundle of a kind, in index order."""
+    return [SupportBundle(path) for path in sorted(bundle_dir.glob("*.bundle"))]
+
+
+async def write_bundles():
+    """Update the bundles of every kind of every region in the repository."""
+    for region in REGIONS:
+        for kind in SupportKind:
+            try:
+                with metrics.time(Stage.BUNDLE):
+                    decoded = await to_thread.run_sync(
+                        build_bundles,
+                        region.repo_dir(kind),
+                        IMAGE_FILENAMES[kind],
+                        region.bundle_dir(kind),
+                    )
+            except OSError as e:
+                logger.error(f"Error writing the {region.key(kind)} bundles: {e}")
+                continue
+
+            if decoded is not None:
+                logger.info(
+                    f"Updated the {region.key(kind)} bundles, {decoded} images decoded."
+                )
@@ -0,0 +1,374 @@
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from anyio import to_thread
+from loguru import logger
+
+import utils
+from constants import CACHE_INDEX_FILE
+from enums import SupportKind
+from layout import layout
+from pack import asset_pack, packed
+from region import REGIONS
+from store import LocalDataStore
+
+# Upper bound of the asset cache, the least recently used entities above it
+# are evicted at the end of a run
+CACHE_MAX_BYTES = int(os.getenv("FGA_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+# Number of runs the hit rates are kept for
+RUN_HISTORY = 20
+
+# One cache for every region, e.g. `servant` and `na/servant`
+CACHE_ROOTS = {
+    region.key(kind): region.temp_dir(kind)
+    for region in REGIONS
+    for kind in SupportKind
+}
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    """
+    The cached assets of a single entity.
+
+    Attributes:
+        size (int): The bytes of the cached assets.
+        last_used (float): The time the assets were last used, in seconds
+            since the epoch.
+    """
+
+    size: int
+    last_used: float
+
+
+@dataclass(slots=True)
+class CacheCounters:
+    """
+    The asset lookups of a run for a kind.
+
+    Attributes:
+        hits (int): The assets found in the cache.
+        misses (int): The assets that had to be downloaded.
+        hit_bytes (int): The bytes found in the cache.
+        miss_bytes (int): The bytes downloaded.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    hit_bytes: int = 0
+    miss_bytes: int = 0
+
+
+def _list_files(directory: Path) -> dict[str, int]:
+    """Get the names and sizes of the cached files of an entity."""
+    entry = packed(directory)
+    if entry is not None:
+        pack, key = entry
+        return pack.listdir(key)
+
+    if not directory.exists():
+        return {}
+    return {
+        file.name: file.stat().st_size
+        for file in os.scandir(directory)
+        if file.is_file()
+    }
+
+
+def _list_entities(root: Path) -> dict[str, float]:
+    """Get the names and modification times of the cached entities."""
+    entry = packed(root)
+    if entry is not None:
+        pack, key = entry
+        mtime = pack.path.stat().st_mtime if pack.path.exists() else time.time()
+        return {name: mtime for name in pack.subdirectories(key)}
+
+    if not root.exists():
+        return {}
+    return {
+        directory.name: directory.stat().st_mtime
+        for directory in os.scandir(root)
+        if directory.is_dir()
+    }
+
+
+def _remove_file(directory: Path, name: str):
+    entry = packed(directory)
+    if entry is not None:
+        pack, key = entry
+        pack.delete(f"{key}/{name}")
+    else:
+        (directory / name).unlink(missing_ok=True)
+
+
+def _directory_size(directory: Path) -> int:
+    return sum(_list_files(directory).values())
+
+
+class AssetCache:
+    """
+    Bookkeeping of the downloaded assets in `tmp/<kind>/<idx>`, and
+    `tmp/<region>/<kind>/<idx>` for the other regions.
+
+    Every entity directory has a last-used time. At the end of a run the
+    assets no longer referenced by the local data are removed, and the least
+    recently used entities are evicted until the cache fits `max_bytes`.
+    The regions share the cap, so the least recently used entities of any
+    region go first.
+
+    Attributes:
+        path (Path): The path to the cache index.
+        roots (dict[str, Path]): The cache directory of every kind of every
+            region, by `Region.key`.
+        max_bytes (int): The size cap of the cache.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        roots: dict[str, Path],
+        max_bytes: int = CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.roots = roots
+        self.max_bytes = max_bytes
+        self._names = {root: name for name, root in roots.items()}
+
+        self.entries: dict[str, CacheEntry] = {}
+        self.runs: list[dict] = []
+        self.counters: dict[SupportKind, CacheCounters] = {}
+
+    def _key(self, root_name: str, directory_name: str) -> str:
+        return f"{root_name}/{directory_name}"
+
+    def _directory(self, key: str) -> Path:
+        root_name, directory_name = key.rsplit("/", 1)
+        return self.roots[root_name] / directory_name
+
+    def record(
+        self,
+        kind: SupportKind,
+        directory: Path,
+        hits: int = 0,
+        misses: int = 0,
+        hit_bytes: int = 0,
+        miss_bytes: int = 0,
+    ):
+        """
+        Record the use of the cached assets of an entity.
+
+        Args:
+            kind (SupportKind): The kind of the entity.
+            directory (Path): The cache directory of the entity.
+            hits (int): The assets found in the cache.
+            misses (int): The assets that had to be downloaded.
+            hit_bytes (int): The bytes found in the cache.
+            miss_bytes (int): The bytes downloaded.
+        """
+        counters = self.counters.setdefault(kind, CacheCounters())
+        counters.hits += hits
+        counters.misses += misses
+        counters.hit_bytes += hit_bytes
+        counters.miss_bytes += miss_bytes
+
+        size = _directory_size(directory)
+        root_name = self._names.get(directory.parent, kind)
+        self.entries[self._key(root_name, directory.name)] = CacheEntry(
+            size=size, last_used=time.time()
+        )
+
+    def scan(self):
+        """
+        Reconcile the index with the directories on disk. Directories
+        cached before the index existed are added with their modification
+        time as the last-used time.
+        """
+        on_disk: set[str] = set()
+        for root_name, root in self.roots.items():
+            for name, mtime in _list_entities(root).items():
+                key = self._key(root_name, name)
+                on_disk.add(key)
+                if key not in self.entries:
+                    self.entries[key] = CacheEntry(
+                        size=_directory_size(root / name), last_used=mtime
+                    )
+
+        for key in set(self.entries) - on_disk:
+            del self.entries[key]
+
+    @property
+    def size(self) -> int:
+        return sum(entry.size for entry in self.entries.values())
+
+    def _remove(self, key: str) -> int:
+        directory = self._directory(key)
+        entry = self.entries.pop(key, None)
+        size = entry.size if entry is not None else _directory_size(directory)
+        packed_entry = packed(directory)
+        if packed_entry is not None:
+            pack, pack_key = packed_entry
+            pack.delete_directory(pack_key)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+            layout.forget(directory)
+        return size
+
+    async def collect(self, root_name: str, local_data: LocalDataStore) -> int:
+        """
+        Remove the cached assets no longer referenced by the local data.
+
+        Args:
+            root_name (str): The cache directory of the local data, e.g.
+                `servant` or `na/servant`.
+            local_data (LocalDataStore): The local data, up to date with the
+                current export.
+
+        Returns:
+            int: The bytes removed.
+        """
+        root = self.roots[root_name]
+        entities = _list_entities(root)
+        if not entities:
+            return 0
+
+        referenced: dict[str, set[str]] = {}
+        for idx in await local_data.indices():
+            entity = await local_data.get(idx)
+            if entity is not None:
+                referenced[f"{idx:04d}"] = {asset.file_name for asset in entity.assets}
+
+        if not referenced:
+            logger.warning(f"No local {root_name} data, skipping the cache cleanup.")
+            return 0
+
+        removed = 0
+        for name in entities:
+            keep = referenced.get(name)
+            if keep is None:
+                removed += self._remove(self._key(root_name, name))
+                continue
+
+            directory = root / name
+            changed = False
+            for file_name, size in _list_files(directory).items():
+                if file_name not in keep:
+                    removed += size
+                    _remove_file(directory, file_name)
+                    changed = True
+
+            key = self._key(root_name, name)
+            if changed and key in self.entries:
+                self.entries[key].size = _directory_size(directory)
+
+        if removed:
+            logger.info(
+                f"Removed {removed / 1024 / 1024:.1f} MiB of unreferenced "
+                f"{root_name} assets."
+            )
+        return removed
+
+    def evict(self) -> list[str]:
+        """
+        Evict the least recently used entities until the cache fits the cap.
+
+        Returns:
+            list[str]: The evicted entities, as `<kind>/<idx>`.
+        """
+        size = self.size
+        if size <= self.max_bytes:
+            return []
+
+        evicted: list[str] = []
+        for key, _ in sorted(self.entries.items(), key=lambda x: x[1].last_used):
+            if size <= self.max_bytes:
+                break
+            size -= self._remove(key)
+            evicted.append(key)
+
+        logger.info(
+            f"Evicted {len(evicted)} entities from the asset cache, "
+            f"{size / 1024 / 1024:.1f} MiB left."
+        )
+        return evicted
+
+    async def maintain(self, stores: dict[str, LocalDataStore]):
+        """
+        Clean up and cap the cache after a full run, then save the index.
+        The asset pack is compacted once most of it is deleted records.
+
+        Args:
+            stores (dict[str, LocalDataStore]): The local data of every kind
+                of every region, by `Region.key`, up to date with the current
+                exports.
+        """
+        self.scan()
+        for root_name, local_data in stores.items():
+            await self.collect(root_name, local_data)
+        self.evict()
+        if asset_pack is not None and asset_pack.dead_bytes > asset_pack.live_bytes:
+            await to_thread.run_sync(asset_pack.compact)
+        await self.save()
+
+    def hit_rates(self) -> dict[str, CacheCounters]:
+        """Sum the lookups of the recorded runs and the current one by kind."""
+        totals: dict[str, CacheCounters] = {}
+        for run in [*self.runs, self._current_run()]:
+            for kind, counters in run.get("kinds", {}).items():
+                total = totals.setdefault(kind, CacheCounters())
+                total.hits += counters["hits"]
+                total.misses += counters["misses"]
+                total.hit_bytes += counters["hit_bytes"]
+                total.miss_bytes += counters["miss_bytes"]
+        return totals
+
+    def _current_run(self) -> dict:
+        return {
+            "time": time.time(),
+            "kinds": {
+                kind.value: asdict(counters) for kind, counters in self.counters.items()
+            },
+        }
+
+    async def load(self):
+        if not self.path.exists():
+            return
+
+        raw_data: dict | None = await utils.read_json(self.path)
+        if raw_data is None:
+            return
+
+        try:
+            self.entries = {
+                key: CacheEntry(**entry)
+                for key, entry in raw_data.get("entries", {}).items()
+            }
+            self.runs = raw_data.get("runs", [])
+        except TypeError as e:
+            logger.warning(f"Ignoring invalid cache index: {e}")
+            self.entries = {}
+            self.runs = []
+
+    async def save(self):
+        runs = self.runs
+        if self.counters:
+            runs = [*runs, self._current_run()][-RUN_HISTORY:]
+
+        await utils.write_json(
+            self.path,
+            {
+                "entries": {key: asdict(entry) for key, entry in self.entries.items()},
+                "runs": runs,
+            },
+            indent=False,
+        )
+        self.runs = runs
+        self.counters = {}
+        if asset_pack is not None:
+            asset_pack.flush()
+
+
+asset_cache = AssetCache(CACHE_INDEX_FILE, CACHE_ROOTS)
@@ -0,0 +1,183 @@
+import time
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+import utils
+from constants import CHANGES_FILE
+from manifest import manifest
+
+# Version of the change feed format, bumped on incompatible changes
+FEED_VERSION = 1
+
+
+@dataclass(slots=True)
+class EntityChange:
+    """
+    An added or changed entity.
+
+    Attributes:
+        idx (int): The index of the entity.
+        name (str): The sanitized name of the entity, as in its `.txt` file.
+        outputs (dict[str, str]): The hash of every output, keyed by its path
+            in the repository, see `manifest.BuildManifest`.
+    """
+
+    idx: int
+    name: str
+    outputs: dict[str, str]
+
+
+@dataclass(slots=True)
+class EntityRename:
+    """
+    A renamed entity, whose `.txt` file changed.
+
+    Attributes:
+        idx (int): The index of the entity.
+        name (str): The new sanitized name.
+        previous_name (str): The sanitized name before the run.
+    """
+
+    idx: int
+    name: str
+    previous_name: str
+
+
+@dataclass(slots=True)
+class KindChanges:
+    """The changes of a run to a kind of a region, by index."""
+
+    added: dict[int, EntityChange] = field(default_factory=dict)
+    changed: dict[int, EntityChange] = field(default_factory=dict)
+    renamed: dict[int, EntityRename] = field(default_factory=dict)
+    removed: set[int] = field(default_factory=set)
+
+    def to_dict(self) -> dict:
+        return {
+            "added": [asdict(self.added[idx]) for idx in sorted(self.added)],
+            "changed": [asdict(self.changed[idx]) for idx in sorted(self.changed)],
+            "renamed": [asdict(self.renamed[idx]) for idx in sorted(self.renamed)],
+            "removed": sorted(self.removed),
+        }
+
+
+def _output_hashes(outputs: Iterable[Path]) -> dict[str, str]:
+    hashes: dict[str, str] = {}
+    for file_path in outputs:
+        key = manifest.key_for(file_path)
+        value = None if key is None else manifest.get(key)
+        if key is not None and value is not None:
+            hashes[key] = value
+    return hashes
+
+
+class ChangeFeed:
+    """
+    The entities added, changed, renamed and removed by a run, written into
+    the repository so downstream jobs can update incrementally instead of
+    processing everything again.
+
+    The feed is only written by a run that changed something, so a run
+    without changes does not touch the repository. Every written feed gets
+    the next `run` number, a consumer that sees a gap missed a run and has
+    to process everything.
+
+    Attributes:
+        path (Path): The path to the feed file.
+        kinds (dict[str, KindChanges]): The changes by `Region.key`, e.g.
+            `servant` or `na/servant`.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.kinds: dict[str, KindChanges] = {}
+
+    def _kind(self, name: str) -> KindChanges:
+        return self.kinds.setdefault(name, KindChanges())
+
+    def add(self, name: str, idx: int, entity_name: str, outputs: Iterable[Path]):
+        """Record a new entity and the hashes of its outputs."""
+        self._kind(name).added[idx] = EntityChange(
+            idx=idx, name=entity_name, outputs=_output_hashes(outputs)
+        )
+
+    def change(self, name: str, idx: int, entity_name: str, outputs: Iterable[Path]):
+        """Record an entity with changed assets and the hashes of its outputs."""
+        kind_changes = self._kind(name)
+        change = EntityChange(
+            idx=idx, name=entity_name, outputs=_output_hashes(outputs)
+        )
+        if idx in kind_changes.added:
+            kind_changes.added[idx] = change
+        else:
+            kind_changes.changed[idx] = change
+
+    def rename(self, name: str, idx: int, entity_name: str, previous_name: str):
+        self._kind(name).renamed[idx] = EntityRename(
+            idx=idx, name=entity_name, previous_name=previous_name
+        )
+
+    def remove(self, name: str, indices: Iterable[int]):
+        indices = set(indices)
+        if not indices:
+            return
+
+        kind_changes = self._kind(name)
+        kind_changes.removed.update(indices)
+        for idx in indices:
+            kind_changes.added.pop(idx, None)
+            kind_changes.changed.pop(idx, None)
+            kind_changes.renamed.pop(idx, None)
+
+    @property
+    def empty(self) -> bool:
+        return not any(
+            kind_changes.added
+            or kind_changes.changed
+            or kind_changes.renamed
+            or kind_changes.removed
+            for kind_changes in self.kinds.values()
+        )
+
+    def reset(self):
+        self.kinds = {}
+
+    async def _previous_run(self) -> int:
+        if not self.path.exists():
+            return 0
+
+        raw_data: dict | None = await utils.read_json(self.path)
+        if not isinstance(raw_data, dict) or not isinstance(raw_data.get("run"), int):
+            logger.warning("Ignoring invalid change feed, restarting the run count.")
+            return 0
+        return raw_data["run"]
+
+    async def save(self):
+        """Write the changes of the run, if any, and start a new one."""
+        if self.empty:
+            logger.info("No changed entities, the change feed is left as is.")
+            self.reset()
+            return
+
+        data = {
+            "version": FEED_VERSION,
+            "run": await self._previous_run() + 1,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "kinds": {name: self.kinds[name].to_dict() for name in sorted(self.kinds)},
+        }
+        await utils.write_json(self.path, data)
+
+        counts = [
+            len(kind_changes.added) + len(kind_changes.changed)
+            for kind_changes in self.kinds.values()
+        ]
+        logger.info(
+            f"Change feed run {data['run']}: {sum(counts)} added or changed entities."
+        )
+        self.reset()
+
+
+change_feed = ChangeFeed(CHANGES_FILE)
@@ -0,0 +1,176 @@
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from anyio import Event
+from loguru import logger
+
+from metrics import metrics
+
+# Window of in-flight asset downloads, shared by every kind
+INITIAL_WINDOW = 4
+MIN_WINDOW = 1
+MAX_WINDOW = 32
+
+# The window grows by this many slots per window of successful downloads
+ADDITIVE_INCREASE = 1.0
+
+# The window is multiplied by this factor on congestion
+MULTIPLICATIVE_DECREASE = 0.5
+
+# A download slower than this multiple of the fastest one signals congestion
+LATENCY_TOLERANCE = 4.0
+
+# Weight of a new sample in the latency moving average
+SMOOTHING = 0.2
+
+
+class Slot:
+    """
+    The outcome of a single request made under a limiter.
+
+    Attributes:
+        start (float): The `perf_counter` time the request started.
+        congested (bool | None): True if the request hit congestion, False
+            if it succeeded, None if it failed for an unrelated reason.
+        nbytes (int): The bytes received.
+    """
+
+    __slots__ = ("start", "congested", "nbytes")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.congested: bool | None = None
+        self.nbytes = 0
+
+    def succeed(self, nbytes: int):
+        self.congested = False
+        self.nbytes = nbytes
+
+    def congest(self):
+        self.congested = True
+
+
+class AdaptiveLimiter:
+    """
+    Limit the number of in-flight requests with an AIMD window, the way TCP
+    congestion control does.
+
+    Every successful request grows the window by `ADDITIVE_INCREASE / window`,
+    so a full window of successes adds one slot. A 429, a server error, a
+    network error or a latency far above the fastest observed one shrinks the
+    window by `MULTIPLICATIVE_DECREASE`, at most once per round trip so a
+    burst of failures from the same window only counts once.
+
+    Attributes:
+        name (str): The name of the limiter, used for logging and metrics.
+        window (float): The current number of allowed in-flight requests.
+        in_flight (int): The number of requests in flight.
+        latency (float | None): The moving average of the request latency.
+        throughput (float | None): The moving average of the bytes per
+            second of a request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: float = INITIAL_WINDOW,
+        minimum: float = MIN_WINDOW,
+        maximum: float = MAX_WINDOW,
+    ):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = initial
+        self.in_flight = 0
+
+        self.min_latency: float | None = None
+        self.latency: float | None = None
+        self.throughput: float | None = None
+        self._last_decrease = 0.0
+        self._waiters: list[Event] = []
+
+        self._publish()
+
+    def _publish(self):
+        metrics.gauge(f"{self.name}_window", self.window)
+
+    async def acquire(self):
+        while self.in_flight >= int(self.window):
+            event = Event()
+            self._waiters.append(event)
+            try:
+                await event.wait()
+            finally:
+                if event in self._waiters:
+                    self._waiters.remove(event)
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        # Wake as many waiters as there are free slots, they check again
+        for _ in range(max(int(self.window) - self.in_flight, 0)):
+            if not self._waiters:
+                break
+            self._waiters.pop(0).set()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Slot]:
+        """
+        Hold a slot of the window for a request, adjusting the window with
+        the outcome recorded on the slot.
+        """
+        await self.acquire()
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            # The window is updated first, so the release wakes as many
+            # waiters as the new window has room for
+            try:
+                if slot.congested is True:
+                    self.on_congestion()
+                elif slot.congested is False:
+                    self.on_success(time.perf_counter() - slot.start, slot.nbytes)
+            finally:
+                self.release()
+
+    def on_success(self, seconds: float, nbytes: int = 0):
+        if self.min_latency is None or seconds < self.min_latency:
+            self.min_latency = seconds
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += (seconds - self.latency) * SMOOTHING
+        if seconds > 0:
+            rate = nbytes / seconds
+            if self.throughput is None:
+                self.throughput = rate
+            else:
+                self.throughput += (rate - self.throughput) * SMOOTHING
+            metrics.gauge(f"{self.name}_bytes_per_second", self.throughput)
+
+        if seconds > self.min_latency * LATENCY_TOLERANCE:
+            self.on_congestion()
+            return
+
+        self.window = min(self.window + ADDITIVE_INCREASE / self.window, self.maximum)
+        self._publish()
+
+    def on_congestion(self):
+        now = time.perf_counter()
+        if now - self._last_decrease < (self.latency or 0.0):
+            return
+
+        self._last_decrease = now
+        previous = self.window
+        self.window = max(self.window * MULTIPLICATIVE_DECREASE, self.minimum)
+        self._publish()
+        if int(previous) != int(self.window):
+            logger.debug(
+                f"{self.name} window {previous:.1f} -> {self.window:.1f} "
+                "after congestion"
+            )
+
+
+download_limiter = AdaptiveLimiter("download")
@@ -1,57 +1,111 @@
+import os
 from pathlib import Path
 
 from enums import SupportKind
 
-ROOT = Path(__file__).parent.parent
+# Overridable to run against a scratch tree, e.g. in the end-to-end benchmark
+ROOT = Path(os.getenv("FGA_ROOT", Path(__file__).parent.parent))
+
+# Directories are created on first write, see `layout.DirectoryLayout`
 
 # Logs
 
 LOGS_DIR = ROOT / "logs"
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
 
 LOG_FILE = LOGS_DIR / "app.log"
 
+# Batched JSON lines of `--json-logs`, see `log.BatchedJsonSink`
+
+LOG_JSON_FILE = LOGS_DIR / "app.jsonl"
+
+# Stage timings of the last run, see `metrics.RunMetrics`
+
+RUN_REPORT_FILE = LOGS_DIR / "run-report.json"
+
+METRICS_FILE = LOGS_DIR / "metrics.prom"
+
+# Sampling profile of the last `--profile` run, see `profiler.SamplingProfiler`
+
+PROFILE_FILE = LOGS_DIR / "profile.collapsed"
+
+PROFILE_SUMMARY_FILE = LOGS_DIR / "profile-summary.txt"
+
 # TMP
 
 TMP_DIR = ROOT / "tmp"
-TMP_DIR.mkdir(exist_ok=True, parents=True)
 
 SERVANT = SupportKind.SERVANT.value
 CE = SupportKind.CRAFT_ESSENCE.value
 
+# Preprocessed export snapshots, keyed by the export hash
+
+SNAPSHOT_DIR = TMP_DIR / "snapshot"
+
+# Journals of the entities completed by an unfinished run, see `journal.Journal`
+
+JOURNAL_DIR = TMP_DIR / "journal"
+
+JOURNAL_SERVANT = JOURNAL_DIR / f"{SERVANT}.jsonl"
+JOURNAL_CE = JOURNAL_DIR / f"{CE}.jsonl"
+
+# Last use of the cached assets of every entity, see `cache.AssetCache`
+
+CACHE_INDEX_FILE = TMP_DIR / "cache.json"
+
+# Packed asset cache of the `pack` backend, see `pack.AssetPack`
+
+ASSET_PACK_FILE = TMP_DIR / "assets.pack"
+
+ASSET_PACK_INDEX_FILE = TMP_DIR / "assets.pack.json"
+
+# Asset URLs that failed permanently, see `negative.NegativeCache`
+
+NEGATIVE_CACHE_FILE = TMP_DIR / "negative.json"
+
+# Assets and renders shared by the regions, see `content.ContentIndex`
+
+CONTENT_INDEX_FILE = TMP_DIR / "content.json"
+
+# Costs observed in previous runs, see `history.RunHistory`
+
+HISTORY_FILE = TMP_DIR / "history.json"
+
 # Process directories
 
 TEMP_SERVANT_DIR = TMP_DIR / SERVANT
-TEMP_SERVANT_DIR.mkdir(exist_ok=True, parents=True)
 
 TEMP_CE_DIR = TMP_DIR / CE
-TEMP_CE_DIR.mkdir(exist_ok=True, parents=True)
 
 OUTPUT_DIR = ROOT / "output"
-OUTPUT_DIR.mkdir(exist_ok=True, parents=True)
 
 OUTPUT_SERVANT_DIR = OUTPUT_DIR / SERVANT
-OUTPUT_SERVANT_DIR.mkdir(exist_ok=True, parents=True)
 
 OUTPUT_SERVANT_COLOR_DIR = OUTPUT_DIR / f"{SERVANT}-color"
-OUTPUT_SERVANT_COLOR_DIR.mkdir(exist_ok=True, parents=True)
 
 OUTPUT_CE_DIR = OUTPUT_DIR / CE
-OUTPUT_CE_DIR.mkdir(exist_ok=True, parents=True)
 
 OUTPUT_CE_COLOR_DIR = OUTPUT_DIR / f"{CE}-color"
-OUTPUT_CE_COLOR_DIR.mkdir(exist_ok=True, parents=True)
 
 # Data directories
 
 DATA_DIR = ROOT / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 REMOTE_CE_DATA = DATA_DIR / f"{CE}.json"
 REMOTE_SERVANT_DATA = DATA_DIR / f"{SERVANT}.json"
 
-LOCAL_CE_DATA = DATA_DIR / f"local-{CE}.json"
-LOCAL_SERVANT_DATA = DATA_DIR / f"local-{SERVANT}.json"
+# Sharded local data, see `store.LocalDataStore`
+LOCAL_CE_DATA = DATA_DIR / f"local-{CE}"
+LOCAL_SERVANT_DATA = DATA_DIR / f"local-{SERVANT}"
+
+# Single-file local data from before sharding, migrated on first load
+LEGACY_LOCAL_CE_DATA = DATA_DIR / f"local-{CE}.json"
+LEGACY_LOCAL_SERVANT_DATA = DATA_DIR / f"local-{SERVANT}.json"
+
+# Local data of the entities processed by a single shard, see `shard.Shard`
+FRAGMENTS_DIR = DATA_DIR / "fragments"
+
+# Hashes of the rendered outputs, see `manifest.BuildManifest`
+MANIFEST_FILE = DATA_DIR / "manifest.json"
 
 # Repository directories
 
@@ -62,3 +116,7 @@ REPO_SERVANT_COLOR_DIR = REPO_DIR_PATH / "servant-color"
 
 REPO_CE_DIR = REPO_DIR_PATH / "ce"
 REPO_CE_COLOR_DIR = REPO_DIR_PATH / "ce-color"
+
+# Entities changed by the last run, for downstream jobs, see `changes.ChangeFeed`
+
+CHANGES_FILE = REPO_DIR_PATH / "changes.json"
@@ -0,0 +1,324 @@
+import hashlib
+import os
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from urllib.parse import urlparse
+
+from anyio import Event, to_thread
+from loguru import logger
+
+import utils
+from constants import CONTENT_INDEX_FILE, TMP_DIR
+from enums import SupportKind
+from layout import layout
+from manifest import digest, manifest
+from pack import packed
+from region import REGIONS
+
+# The region directories of the Atlas asset URLs, e.g. `/JP/Faces/f_100.png`
+ATLAS_REGIONS = {"JP", "NA", "CN", "KR", "TW"}
+
+
+def asset_key(url: str) -> str:
+    """
+    Get the key of an asset URL without its region, e.g.
+    `static.atlasacademy.io/Faces/f_100.png` for the JP and NA URLs of the
+    same face.
+    """
+    parsed = urlparse(url)
+    head, _, rest = parsed.path.lstrip("/").partition("/")
+    path = rest if rest and head.upper() in ATLAS_REGIONS else f"{head}/{rest}"
+    return f"{parsed.netloc}/{path.rstrip('/')}"
+
+
+def read_asset(file_path: Path) -> bytes | None:
+    """Read a cached asset, which may be kept in the asset pack."""
+    entry = packed(file_path)
+    if entry is not None:
+        pack, key = entry
+        data = pack.get(key)
+        return None if data is None else bytes(data)
+
+    try:
+        return file_path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def write_asset(file_path: Path, data: bytes):
+    """Write a cached asset, which may be kept in the asset pack."""
+    entry = packed(file_path)
+    if entry is not None:
+        pack, key = entry
+        pack.put(key, data)
+    else:
+        utils.write_if_changed(layout.ensure_parent(file_path), data)
+
+
+def render_key(kind: SupportKind, source_dir: Path) -> str:
+    """
+    Hash what the outputs of an entity are rendered from: its kind and the
+    names and contents of its assets.
+    """
+    entry = packed(source_dir)
+    if entry is not None:
+        pack, key = entry
+        names = sorted(pack.listdir(key))
+    elif source_dir.exists():
+        names = sorted(file.name for file in os.scandir(source_dir) if file.is_file())
+    else:
+        names = []
+
+    key_hash = hashlib.blake2b(kind.value.encode(), digest_size=16)
+    for name in names:
+        key_hash.update(name.encode())
+        key_hash.update(digest(read_asset(source_dir / name) or b"").encode())
+    return key_hash.hexdigest()
+
+
+class ContentIndex:
+    """
+    The downloads and renders shared by the regions.
+
+    The regions mostly ship the same art under URLs that only differ by the
+    region, while every region keeps the assets of an entity in its own
+    cache directory. The index remembers where every asset was downloaded
+    to by its URL without the region, see `asset_key`, and the digest of its
+    content. Some regions localize art under the same path, so an asset is
+    only copied when the `ETag` and size of its URL match those of the URL
+    it was downloaded from, see `utils.asset_validator`, which costs a
+    `HEAD` request instead of the download. It also remembers the
+    outputs rendered from every set of asset contents, see `render_key`, so
+    an entity with the same art as one rendered before copies the outputs
+    instead of rendering them again. With a single region no outputs can be
+    shared, so the assets are not hashed for it.
+
+    An asset or a render already in progress is waited for instead of
+    repeated, as the regions are processed concurrently.
+
+    Attributes:
+        path (Path): The path to the index file.
+        root (Path): The directory the asset paths are relative to.
+        shared (bool): Whether the outputs can be shared, i.e. several
+            regions are processed.
+    """
+
+    def __init__(self, path: Path, root: Path, shared: bool = True):
+        self.path = path
+        self.root = root
+        self.shared = shared
+
+        # Asset key -> "path" relative to `root`, "url" and "digest" of the
+        # downloaded asset, and the "validator" of its URL once checked
+        self.assets: dict[str, dict[str, str]] = {}
+        # Render key -> output key and digest of every output
+        self.renders: dict[str, list[list[str]]] = {}
+        self.copied = 0
+
+        # Output key -> the render key that produced its current content
+        self._owners: dict[str, str] = {}
+        self._pending: dict[str, Event] = {}
+
+    async def _wait(self, key: str):
+        while (event := self._pending.get(key)) is not None:
+            await event.wait()
+
+    async def _copy(self, key: str, url: str, file_path: Path) -> Path | None:
+        entry = self.assets.get(key)
+        if entry is None:
+            return None
+
+        source = self.root / entry["path"]
+        if source == file_path:
+            return None
+        data = await to_thread.run_sync(read_asset, source)
+        if not data:
+            return None
+
+        data_digest = digest(data)
+        if data_digest != entry["digest"]:
+            # Downloaded again since its URL was checked
+            entry["digest"] = data_digest
+            entry.pop("validator", None)
+        if "validator" not in entry:
+            validator = await utils.asset_validator(entry["url"])
+            if validator is None:
+                return None
+            entry["validator"] = validator
+
+        if await utils.asset_validator(url) != entry["validator"]:
+            logger.debug(f"{file_path.name} differs from {source.parent}.")
+            return None
+
+        await to_thread.run_sync(write_asset, file_path, data)
+        return source
+
+    async def fetch(
+        self,
+        url: str,
+        file_path: Path,
+        download: Callable[[], Awaitable[Path | None]],
+    ) -> Path | None:
+        """
+        Get an asset, copying it from where the same asset was downloaded
+        before, e.g. for another region, instead of downloading it again if
+        the content behind both URLs is the same.
+
+        Args:
+            url (str): The URL of the asset.
+            file_path (Path): The path to save the asset to.
+            download (Callable): Downloads the asset to `file_path`.
+
+        Returns:
+            Path | None: The path to the asset, None on error.
+        """
+        key = asset_key(url)
+        await self._wait(key)
+
+        event = self._pending[key] = Event()
+        try:
+            source = None
+            if not utils.is_downloaded(file_path):
+                source = await self._copy(key, url, file_path)
+            if source is not None:
+                logger.debug(f"Copied {file_path.name} from {source.parent}.")
+                self.copied += 1
+                return file_path
+
+            result = await download()
+            if result is not None and result.is_relative_to(self.root):
+                await self._record_asset(key, url, result)
+        finally:
+            del self._pending[key]
+            event.set()
+        return result
+
+    async def _record_asset(self, key: str, url: str, file_path: Path):
+        relative = file_path.relative_to(self.root).as_posix()
+        entry = self.assets.get(key)
+        # The digest of a known asset is checked when it is copied
+        if entry is not None and entry["path"] == relative:
+            return
+
+        data = await to_thread.run_sync(read_asset, file_path)
+        if data is not None:
+            self.assets[key] = {"path": relative, "url": url, "digest": digest(data)}
+
+    def _copy_outputs(self, key: str, outputs: tuple[Path, ...]) -> bool:
+        recorded = self.renders.get(key)
+        if recorded is None or len(recorded) != len(outputs):
+            return False
+
+        contents: list[bytes] = []
+        for output_key, output_digest in recorded:
+            for root in manifest.roots:
+                try:
+                    data = (root / output_key).read_bytes()
+                except FileNotFoundError:
+                    continue
+                if digest(data) == output_digest:
+                    contents.append(data)
+                    break
+            else:
+                return False
+
+        for file_path, data in zip(outputs, contents, strict=True):
+            manifest.record(file_path, data)
+            utils.write_if_changed(layout.ensure_parent(file_path), data)
+        return True
+
+    def _record_render(self, key: str, outputs: tuple[Path, ...]):
+        recorded: list[list[str]] = []
+        for file_path in outputs:
+            output_key = manifest.key_for(file_path)
+            output_digest = None if output_key is None else manifest.get(output_key)
+            if output_key is None or output_digest is None:
+                return
+            recorded.append([output_key, output_digest])
+
+        for output_key, _ in recorded:
+            previous = self._owners.get(output_key)
+            if previous is not None and previous != key:
+                self.renders.pop(previous, None)
+            self._owners[output_key] = key
+        self.renders[key] = recorded
+
+    async def render(
+        self,
+        kind: SupportKind,
+        source_dir: Path,
+        outputs: tuple[Path, ...],
+        render: Callable[[], None],
+    ) -> bool:
+        """
+        Render the outputs of an entity, or copy the outputs rendered before
+        from the same asset contents.
+
+        Args:
+            kind (SupportKind): The kind of the entity.
+            source_dir (Path): The cache directory of the entity.
+            outputs (tuple[Path, ...]): The output files of the entity.
+            render (Callable[[], None]): Renders the outputs, run in a thread.
+
+        Returns:
+            bool: True if the outputs were rendered, False if copied.
+        """
+        if not self.shared:
+            await to_thread.run_sync(render)
+            return True
+
+        key = await to_thread.run_sync(render_key, kind, source_dir)
+        await self._wait(key)
+
+        event = self._pending[key] = Event()
+        try:
+            if await to_thread.run_sync(self._copy_outputs, key, outputs):
+                return False
+
+            await to_thread.run_sync(render)
+            self._record_render(key, outputs)
+        finally:
+            del self._pending[key]
+            event.set()
+        return True
+
+    async def load(self):
+        if not self.path.exists():
+            return
+
+        raw_data: dict | None = await utils.read_json(self.path)
+        if not isinstance(raw_data, dict):
+            logger.warning("Ignoring invalid content index.")
+            return
+
+        self.assets = {
+            key: entry
+            for key, entry in raw_data.get("assets", {}).items()
+            if isinstance(entry, dict) and {"path", "url", "digest"} <= entry.keys()
+        }
+        self.renders = raw_data.get("renders", {})
+        self._owners = {
+            output_key: key
+            for key, recorded in self.renders.items()
+            for output_key, _ in recorded
+        }
+
+    async def save(self):
+        if self.copied:
+            logger.info(f"Copied {self.copied} assets shared between the regions.")
+            self.copied = 0
+
+        # Assets evicted from the cache can no longer be copied
+        self.assets = await to_thread.run_sync(
+            lambda: {
+                key: entry
+                for key, entry in self.assets.items()
+                if utils.is_downloaded(self.root / entry["path"])
+            }
+        )
+        await utils.write_json(
+            self.path, {"assets": self.assets, "renders": self.renders}, indent=False
+        )
+
+
+content_index = ContentIndex(CONTENT_INDEX_FILE, TMP_DIR, shared=len(REGIONS) > 1)
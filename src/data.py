@@ -1,34 +1,41 @@
-import asyncio
-from collections.abc import Callable
+import math
+import os
+import time
+from collections.abc import AsyncIterable, Callable
+from functools import partial
 from pathlib import Path
 from typing import TypeVar
 
-import cv2
-from anyio import create_task_group, to_thread
+from anyio import Semaphore, create_memory_object_stream, create_task_group
 from loguru import logger
 
-from constants import (
-    LOCAL_CE_DATA,
-    LOCAL_SERVANT_DATA,
-    OUTPUT_CE_COLOR_DIR,
-    OUTPUT_CE_DIR,
-    OUTPUT_SERVANT_COLOR_DIR,
-    OUTPUT_SERVANT_DIR,
-    TEMP_CE_DIR,
-    TEMP_SERVANT_DIR,
-)
+from cache import asset_cache
+from changes import change_feed
+from congestion import download_limiter
+from content import content_index
 from enums import SupportKind
-from image import create_support_ce_img, create_support_servant_img
+from history import history
+from image import create_support_ce_img, create_support_servant_img, read_image
+from journal import Journal
+from layout import layout
+from log import sampler
+from metrics import Stage, metrics
 from models import (
     Assets,
     BaseData,
     CraftEssenceData,
     ServantData,
 )
-from utils import download_file, write_json
+from negative import negative_cache
+from region import PRIMARY_REGION, Region
+from shard import Shard, write_fragment
+from store import LocalDataStore
+from utils import download_file, file_size, is_downloaded
 
 T = TypeVar("T", bound=BaseData)
-type IndexedT = dict[int, BaseData]
+
+# Entities processed at the same time, their downloads are limited separately
+ENTITY_CONCURRENCY = int(os.getenv("FGA_ENTITY_CONCURRENCY", "8"))
 
 
 async def _download_and_confirm_asset(
@@ -41,16 +48,34 @@ async def _download_and_confirm_asset(
     Returns:
         Assets | None: The asset if successful, None otherwise.
     """
-    file_path = await download_file(
+    cached = is_downloaded(download_dir / asset.file_name)
+
+    start = time.perf_counter()
+    # An asset of another region with the same URL is copied instead
+    file_path = await content_index.fetch(
         asset.url,
-        download_dir / f"{asset.key}-{asset.url_file_name}",
+        download_dir / asset.file_name,
+        partial(
+            download_file,
+            asset.url,
+            download_dir / asset.file_name,
+            limiter=download_limiter,
+            negative_cache=negative_cache,
+        ),
     )
     if file_path is None:
         logger.error(f"Failed to download asset: {asset.key}")
         return None
+    if not cached:
+        metrics.record(
+            Stage.DOWNLOAD,
+            time.perf_counter() - start,
+            nbytes=file_size(file_path),
+        )
 
     try:
-        img = cv2.imread(str(file_path))
+        with metrics.time(Stage.VERIFY):
+            img = read_image(file_path)
         if img is None:
             logger.error(f"Failed to read image: {file_path}")
             return None
@@ -69,10 +94,19 @@ async def _download_and_confirm_asset(
 async def download_asset_files(
     assets: list[Assets], download_dir: Path, kind: SupportKind
 ) -> list[Assets]:
-    logger.info(
-        f"{kind.value.upper()} {download_dir.name} - Downloading and verifying files..."
+    logger.log(
+        sampler.level("asset download"),
+        f"{kind.value.upper()} {download_dir.name} - "
+        "Downloading and verifying files...",
     )
 
+    assets = negative_cache.skip(assets)
+    cached = {
+        asset.file_name
+        for asset in assets
+        if is_downloaded(download_dir / asset.file_name)
+    }
+
     results: list[Assets | None] = []
 
     async def _download_task(asset: Assets):
@@ -88,84 +122,173 @@ async def download_asset_files(
 
     valid_assets: list[Assets] = [asset for asset in results if asset is not None]
 
+    hits = misses = hit_bytes = miss_bytes = 0
+    for asset in valid_assets:
+        size = file_size(download_dir / asset.file_name)
+        if asset.file_name in cached:
+            hits += 1
+            hit_bytes += size
+        else:
+            misses += 1
+            miss_bytes += size
+            history.record_download(kind, size)
+
+    asset_cache.record(kind, download_dir, hits, misses, hit_bytes, miss_bytes)
+
     valid_assets = sorted(valid_assets, key=lambda x: x.key)
 
     return valid_assets
 
 
 async def process_servant_data(
-    servant_data: list[ServantData],
-    local_data: IndexedT,
+    servant_data: AsyncIterable[ServantData],
+    local_data: LocalDataStore[ServantData],
     debug: bool = False,
     dry_run: bool = False,
+    shard: Shard | None = None,
+    direct: bool = False,
+    region: Region = PRIMARY_REGION,
 ):
+    kind = SupportKind.SERVANT
+    output_dir = region.repo_dir if direct else region.output_dir
     await _process_generic_data(
         latest_data_list=servant_data,
         local_data=local_data,
-        kind=SupportKind.SERVANT,
-        temp_dir=TEMP_SERVANT_DIR,
-        output_dir_base=OUTPUT_SERVANT_DIR,
-        output_color_dir_base=OUTPUT_SERVANT_COLOR_DIR,
+        kind=kind,
+        temp_dir=region.temp_dir(kind),
+        output_dir_base=output_dir(kind),
+        output_color_dir_base=output_dir(kind, color=True),
         image_creation_func=create_support_servant_img,
         output_image_filename="support.png",
-        local_data_path=LOCAL_SERVANT_DATA,
+        journal_path=region.journal(kind),
+        name=region.key(kind),
         debug=debug,
         dry_run=dry_run,
+        shard=shard,
     )
 
 
 async def process_craft_essence_data(
-    ce_data: list[CraftEssenceData],
-    local_data: IndexedT,
+    ce_data: AsyncIterable[CraftEssenceData],
+    local_data: LocalDataStore[CraftEssenceData],
     debug: bool = False,
     dry_run: bool = False,
+    shard: Shard | None = None,
+    direct: bool = False,
+    region: Region = PRIMARY_REGION,
 ):
+    kind = SupportKind.CRAFT_ESSENCE
+    output_dir = region.repo_dir if direct else region.output_dir
     await _process_generic_data(
         latest_data_list=ce_data,
         local_data=local_data,
-        kind=SupportKind.CRAFT_ESSENCE,
-        temp_dir=TEMP_CE_DIR,
-        output_dir_base=OUTPUT_CE_DIR,
-        output_color_dir_base=OUTPUT_CE_COLOR_DIR,
+        kind=kind,
+        temp_dir=region.temp_dir(kind),
+        output_dir_base=output_dir(kind),
+        output_color_dir_base=output_dir(kind, color=True),
         image_creation_func=create_support_ce_img,
         output_image_filename="ce.png",
-        local_data_path=LOCAL_CE_DATA,
+        journal_path=region.journal(kind),
+        name=region.key(kind),
         debug=debug,
         dry_run=dry_run,
+        shard=shard,
     )
 
 
 async def _process_generic_data(
-    latest_data_list: list[T],
-    local_data: IndexedT,
+    latest_data_list: AsyncIterable[T],
+    local_data: LocalDataStore[T],
     kind: SupportKind,
     temp_dir: Path,
     output_dir_base: Path,
     output_color_dir_base: Path,
     image_creation_func: Callable[[Path, Path, Path], None],
     output_image_filename: str,
-    local_data_path: Path,
+    journal_path: Path,
+    name: str,
     debug: bool = False,
     dry_run: bool = False,
+    shard: Shard | None = None,
 ):
-    logger.info(f"Processing {kind.value} data...")
+    """
+    Process the latest data as it is produced, downloading and creating the
+    images of new or changed entries and updating the local data.
+
+    The latest data is consumed through a memory stream fed by a separate
+    task, so the first downloads overlap with producing the rest. Up to
+    `ENTITY_CONCURRENCY` entities are processed at the same time.
+
+    Every changed entity is recorded in a journal as soon as it is done. The
+    journal of an interrupted run is replayed first, so its entities are not
+    processed again. A replayed entity whose outputs are gone, e.g. after an
+    interrupted CI run whose outputs were not cached, is rendered again.
+
+    With a shard, only the entities owned by the shard are processed and
+    their local data is written to a fragment instead, see `shard.Shard`.
+
+    An entity with the same art as one rendered before, e.g. in another
+    region, gets a copy of its outputs, see `content.ContentIndex`.
+
+    The added, changed, renamed and removed entities are recorded in the
+    change feed, see `changes.ChangeFeed`. The entities of an interrupted
+    run are recorded as changed, whether they were new or not.
+    """
+    logger.info(f"Processing {name} data...")
     debug_index = 0
-    updated_data_list: list[T] = []
+    latest_indices: set[int] = set()
+    shard_items: list[T] = []
+
+    journal: Journal[T] | None = None
+    # Replayed entities whose outputs have to be rendered again
+    stale: set[int] = set()
+    if not debug and not dry_run and shard is None:
+        journal = Journal(name, journal_path)
+        await journal.replay(local_data)
+        for idx in journal.replayed:
+            entity = await local_data.get(idx)
+            if entity is None:
+                continue
+
+            replayed_outputs = (
+                output_dir_base / f"{idx:04d}" / output_image_filename,
+                output_color_dir_base / f"{idx:04d}" / output_image_filename,
+            )
+            if not all(file_path.exists() for file_path in replayed_outputs):
+                stale.add(idx)
+                continue
+            change_feed.change(name, idx, entity.sanitized_name, replayed_outputs)
+
+        if stale:
+            logger.info(
+                f"Rendering {len(stale)} replayed {name} entities again, "
+                "their outputs are missing."
+            )
+
+    send_stream, receive_stream = create_memory_object_stream[T](math.inf)
+    slots = Semaphore(ENTITY_CONCURRENCY)
+
+    async def _produce():
+        async with send_stream:
+            async for latest_data in latest_data_list:
+                await send_stream.send(latest_data)
 
-    for latest_data in latest_data_list:
-        if (debug or dry_run) and debug_index >= 5:
-            updated_data_list.append(latest_data)
-            continue
+    async def _process(latest_data: T):
+        try:
+            await _process_entity(latest_data)
+        finally:
+            slots.release()
 
+    async def _process_entity(latest_data: T):
         directory_name = f"{latest_data.idx:04d}"
         temp_download_dir = temp_dir / directory_name
-        temp_download_dir.mkdir(exist_ok=True, parents=True)
 
         rename_txt_file = False
         new_assets_found = False
 
-        local_entry = local_data.get(latest_data.idx)
+        local_entry = await local_data.get(latest_data.idx)
 
+        diff_start = time.perf_counter()
         if local_entry is None:
             logger.info(
                 f"New {kind.value} data found: {latest_data.idx:04d} {latest_data.name}"
@@ -174,11 +297,16 @@ async def _process_generic_data(
         else:
             if local_entry.sanitized_name != latest_data.sanitized_name:
                 rename_txt_file = True
-            if len(local_entry.assets) != len(latest_data.assets):
+            # Assets known to fail are left out of the local data
+            expected = negative_cache.filter(latest_data.assets)
+            if len(local_entry.assets) != len(expected):
                 logger.info(
                     f"Updating {latest_data.idx:04d} {latest_data.name} assets..."
                 )
                 new_assets_found = True
+            elif latest_data.idx in stale:
+                new_assets_found = True
+        metrics.record(Stage.DIFF, time.perf_counter() - diff_start)
 
         if new_assets_found:
             # Download only if new or assets changed
@@ -191,35 +319,95 @@ async def _process_generic_data(
             latest_data.assets = downloaded_assets
 
         output_dir = output_dir_base / directory_name
-        output_dir.mkdir(exist_ok=True, parents=True)
         output_color_dir = output_color_dir_base / directory_name
-        output_color_dir.mkdir(exist_ok=True, parents=True)
 
         txt_file_path = output_dir / f"{latest_data.sanitized_name}.txt"
         color_txt_file_path = output_color_dir / f"{latest_data.sanitized_name}.txt"
 
         if rename_txt_file or new_assets_found:
+            layout.ensure(output_dir)
+            layout.ensure(output_color_dir)
             txt_file_path.touch(exist_ok=True)
             color_txt_file_path.touch(exist_ok=True)
 
         if new_assets_found:
-            await to_thread.run_sync(
-                image_creation_func,
-                temp_download_dir,
+            render_start = time.perf_counter()
+            outputs = (
                 output_dir / output_image_filename,
                 output_color_dir / output_image_filename,
             )
-            logger.info(
-                f"{kind.value.capitalize()} images created for: "
-                f"{latest_data.idx:04d} {latest_data.sanitized_name}"
+            rendered = await content_index.render(
+                kind,
+                temp_download_dir,
+                outputs,
+                partial(image_creation_func, temp_download_dir, *outputs),
+            )
+            if rendered:
+                history.record_render(kind, time.perf_counter() - render_start)
+            logger.log(
+                sampler.level("render"),
+                f"{kind.value.capitalize()} images "
+                f"{'created' if rendered else 'copied'} for: "
+                f"{latest_data.idx:04d} {latest_data.sanitized_name}",
+            )
+
+            if local_entry is None:
+                change_feed.add(
+                    name, latest_data.idx, latest_data.sanitized_name, outputs
+                )
+            else:
+                change_feed.change(
+                    name, latest_data.idx, latest_data.sanitized_name, outputs
+                )
+
+        if rename_txt_file and local_entry is not None:
+            change_feed.rename(
+                name,
+                latest_data.idx,
+                latest_data.sanitized_name,
+                local_entry.sanitized_name,
             )
-            await asyncio.sleep(0.5)
 
-        updated_data_list.append(latest_data)  # Add processed/updated data
+        # Store processed/updated data, only changed shards are rewritten
+        await local_data.put(latest_data)
+
+        if journal is not None and (rename_txt_file or new_assets_found):
+            await journal.append(latest_data)
+
+        if shard is not None:
+            shard_items.append(latest_data)
+
+    async with create_task_group() as tg, receive_stream:
+        tg.start_soon(_produce)
+
+        async for latest_data in receive_stream:
+            if shard is not None and not shard.owns(latest_data.idx):
+                continue
+
+            latest_indices.add(latest_data.idx)
+
+            if debug or dry_run:
+                if debug_index >= 5:
+                    continue
+                debug_index += 1
+
+            # Wait for a free slot first, so the entities are not all started
+            await slots.acquire()
+            tg.start_soon(_process, latest_data)
+
+    if shard is not None:
+        if not debug and not dry_run and latest_indices:
+            shard_items.sort(key=lambda item: item.idx)
+            await write_fragment(kind, shard, shard_items)
+        return
+
+    if journal is None:
+        return
 
-        if debug or dry_run:
-            debug_index += 1
+    if not latest_indices:
+        # Keep the journal for the next run, nothing was processed
+        await journal.close()
+        return
 
-    if not debug and not dry_run:
-        # Write the potentially modified list back (includes updated asset lists)
-        await write_json(local_data_path, updated_data_list)
+    change_feed.remove(name, await local_data.prune(latest_indices))
+    await journal.compact(local_data)
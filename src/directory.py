@@ -5,20 +5,26 @@ from pathlib import Path
 from anyio import create_task_group
 from loguru import logger
 
-from constants import (
-    OUTPUT_DIR,
-    REPO_CE_COLOR_DIR,
-    REPO_CE_DIR,
-    REPO_DIR_PATH,
-    REPO_SERVANT_COLOR_DIR,
-    REPO_SERVANT_DIR,
-)
+from constants import OUTPUT_DIR, REPO_DIR_PATH
+from enums import SupportKind
+from metrics import Stage, metrics
+from region import REGIONS
 
 
 class RepositoryNotFoundError(Exception):
     pass
 
 
+def _repo_directories() -> list[Path]:
+    """Get the support directories of every region in the repository."""
+    return [
+        region.repo_dir(kind, color)
+        for region in REGIONS
+        for kind in SupportKind
+        for color in (False, True)
+    ]
+
+
 async def check_if_repo_exists():
     """Check if the repository exists."""
     if not REPO_DIR_PATH.exists():
@@ -31,13 +37,18 @@ async def check_if_repo_exists():
 
 async def copy_output_to_repo():
     """Copy output files to the repository."""
+    if not OUTPUT_DIR.exists():
+        logger.info("No output files to copy to the repository.")
+        return
+
     logger.info("Copying images to the repository...")
     try:
-        shutil.copytree(
-            OUTPUT_DIR,
-            REPO_DIR_PATH,
-            dirs_exist_ok=True,
-        )
+        with metrics.time(Stage.SYNC):
+            shutil.copytree(
+                OUTPUT_DIR,
+                REPO_DIR_PATH,
+                dirs_exist_ok=True,
+            )
         logger.info("Successfully copied output files to the repository.")
     except FileExistsError:
         logger.error("The repository already has the output files.")
@@ -53,12 +64,7 @@ async def delete_repository_support():
         logger.error(f"Support repository path does not exist: {REPO_DIR_PATH}")
         return
 
-    directories = [
-        REPO_SERVANT_DIR,
-        REPO_SERVANT_COLOR_DIR,
-        REPO_CE_DIR,
-        REPO_CE_COLOR_DIR,
-    ]
+    directories = _repo_directories()
 
     for dirEntry in directories:
         if not dirEntry.exists():
@@ -81,16 +87,12 @@ async def remove_duplicate_txt_names():
     """Remove duplicate text names."""
 
     logger.info("Removing duplicate text names...")
-    directories = [
-        REPO_SERVANT_DIR,
-        REPO_SERVANT_COLOR_DIR,
-        REPO_CE_DIR,
-        REPO_CE_COLOR_DIR,
-    ]
+    directories = _repo_directories()
     try:
-        async with create_task_group() as tg:
-            for directory in directories:
-                tg.start_soon(_remove_duplicate_txt_names, directory)
+        with metrics.time(Stage.TXT_CLEANUP, items=len(directories)):
+            async with create_task_group() as tg:
+                for directory in directories:
+                    tg.start_soon(_remove_duplicate_txt_names, directory)
     except Exception as e:
         logger.error(f"Error removing duplicate text names: {e}")
 
@@ -0,0 +1,88 @@
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from loguru import logger
+
+import utils
+from constants import HISTORY_FILE
+from enums import SupportKind
+
+# Weight of a new sample in the moving averages
+SMOOTHING = 0.1
+
+
+@dataclass(slots=True)
+class KindHistory:
+    """
+    Moving averages of the costs observed in previous runs for a kind.
+
+    Attributes:
+        asset_bytes (float): The average size of a downloaded asset.
+        render_seconds (float): The average time to render an entity.
+        downloads (int): The number of downloads observed.
+        renders (int): The number of renders observed.
+    """
+
+    asset_bytes: float = 0.0
+    render_seconds: float = 0.0
+    downloads: int = 0
+    renders: int = 0
+
+
+def _smooth(average: float, count: int, value: float) -> float:
+    # Plain mean until there are enough samples for the moving average
+    if count < 1 / SMOOTHING:
+        return average + (value - average) / (count + 1)
+    return average + (value - average) * SMOOTHING
+
+
+class RunHistory:
+    """
+    Costs observed in previous runs, used to estimate the cost of a plan.
+
+    Attributes:
+        path (Path): The path to the history file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._kinds: dict[SupportKind, KindHistory] = {}
+
+    def get(self, kind: SupportKind) -> KindHistory:
+        return self._kinds.setdefault(kind, KindHistory())
+
+    def record_download(self, kind: SupportKind, size: int):
+        entry = self.get(kind)
+        entry.asset_bytes = _smooth(entry.asset_bytes, entry.downloads, size)
+        entry.downloads += 1
+
+    def record_render(self, kind: SupportKind, seconds: float):
+        entry = self.get(kind)
+        entry.render_seconds = _smooth(entry.render_seconds, entry.renders, seconds)
+        entry.renders += 1
+
+    async def load(self):
+        if not self.path.exists():
+            return
+
+        raw_data: dict | None = await utils.read_json(self.path)
+        if raw_data is None:
+            return
+
+        for kind in SupportKind:
+            try:
+                self._kinds[kind] = KindHistory(**raw_data.get(kind.value, {}))
+            except TypeError as e:
+                logger.warning(f"Ignoring invalid {kind.value} history: {e}")
+
+    async def save(self):
+        if not self._kinds:
+            return
+
+        await utils.write_json(
+            self.path,
+            {kind.value: asdict(entry) for kind, entry in self._kinds.items()},
+        )
+
+
+history = RunHistory(HISTORY_FILE)
@@ -1,9 +1,18 @@
+import time
 from pathlib import Path
 
 import cv2
+import numpy as np
 from cv2.typing import MatLike
 from loguru import logger
 
+from layout import layout
+from log import sampler
+from manifest import manifest
+from metrics import Stage, metrics
+from pack import packed
+from utils import file_size, write_if_changed
+
 IMG_EXT = {".jpg", ".jpeg", ".png"}
 
 SERVANT_SIZE = (157, 157)
@@ -22,11 +31,17 @@ def create_support_servant_img(
     image_np_list = _read_images(source_dir)
     final_image = _process_servant_images(image_np_list)
 
-    cv2.imwrite(str(dest_color_file_path), final_image)
+    layout.ensure_parent(dest_color_file_path)
+    layout.ensure_parent(dest_file_path)
+    with metrics.time(Stage.ENCODE, items=2):
+        write_image(dest_color_file_path, final_image)
 
-    final_image_np = cv2.cvtColor(final_image.copy(), cv2.COLOR_BGR2GRAY)
-    cv2.imwrite(str(dest_file_path), final_image_np)
-    logger.info(f"Servant {source_dir.name} - Images processed and saved successfully.")
+        final_image_np = cv2.cvtColor(final_image.copy(), cv2.COLOR_BGR2GRAY)
+        write_image(dest_file_path, final_image_np)
+    logger.log(
+        sampler.level("image"),
+        f"Servant {source_dir.name} - Images processed and saved successfully.",
+    )
 
 
 def create_support_ce_img(
@@ -42,11 +57,42 @@ def create_support_ce_img(
 
     image_np = image_np_list[0]
 
-    cv2.imwrite(str(dest_color_file_path), image_np)
+    layout.ensure_parent(dest_color_file_path)
+    layout.ensure_parent(dest_file_path)
+    with metrics.time(Stage.ENCODE, items=2):
+        write_image(dest_color_file_path, image_np)
+
+        image_np_gray = cv2.cvtColor(image_np.copy(), cv2.COLOR_BGR2GRAY)
+        write_image(dest_file_path, image_np_gray)
+    logger.log(
+        sampler.level("image"),
+        f"CE {source_dir.name} - Image processed and saved successfully.",
+    )
+
+
+def write_image(file_path: Path, image: MatLike) -> bool:
+    """
+    Write an image atomically and only if its encoded content changed, so
+    the image can be written straight into the repository without touching
+    the unchanged files. The hash of the content is recorded in the build
+    manifest.
+
+    Args:
+        file_path (Path): The path to the image, its suffix picks the format.
+        image (MatLike): The image to write.
+
+    Returns:
+        bool: True if the file was written, False if it was unchanged or the
+            image could not be encoded.
+    """
+    success, encoded = cv2.imencode(file_path.suffix, image)
+    if not success:
+        logger.error(f"Failed to encode image: {file_path}")
+        return False
 
-    image_np_gray = cv2.cvtColor(image_np.copy(), cv2.COLOR_BGR2GRAY)
-    cv2.imwrite(str(dest_file_path), image_np_gray)
-    logger.info(f"CE {source_dir.name} - Image processed and saved successfully.")
+    data = encoded.tobytes()
+    manifest.record(file_path, data)
+    return write_if_changed(file_path, data)
 
 
 def _process_servant_images(
@@ -64,6 +110,7 @@ def _process_servant_images(
         MatLike: A combined image as a numpy array.
     """
     new_image_np_list: list[MatLike] = []
+    start = time.perf_counter()
     for image in image_np_list:
         resize_image = cv2.resize(
             image,
@@ -77,11 +124,46 @@ def _process_servant_images(
         ]
 
         new_image_np_list.append(cropped_image)
+    metrics.record(Stage.RESIZE, time.perf_counter() - start, items=len(image_np_list))
 
     combined_img = cv2.vconcat(new_image_np_list)
     return combined_img
 
 
+def read_image(img_path: Path) -> MatLike | None:
+    """
+    Read an image file. An image kept in the asset pack is decoded straight
+    from the memory-mapped pack, without copying it.
+
+    Args:
+        img_path (Path): The path to the image.
+
+    Returns:
+        MatLike | None: The image, None if it cannot be read.
+    """
+    entry = packed(img_path)
+    if entry is None:
+        return cv2.imread(str(img_path))
+
+    pack, key = entry
+    data = pack.get(key)
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _list_images(source_dir: Path) -> list[Path]:
+    entry = packed(source_dir)
+    if entry is not None:
+        pack, key = entry
+        return sorted(source_dir / name for name in pack.listdir(key))
+
+    images: list[Path] = []
+    for ext in IMG_EXT:
+        images.extend(source_dir.glob(f"**/*{ext}"))
+    return sorted(path for path in images if path.is_file())
+
+
 def _read_images(
     source_dir: Path,
 ) -> list[MatLike]:
@@ -100,29 +182,30 @@ def _read_images(
     """
     image_np_list: list[MatLike] = []
 
-    images: list[Path] = []
-    for ext in IMG_EXT:
-        images.extend(source_dir.glob(f"**/*{ext}"))
-    images = sorted(images)
-
-    for img_path in images:
-        if not img_path.is_file():
-            continue
-
+    start = time.perf_counter()
+    nbytes = 0
+    for img_path in _list_images(source_dir):
         if img_path.suffix not in IMG_EXT:
             logger.warning(f"Invalid file: {img_path.name}")
             continue
 
         try:
-            image_np = cv2.imread(str(img_path))
+            image_np = read_image(img_path)
             if image_np is None or image_np.size == 0:
                 logger.warning(f"Failed to read image: {img_path.name}")
                 continue
 
             image_np_list.append(image_np)
+            nbytes += file_size(img_path)
 
         except Exception as e:
             logger.error(f"Error reading image {img_path.name}: {e}")
             continue
 
+    metrics.record(
+        Stage.DECODE,
+        time.perf_counter() - start,
+        items=len(image_np_list),
+        nbytes=nbytes,
+    )
     return image_np_list
@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import orjson
+from anyio import AsyncFile, Lock, open_file
+from loguru import logger
+
+from layout import layout
+from models import BaseData
+from store import LocalDataStore
+
+
+class Journal[T: BaseData]:
+    """
+    Append-only journal of the entities completed during a run.
+
+    Every completed entity is written as one JSON line as soon as it is done,
+    so a run that gets killed can resume from where it stopped. The journal
+    is replayed into the local data store on startup and compacted into it,
+    then removed, once the run completes.
+
+    Attributes:
+        name (str): The name of the data, used for logging.
+        path (Path): The path to the journal file.
+        replayed (list[int]): The indices of the entities replayed from an
+            interrupted run.
+    """
+
+    def __init__(self, name: str, path: Path):
+        self.name = name
+        self.path = path
+        self.replayed: list[int] = []
+        self._file: AsyncFile[bytes] | None = None
+        self._lock = Lock()
+
+    async def replay(self, store: LocalDataStore[T]) -> int:
+        """
+        Apply the entries of an interrupted run to the local data store.
+
+        A truncated last line, from a run killed mid-write, is ignored.
+
+        Args:
+            store (LocalDataStore[T]): The local data store to update.
+
+        Returns:
+            int: The number of replayed entries.
+        """
+        if not self.path.exists():
+            return 0
+
+        async with await open_file(self.path, "rb") as f:
+            lines = (await f.read()).splitlines()
+
+        for line in lines:
+            try:
+                item = store.class_type.from_dict(orjson.loads(line))
+                await store.put(item)
+            except (orjson.JSONDecodeError, TypeError) as e:
+                logger.warning(f"Skipping invalid {self.name} journal entry: {e}")
+                continue
+            self.replayed.append(item.idx)
+
+        replayed = len(self.replayed)
+        if replayed:
+            logger.info(f"Resuming {self.name}: replayed {replayed} completed entries.")
+        return replayed
+
+    async def append(self, item: T):
+        """
+        Record a completed entity.
+
+        The line is flushed right away, so it survives the process being
+        killed. It is not fsynced, the run is redone on a power loss anyway.
+
+        Args:
+            item (T): The completed entity.
+        """
+        # Entities are completed concurrently
+        async with self._lock:
+            if self._file is None:
+                layout.ensure_parent(self.path)
+                self._file = await open_file(self.path, "ab")
+
+            await self._file.write(orjson.dumps(item) + b"\n")
+            await self._file.flush()
+
+    async def close(self):
+        if self._file is not None:
+            await self._file.aclose()
+            self._file = None
+
+    async def compact(self, store: LocalDataStore[T]):
+        """
+        Write the journaled entries into the local data store and remove
+        the journal.
+
+        Args:
+            store (LocalDataStore[T]): The local data store to flush.
+        """
+        await self.close()
+        await store.flush()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+
+class DirectoryLayout:
+    """
+    Create directories lazily, only when something is written into them.
+
+    The directories that were already created are remembered, so repeated
+    writes into the same directory don't cost a `mkdir` call each time.
+    """
+
+    def __init__(self):
+        self._created: set[Path] = set()
+
+    def ensure(self, directory: Path) -> Path:
+        """
+        Create the directory and its parents if they were not created yet.
+
+        Args:
+            directory (Path): The directory to create.
+
+        Returns:
+            Path: The same directory.
+        """
+        if directory in self._created:
+            return directory
+
+        directory.mkdir(parents=True, exist_ok=True)
+
+        self._created.add(directory)
+        self._created.update(directory.parents)
+        return directory
+
+    def ensure_parent(self, file_path: Path) -> Path:
+        """
+        Create the parent directory of a file about to be written.
+
+        Args:
+            file_path (Path): The file to be written.
+
+        Returns:
+            Path: The same file path.
+        """
+        self.ensure(file_path.parent)
+        return file_path
+
+    def forget(self, directory: Path):
+        """
+        Forget a removed directory and everything below it.
+
+        Args:
+            directory (Path): The removed directory.
+        """
+        self._created = {
+            path
+            for path in self._created
+            if path != directory and directory not in path.parents
+        }
+
+
+layout = DirectoryLayout()
@@ -1,11 +1,177 @@
 import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
 
+import orjson
 from loguru import logger
 
-from constants import LOG_FILE
+from constants import LOG_FILE, LOG_JSON_FILE
 
+# Records written to the JSON log at once
+BATCH_SIZE = 256
 
-def setup_logger(debug: bool = False):
+# Seconds a record waits at most in the batch
+FLUSH_INTERVAL = 1.0
+
+# Size at which the JSON log is rotated
+ROTATION_BYTES = 10 * 1024 * 1024
+
+# Records at this level or above are written right away, i.e. ERROR
+FLUSH_LEVEL = 40
+
+# INFO messages per second of a chatty category, e.g. per-asset downloads,
+# the others are logged at DEBUG
+SAMPLE_RATE = 5
+
+
+class BatchedJsonSink:
+    """
+    Write the log records as JSON lines, a batch at a time.
+
+    Added with `enqueue=True`, the records are formatted and written from the
+    loguru worker thread, so a logging call only enqueues the record. A
+    background thread flushes the batch of an idle logger.
+
+    Attributes:
+        path (Path): The path to the JSON log.
+        batch_size (int): The records written at once.
+        flush_interval (float): The seconds a record waits at most.
+        rotation (int): The size at which the log is rotated.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        rotation: int = ROTATION_BYTES,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotation = rotation
+
+        self._batch: list[bytes] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically, name="log-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    def write(self, message):
+        record = message.record
+        entry = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "name": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "thread": record["thread"].name,
+            "message": record["message"],
+        }
+        if record["extra"]:
+            entry["extra"] = record["extra"]
+        exception = record["exception"]
+        if exception is not None:
+            entry["exception"] = "".join(
+                traceback.format_exception(
+                    exception.type, exception.value, exception.traceback
+                )
+            )
+
+        line = orjson.dumps(entry, default=str) + b"\n"
+        with self._lock:
+            self._batch.append(line)
+            if len(self._batch) < self.batch_size and record["level"].no < FLUSH_LEVEL:
+                return
+            self._write_batch()
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            with self._lock:
+                self._write_batch()
+
+    def _write_batch(self):
+        if not self._batch:
+            return
+
+        data = b"".join(self._batch)
+        self._batch = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists() and self.path.stat().st_size + len(data) > self.rotation:
+            stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S_%f")
+            self.path.rename(self.path.with_name(f"{self.path.stem}.{stamp}.jsonl"))
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+    def stop(self):
+        """Write the last batch, called by loguru when the sink is removed."""
+        self._stopped.set()
+        with self._lock:
+            self._write_batch()
+
+
+class LogSampler:
+    """
+    Rate limit the INFO messages of chatty categories, e.g. one message per
+    downloaded asset. Above `per_second` messages in a second, the messages
+    of a category are logged at DEBUG, and the number of demoted messages is
+    logged once the next second starts.
+    """
+
+    def __init__(self, per_second: int = SAMPLE_RATE):
+        self.per_second = per_second
+        # Category -> start of the second, messages at INFO, messages demoted
+        self._windows: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def level(self, category: str) -> str:
+        """
+        Get the level of the next message of a category.
+
+        Args:
+            category (str): The category of the message.
+
+        Returns:
+            str: "INFO" while under the rate, "DEBUG" otherwise.
+        """
+        now = time.monotonic()
+        demoted = 0
+        with self._lock:
+            window = self._windows.get(category)
+            if window is None or now - window[0] >= 1.0:
+                demoted = int(window[2]) if window is not None else 0
+                self._windows[category] = [now, 1, 0]
+                level = "INFO"
+            elif window[1] < self.per_second:
+                window[1] += 1
+                level = "INFO"
+            else:
+                window[2] += 1
+                level = "DEBUG"
+
+        if demoted:
+            logger.info(f"{demoted} {category} messages were only logged at DEBUG.")
+        return level
+
+
+sampler = LogSampler()
+
+
+def setup_logger(debug: bool = False, json_logs: bool = False):
+    """
+    Set up the file and stderr sinks.
+
+    Args:
+        debug (bool): Log DEBUG messages to stderr too.
+        json_logs (bool): Write the file log as batched JSON lines to
+            `LOG_JSON_FILE`, with every sink fed from a background thread so
+            logging never blocks the event loop.
+    """
     # Remove default logger
     logger.remove()
 
@@ -17,12 +183,15 @@ def setup_logger(debug: bool = False):
     )
 
     # Set up logging
-    logger.add(
-        sink=LOG_FILE,
-        rotation="1 MB",
-        level="DEBUG",
-        format=debug_log_format,
-    )
+    if json_logs:
+        logger.add(sink=BatchedJsonSink(LOG_JSON_FILE), level="DEBUG", enqueue=True)
+    else:
+        logger.add(
+            sink=LOG_FILE,
+            rotation="1 MB",
+            level="DEBUG",
+            format=debug_log_format,
+        )
 
     log_format = (
         "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
@@ -37,4 +206,5 @@ def setup_logger(debug: bool = False):
         colorize=True,
         format=current_format,
         level=level,
+        enqueue=json_logs,
     )
@@ -1,110 +1,583 @@
-from typing import TypeVar
+import time
+from pathlib import Path
 
 import click
-from anyio import create_task_group, run
+from anyio import create_task_group, run, to_thread
 from loguru import logger
 
 import directory
-from data import process_craft_essence_data, process_servant_data
+import utils
+from cache import asset_cache
+from changes import change_feed
+from constants import DATA_DIR, FRAGMENTS_DIR
+from content import content_index
+from enums import SupportKind
+from history import history
 from log import setup_logger
-from models import (
-    BaseData,
-    CraftEssenceData,
-    ServantData,
-)
+from manifest import manifest
+from metrics import metrics
+from negative import negative_cache
+from pack import CACHE_BACKEND, asset_pack
+from plan import KindPlan, build_plan, log_plan
 from preprocess import (
     fetch_local_ce_data,
     fetch_local_servant_data,
+    load_cached_craft_essence,
+    load_cached_servant,
     process_craft_essence,
     process_servant,
 )
+from profiler import run_profiled
+from region import REGIONS, Region
+from shard import Shard, ShardError, merge_fragments, merge_outputs
+from store import LocalDataStore
+from verify import log_report, remove_orphans, verify_repo
 
-T = TypeVar("T", bound=BaseData)
-IndexedT = dict[int, T]
+# The rendering modules import OpenCV and the download modules httpx, so they
+# are imported by the commands that need them. The planning, verify, cache and
+# help commands start without them, see test_startup.
 
 
-async def main(debug: bool, dry_run: bool, delete: bool):
+async def main(
+    debug: bool,
+    dry_run: bool,
+    delete: bool,
+    shard: Shard | None = None,
+    direct: bool = False,
+):
     """
     Main function to run the application.
+
+    With a shard, only the entities of the shard are processed into the
+    output directory and a local data fragment, to be combined by `merge`.
+
+    In direct mode the images are rendered straight into the repository,
+    only writing the changed ones, instead of into the output directory and
+    then copied. Dry runs still render into the output directory.
+
+    The entities changed by the run are written to the change feed in the
+    repository, see `changes.ChangeFeed`, except in debug and dry runs. The
+    grayscale images are packed into the bundles, see `bundle.SupportBundle`.
+
+    The regions are processed concurrently, sharing the asset cache and the
+    HTTP connection pool.
     """
+    from bundle import write_bundles
+    from data import process_craft_essence_data, process_servant_data
+
     logger.info("Starting the application...")
     if debug:
         logger.debug("Debug mode is enabled.")
+    if shard is not None:
+        if len(REGIONS) > 1:
+            logger.error("Shards only support a single region. Exiting...")
+            exit(1)
+        logger.info(f"Processing shard {shard.index}/{shard.count}.")
 
-    ce_latest_data: list[CraftEssenceData] = []
-    ce_local_data: IndexedT = {}
+    # Dry runs and shards still render into the output directory
+    staging = direct and dry_run
+    direct = direct and not dry_run and shard is None
 
-    servant_latest_data: list[ServantData] = []
-    servant_local_data: IndexedT = {}
+    # Local data of every kind of every region, by `Region.key`
+    stores: dict[str, LocalDataStore] = {}
 
-    async def preprocess_ce():
-        nonlocal ce_latest_data
-        ce_latest_data = await process_craft_essence()
+    async def fetch_local(name: str, fetch_func, region):
+        stores[name] = await fetch_func(region)
 
-    async def fetch_local_ce():
-        nonlocal ce_local_data
-        ce_local_data = await fetch_local_ce_data()
+    if shard is None:
+        try:
+            await directory.check_if_repo_exists()
+        except directory.RepositoryNotFoundError:
+            logger.error("Repository not found. Exiting...")
+            exit()
 
-    async def preprocess_servant():
-        nonlocal servant_latest_data
-        servant_latest_data = await process_servant()
-
-    async def fetch_local_servant():
-        nonlocal servant_local_data
-        servant_local_data = await fetch_local_servant_data()
+        if delete:
+            logger.info("Deleting the repository support files...")
+            await directory.delete_repository_support()
 
     try:
-        await directory.check_if_repo_exists()
-    except directory.RepositoryNotFoundError:
-        logger.error("Repository not found. Exiting...")
-        exit()
+        async with create_task_group() as tg:
+            for region in REGIONS:
+                tg.start_soon(
+                    fetch_local,
+                    region.key(SupportKind.SERVANT),
+                    fetch_local_servant_data,
+                    region,
+                )
+                tg.start_soon(
+                    fetch_local,
+                    region.key(SupportKind.CRAFT_ESSENCE),
+                    fetch_local_ce_data,
+                    region,
+                )
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
 
-    if delete:
-        logger.info("Deleting the repository support files...")
-        await directory.delete_repository_support()
+    await history.load()
+    await negative_cache.load()
+    await manifest.load()
+    await content_index.load()
+    await asset_cache.load()
 
+    if len(stores) != len(REGIONS) * len(SupportKind):
+        logger.error("Failed to open the local data. Exiting...")
+        exit()
+
+    # The exports are preprocessed as they are consumed by the processing
     try:
         async with create_task_group() as tg:
-            tg.start_soon(preprocess_ce)
-            tg.start_soon(fetch_local_ce)
-            tg.start_soon(preprocess_servant)
-            tg.start_soon(fetch_local_servant)
+            for region in REGIONS:
+                tg.start_soon(
+                    process_servant_data,
+                    process_servant(region),
+                    stores[region.key(SupportKind.SERVANT)],
+                    debug,
+                    dry_run,
+                    shard,
+                    direct,
+                    region,
+                )
+                tg.start_soon(
+                    process_craft_essence_data,
+                    process_craft_essence(region),
+                    stores[region.key(SupportKind.CRAFT_ESSENCE)],
+                    debug,
+                    dry_run,
+                    shard,
+                    direct,
+                    region,
+                )
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+        exit()
+
+    await history.save()
+    negative_cache.report()
+    await negative_cache.save()
+    await utils.close_client()
+
+    if shard is None and not debug and not dry_run:
+        await asset_cache.maintain(stores)
+    else:
+        # Other shards still use the assets this one does not reference
+        await asset_cache.save()
+
+    if shard is not None:
+        logger.info("Shard done, combine the shards with the merge command.")
+        await manifest.save()
+        await content_index.save()
+        await metrics.save()
+        return
+
+    if staging:
+        # The staged outputs are not published, so their hashes are not saved
+        logger.info("Dry run, the output directory is left out of the repository.")
+        await metrics.save()
+        return
+
+    if not direct:
+        await directory.copy_output_to_repo()
+
+    await directory.remove_duplicate_txt_names()
+    await write_bundles()
+
+    if not debug and not dry_run:
+        await change_feed.save()
+    await manifest.save()
+    await content_index.save()
+    await metrics.save()
+
+
+async def merge(roots: list[Path], sync: bool):
+    """
+    Combine the outputs and local data fragments of every shard.
+
+    Args:
+        roots (list[Path]): The shard directories, each holding the `output`
+            and `data/fragments` of a shard run. The local fragments are
+            always included.
+        sync (bool): Copy the merged outputs to the repository afterwards.
+    """
+    fragment_roots: list[Path] = []
+    for fragment_root in [FRAGMENTS_DIR] + [
+        root / DATA_DIR.name / FRAGMENTS_DIR.name for root in roots
+    ]:
+        if fragment_root.resolve() not in [x.resolve() for x in fragment_roots]:
+            fragment_roots.append(fragment_root)
 
     try:
-        async with create_task_group() as tg:
+        servant_fragments = await merge_fragments(
+            SupportKind.SERVANT, fragment_roots, await fetch_local_servant_data()
+        )
+        ce_fragments = await merge_fragments(
+            SupportKind.CRAFT_ESSENCE, fragment_roots, await fetch_local_ce_data()
+        )
+    except ShardError as e:
+        logger.error(f"Failed to merge the shards: {e}")
+        exit(1)
+
+    merge_outputs(roots)
+
+    for path in servant_fragments + ce_fragments:
+        if path.parent.resolve() == FRAGMENTS_DIR.resolve():
+            path.unlink(missing_ok=True)
+
+    if sync:
+        try:
+            await directory.check_if_repo_exists()
+        except directory.RepositoryNotFoundError:
+            logger.error("Repository not found. Exiting...")
+            exit(1)
+
+        from bundle import write_bundles
+
+        await directory.copy_output_to_repo()
+        await directory.remove_duplicate_txt_names()
+        await write_bundles()
+
+
+async def plan():
+    """
+    Compute and log the full change set of a run from the last downloaded
+    exports and the local data, without the network or writing any files.
+    """
+    start = time.perf_counter()
+    logger.info("Planning the changes...")
+
+    await history.load()
+    await negative_cache.load()
+
+    plans: dict[str, KindPlan] = {}
+
+    async def plan_kind(region: Region, kind: SupportKind, load_func, fetch_func):
+        plans[region.key(kind)] = await build_plan(
+            kind,
+            load_func(region=region),
+            await fetch_func(region),
+            region.temp_dir(kind),
+        )
+
+    async with create_task_group() as tg:
+        for region in REGIONS:
             tg.start_soon(
-                process_servant_data,
-                servant_latest_data,
-                servant_local_data,
-                debug,
-                dry_run,
+                plan_kind,
+                region,
+                SupportKind.SERVANT,
+                load_cached_servant,
+                fetch_local_servant_data,
             )
             tg.start_soon(
-                process_craft_essence_data,
-                ce_latest_data,
-                ce_local_data,
-                debug,
-                dry_run,
+                plan_kind,
+                region,
+                SupportKind.CRAFT_ESSENCE,
+                load_cached_craft_essence,
+                fetch_local_ce_data,
             )
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        exit()
 
-    await directory.copy_output_to_repo()
+    for region in REGIONS:
+        if len(REGIONS) > 1:
+            logger.info(f"{region.code} region:")
+        for kind in SupportKind:
+            log_plan(plans[region.key(kind)], history.get(kind))
+
+    logger.info(f"Planned in {time.perf_counter() - start:.3f}s.")
+
+
+async def rebuild(direct: bool = False):
+    """
+    Re-render every output from the cached assets and the local data, then
+    copy them to the repository. No network calls are made.
+
+    Args:
+        direct (bool): Render straight into the repository instead.
+    """
+    from bundle import write_bundles
+    from rebuild import MissingAssetError, offline_rebuild
+
+    try:
+        await directory.check_if_repo_exists()
+    except directory.RepositoryNotFoundError:
+        logger.error("Repository not found. Exiting...")
+        exit(1)
+
+    await asset_cache.load()
+    await manifest.load()
+
+    try:
+        await offline_rebuild(direct=direct)
+    except MissingAssetError as e:
+        logger.error(f"Offline rebuild aborted: {e}")
+        exit(1)
 
+    if not direct:
+        await directory.copy_output_to_repo()
     await directory.remove_duplicate_txt_names()
+    await write_bundles()
+
+    await asset_cache.save()
+    await manifest.save()
+    await metrics.save()
+
+
+async def verify(repair: bool):
+    """
+    Check the repository against the local data and the build manifest,
+    region by region.
+
+    Args:
+        repair (bool): Remove the orphans and re-render the entities that
+            need it straight into the repository, from the cached assets.
+    """
+    try:
+        await directory.check_if_repo_exists()
+    except directory.RepositoryNotFoundError:
+        logger.error("Repository not found. Exiting...")
+        exit(1)
+
+    await manifest.load()
+    reports = [
+        (region, await verify_repo(manifest, region=region)) for region in REGIONS
+    ]
+    for region, report in reports:
+        log_report(report, region)
+    if all(report.ok for _, report in reports):
+        return
+    if not repair:
+        exit(1)
+
+    from bundle import write_bundles
+    from rebuild import MissingAssetError, offline_rebuild
+
+    for _, report in reports:
+        remove_orphans(report.orphans)
+    if not any(report.problems for _, report in reports):
+        await write_bundles()
+        return
+
+    await asset_cache.load()
+    for region, report in reports:
+        if not report.problems:
+            continue
+        try:
+            await offline_rebuild(direct=True, only=report.rebuild, region=region)
+        except MissingAssetError as e:
+            logger.error(f"Repair aborted, a full run is needed: {e}")
+            exit(1)
+    await write_bundles()
+    await asset_cache.save()
+    await manifest.save()
+
+
+async def cache_stats():
+    """Log the size of the asset cache and its hit rates over recent runs."""
+    await asset_cache.load()
+    asset_cache.scan()
+
+    size = asset_cache.size
+    logger.info(
+        f"Asset cache: {len(asset_cache.entries)} entities, "
+        f"{size / 1024 / 1024:.1f} MiB of "
+        f"{asset_cache.max_bytes / 1024 / 1024:.0f} MiB"
+    )
+
+    for root_name in asset_cache.roots:
+        prefix = f"{root_name}/"
+        entries = [
+            entry
+            for key, entry in asset_cache.entries.items()
+            if key.startswith(prefix)
+        ]
+        logger.info(
+            f"{root_name.upper()}: {len(entries)} entities, "
+            f"{sum(entry.size for entry in entries) / 1024 / 1024:.1f} MiB"
+        )
+
+    runs = len(asset_cache.runs)
+    for kind, counters in asset_cache.hit_rates().items():
+        lookups = counters.hits + counters.misses
+        if lookups == 0:
+            continue
+        total_bytes = counters.hit_bytes + counters.miss_bytes
+        logger.info(
+            f"{kind.upper()} over {runs} runs: {lookups} lookups, "
+            f"{counters.hits / lookups:.1%} hit rate, "
+            f"{counters.hit_bytes / max(total_bytes, 1):.1%} of the bytes "
+            f"served from the cache"
+        )
+
+
+async def cache_compact():
+    """
+    Move the asset files into the asset pack and drop its deleted records.
+    """
+    if asset_pack is None:
+        logger.warning(
+            f"The {CACHE_BACKEND} cache backend has no pack to compact, "
+            "set FGA_CACHE_BACKEND=pack to use it."
+        )
+        return
+
+    await asset_cache.load()
+    await to_thread.run_sync(asset_pack.import_files)
+    reclaimed = await to_thread.run_sync(asset_pack.compact)
+    asset_cache.scan()
+    await asset_cache.save()
+
+    logger.info(
+        f"Asset pack: {len(asset_pack.index)} assets, "
+        f"{asset_pack.live_bytes / 1024 / 1024:.1f} MiB, "
+        f"{reclaimed / 1024 / 1024:.1f} MiB reclaimed"
+    )
 
 
-@click.command()
+def _parse_shard(
+    ctx: click.Context, param: click.Parameter, value: str | None
+) -> Shard | None:
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except ShardError as e:
+        raise click.BadParameter(str(e)) from e
+
+
+@click.group(invoke_without_command=True)
 @click.option("--debug", is_flag=True, help="Enable debug mode.")
 @click.option("--dry_run", is_flag=True, help="Enable dry run mode.")
 @click.option("--delete", is_flag=True, help="Delete the repository files.")
-def app(debug: bool, dry_run: bool, delete: bool):
-    setup_logger(debug=debug)
+@click.option(
+    "--plan",
+    "plan_only",
+    is_flag=True,
+    help="Only list the changes a run would make, without network or writes.",
+)
+@click.option(
+    "--offline-rebuild",
+    "offline_rebuild",
+    is_flag=True,
+    help="Re-render everything from the cached assets, without network.",
+)
+@click.option(
+    "--direct",
+    is_flag=True,
+    help="Render straight into the repository, only writing changed images.",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Run under the sampling profiler, writing the profile to logs.",
+)
+@click.option(
+    "--json-logs",
+    is_flag=True,
+    help="Log JSON lines in batches from a background thread.",
+)
+@click.option(
+    "--shard",
+    callback=_parse_shard,
+    default=None,
+    metavar="I/N",
+    help="Only process the entities of shard I out of N.",
+)
+@click.pass_context
+def app(
+    ctx: click.Context,
+    debug: bool,
+    dry_run: bool,
+    delete: bool,
+    plan_only: bool,
+    offline_rebuild: bool,
+    direct: bool,
+    profile: bool,
+    json_logs: bool,
+    shard: Shard | None,
+):
+    setup_logger(debug=debug, json_logs=json_logs)
+    ctx.obj = {"debug": debug, "dry_run": dry_run, "direct": direct}
+
+    if ctx.invoked_subcommand is not None:
+        return
+
+    if plan_only:
+        func, args = plan, ()
+    elif offline_rebuild:
+        func, args = rebuild, (direct,)
+    else:
+        func, args = main, (debug, dry_run, delete, shard, direct)
+
+    if profile:
+        run(run_profiled, func, *args)
+    else:
+        run(func, *args)
+
+
+@app.command("watch")
+@click.option(
+    "--interval",
+    type=float,
+    default=300,
+    show_default=True,
+    help="Seconds between polls of the exports.",
+)
+@click.option(
+    "--exec",
+    "exec_command",
+    default=None,
+    help="Shell command to run after every processed change.",
+)
+@click.pass_context
+def watch_command(ctx: click.Context, interval: float, exec_command: str | None):
+    """Stay resident and process the exports whenever they change."""
+    from watch import watch
+
+    run(
+        watch,
+        interval,
+        ctx.obj["debug"],
+        ctx.obj["dry_run"],
+        exec_command,
+        ctx.obj["direct"],
+    )
+
+
+@app.command("merge")
+@click.argument(
+    "roots",
+    nargs=-1,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option("--sync", is_flag=True, help="Copy the merged outputs to the repo.")
+def merge_command(roots: tuple[Path, ...], sync: bool):
+    """Combine the outputs and local data of the shard runs in ROOTS."""
+    run(merge, list(roots), sync)
+
+
+@app.command("verify")
+@click.option(
+    "--repair",
+    is_flag=True,
+    help="Remove the orphans and re-render the entities that need it.",
+)
+def verify_command(repair: bool):
+    """Check the repository against the local data and the build manifest."""
+    run(verify, repair)
+
+
+@app.group("cache")
+def cache_group():
+    """Inspect the asset cache."""
+
+
+@cache_group.command("stats")
+def cache_stats_command():
+    """Show the size of the asset cache and its hit rates."""
+    run(cache_stats)
+
 
-    run(main, debug, dry_run, delete)
+@cache_group.command("compact")
+def cache_compact_command():
+    """Pack the asset files and reclaim the space of deleted assets."""
+    run(cache_compact)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+import utils
+from constants import MANIFEST_FILE, OUTPUT_DIR, REPO_DIR_PATH
+
+
+def digest(data: bytes) -> str:
+    """Hash the content of an output file."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class BuildManifest:
+    """
+    Hashes of the rendered outputs, keyed by their path in the repository,
+    e.g. `servant/0001/support.png`.
+
+    An output has the same key whether it was rendered into the output
+    directory and copied, or rendered straight into the repository. The
+    hashes are recorded from the render threads, so recording is locked.
+
+    Attributes:
+        path (Path): The path to the manifest file.
+        roots (tuple[Path, ...]): The directories the outputs are rendered
+            into, the keys are relative to them.
+    """
+
+    def __init__(self, path: Path, roots: tuple[Path, ...]):
+        self.path = path
+        self.roots = roots
+        self.hashes: dict[str, str] = {}
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def key_for(self, file_path: Path) -> str | None:
+        """Get the key of an output path, None if it is not an output."""
+        for root in self.roots:
+            if file_path.is_relative_to(root):
+                return file_path.relative_to(root).as_posix()
+        return None
+
+    def record(self, file_path: Path, data: bytes):
+        """Record the content of an output file written to `file_path`."""
+        key = self.key_for(file_path)
+        if key is None:
+            return
+
+        value = digest(data)
+        with self._lock:
+            if self.hashes.get(key) != value:
+                self.hashes[key] = value
+                self._changed = True
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self.hashes.get(key)
+
+    async def load(self):
+        if not self.path.exists():
+            return
+
+        raw_data: dict | None = await utils.read_json(self.path)
+        if not isinstance(raw_data, dict):
+            logger.warning("Ignoring invalid build manifest.")
+            return
+
+        with self._lock:
+            self.hashes = raw_data
+            self._changed = False
+
+    async def save(self):
+        with self._lock:
+            if not self._changed:
+                return
+            hashes = dict(sorted(self.hashes.items()))
+            self._changed = False
+
+        await utils.write_json(self.path, hashes, indent=False)
+
+
+manifest = BuildManifest(MANIFEST_FILE, (OUTPUT_DIR, REPO_DIR_PATH))
@@ -0,0 +1,255 @@
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from enum import StrEnum
+from pathlib import Path
+
+from loguru import logger
+
+import utils
+from constants import METRICS_FILE, RUN_REPORT_FILE
+
+# Prefix of the exported Prometheus metrics
+METRIC_PREFIX = "fga_support"
+
+QUANTILES = (0.5, 0.95)
+
+
+class Stage(StrEnum):
+    """The instrumented stages of a run."""
+
+    EXPORT_FETCH = "export_fetch"
+    PREPROCESS = "preprocess"
+    LOCAL_LOAD = "local_load"
+    DIFF = "diff"
+    DOWNLOAD = "download"
+    VERIFY = "verify"
+    DECODE = "decode"
+    RESIZE = "resize"
+    ENCODE = "encode"
+    SYNC = "sync"
+    TXT_CLEANUP = "txt_cleanup"
+    BUNDLE = "bundle"
+
+
+@dataclass(slots=True)
+class GaugeMetrics:
+    """
+    The values a gauge took during a run.
+
+    Attributes:
+        last (float): The last value.
+        min (float): The lowest value.
+        max (float): The highest value.
+    """
+
+    last: float
+    min: float
+    max: float
+
+
+@dataclass(slots=True)
+class StageMetrics:
+    """
+    The samples recorded for a stage during a run.
+
+    Attributes:
+        durations (list[float]): The duration of every sample, in seconds.
+        items (int): The number of items processed, e.g. entities or images.
+        bytes (int): The number of bytes processed.
+    """
+
+    durations: list[float] = field(default_factory=list)
+    items: int = 0
+    bytes: int = 0
+
+
+def _quantile(samples: list[float], q: float) -> float:
+    """Linearly interpolated quantile of sorted samples."""
+    if not samples:
+        return 0.0
+    position = (len(samples) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(samples) - 1)
+    return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+
+class RunMetrics:
+    """
+    Durations, counts and bytes of the stages of a run, saved as a JSON run
+    report and a Prometheus textfile.
+
+    Samples may be recorded from the render threads, so recording is locked.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._stages: dict[Stage, StageMetrics] = {}
+        self._gauges: dict[str, GaugeMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: Stage, seconds: float, items: int = 1, nbytes: int = 0):
+        """
+        Record a sample of a stage.
+
+        Args:
+            stage (Stage): The stage.
+            seconds (float): The duration of the sample.
+            items (int): The number of items processed by the sample.
+            nbytes (int): The number of bytes processed by the sample.
+        """
+        with self._lock:
+            entry = self._stages.setdefault(stage, StageMetrics())
+            entry.durations.append(seconds)
+            entry.items += items
+            entry.bytes += nbytes
+
+    def gauge(self, name: str, value: float):
+        """
+        Record the current value of a gauge, e.g. a concurrency window.
+
+        Args:
+            name (str): The name of the gauge.
+            value (float): The current value.
+        """
+        with self._lock:
+            entry = self._gauges.get(name)
+            if entry is None:
+                self._gauges[name] = GaugeMetrics(value, value, value)
+                return
+            entry.last = value
+            entry.min = min(entry.min, value)
+            entry.max = max(entry.max, value)
+
+    @contextmanager
+    def time(self, stage: Stage, items: int = 1, nbytes: int = 0) -> Iterator[None]:
+        """Record the duration of the block as a sample of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, items, nbytes)
+
+    def get(self, stage: Stage) -> StageMetrics:
+        with self._lock:
+            return self._stages.setdefault(stage, StageMetrics())
+
+    def reset(self):
+        """Drop the recorded samples and start a new run."""
+        with self._lock:
+            self._stages.clear()
+            # Gauges carry over, only their range restarts
+            for entry in self._gauges.values():
+                entry.min = entry.max = entry.last
+            self.started = time.time()
+
+    def report(self) -> dict:
+        """
+        Summarize the run.
+
+        Returns:
+            dict: The run duration, the range of every gauge and, for every
+                recorded stage, the number of samples, items and bytes, the
+                total duration and the p50, p95 and maximum sample durations.
+        """
+        stages: dict[str, dict] = {}
+        with self._lock:
+            for stage in Stage:
+                entry = self._stages.get(stage)
+                if entry is None or not entry.durations:
+                    continue
+
+                durations = sorted(entry.durations)
+                total = sum(durations)
+                stages[stage.value] = {
+                    "samples": len(durations),
+                    "items": entry.items,
+                    "bytes": entry.bytes,
+                    "total_seconds": total,
+                    "p50_seconds": _quantile(durations, 0.5),
+                    "p95_seconds": _quantile(durations, 0.95),
+                    "max_seconds": durations[-1],
+                    "items_per_second": entry.items / total if total > 0 else 0.0,
+                }
+
+            gauges = {name: asdict(entry) for name, entry in self._gauges.items()}
+
+        return {
+            "started": datetime.fromtimestamp(self.started, UTC).isoformat(),
+            "duration_seconds": time.time() - self.started,
+            "stages": stages,
+            "gauges": gauges,
+        }
+
+    def prometheus(self, report: dict | None = None) -> str:
+        """
+        Format the run report in the Prometheus text exposition format, for
+        the node exporter textfile collector.
+        """
+        report = report or self.report()
+        stages: dict[str, dict] = report["stages"]
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+
+        lines = [
+            f"# HELP {name} Duration of the run stages.",
+            f"# TYPE {name} summary",
+        ]
+        for stage, entry in stages.items():
+            for q in QUANTILES:
+                key = f"p{round(q * 100)}_seconds"
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {entry[key]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {entry["total_seconds"]}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {entry["samples"]}')
+
+        for metric, key, help_text in (
+            ("items", "items", "Items processed by the run stages."),
+            ("bytes", "bytes", "Bytes processed by the run stages."),
+        ):
+            metric_name = f"{METRIC_PREFIX}_stage_{metric}"
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} gauge")
+            for stage, entry in stages.items():
+                lines.append(f'{metric_name}{{stage="{stage}"}} {entry[key]}')
+
+        for gauge, entry in report["gauges"].items():
+            metric_name = f"{METRIC_PREFIX}_{gauge}"
+            lines.append(f"# HELP {metric_name} The {gauge} during the run.")
+            lines.append(f"# TYPE {metric_name} gauge")
+            for stat, value in entry.items():
+                lines.append(f'{metric_name}{{stat="{stat}"}} {value}')
+
+        for metric, value, help_text in (
+            ("run_duration_seconds", report["duration_seconds"], "Run duration."),
+            ("run_timestamp_seconds", self.started, "Run start time."),
+        ):
+            metric_name = f"{METRIC_PREFIX}_{metric}"
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} gauge")
+            lines.append(f"{metric_name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    async def save(
+        self,
+        report_path: Path = RUN_REPORT_FILE,
+        metrics_path: Path = METRICS_FILE,
+    ):
+        """Write the JSON run report and the Prometheus textfile."""
+        report = self.report()
+        await utils.write_json(report_path, report)
+        await utils.write_text(metrics_path, self.prometheus(report))
+
+        for stage, entry in report["stages"].items():
+            logger.debug(
+                f"{stage}: {entry['samples']} samples, "
+                f"{entry['total_seconds']:.3f}s total, "
+                f"p50 {entry['p50_seconds'] * 1000:.1f}ms, "
+                f"p95 {entry['p95_seconds'] * 1000:.1f}ms"
+            )
+        logger.info(f"Run report written to {report_path}")
+
+
+metrics = RunMetrics()
@@ -1,10 +1,12 @@
 import re
 import unicodedata
 from dataclasses import dataclass, field
+from typing import Self
 from urllib.parse import unquote, urlparse
 
 # Sanitize the 'name' to ensure it's a valid Windows directory name
 INVALID_CHARS_PATTERN = r'[<>:"/\\|?*\x00-\x1f]|\.$'
+INVALID_CHARS_REGEX = re.compile(INVALID_CHARS_PATTERN)
 
 type CraftEssenceDataIndexed = dict[int, CraftEssenceData]
 type ServantDataIndexed = dict[int, ServantData]
@@ -19,6 +21,9 @@ def _preprocess_name(input_str) -> str:
     Returns:
         The string with accents removed.
     """
+    if input_str.isascii():
+        return input_str
+
     nfkd_form = unicodedata.normalize("NFKD", input_str)
     only_ascii = "".join([c for c in nfkd_form if not unicodedata.combining(c)])
     return only_ascii
@@ -34,11 +39,11 @@ def _cleanup_name(name: str) -> str:
         str: The cleaned-up name.
     """
     sanitized_name = _preprocess_name(name)
-    sanitized_name = re.sub(INVALID_CHARS_PATTERN, " ", sanitized_name)
+    sanitized_name = INVALID_CHARS_REGEX.sub(" ", sanitized_name)
     return sanitized_name.strip()
 
 
-@dataclass
+@dataclass(slots=True)
 class Assets:
     """
     Class representing an asset.
@@ -64,29 +69,65 @@ class Assets:
         path = urlparse(self.url).path
         return unquote(path.split("/")[-1])
 
+    @property
+    def file_name(self) -> str:
+        """
+        Get the file name the asset is downloaded to.
+
+        Returns:
+            str: The file name, prefixed with the asset key.
+        """
+        return f"{self.key}-{self.url_file_name}"
+
 
-@dataclass
+@dataclass(slots=True)
 class BaseData:
     idx: int
     name: str
     rarity: int
     assets: list[Assets] = field(default_factory=list)
+    # The sanitized name and the name it was computed from, not serialized
+    _sanitized_name: str = field(default="", init=False, repr=False, compare=False)
+    _sanitized_from: str = field(default="", init=False, repr=False, compare=False)
 
     def __post_init__(self):
         """
-        Post-initialization processing to ensure the name is sanitized.
+        Post-initialization processing to ensure the name is sanitized, and
+        to compute the sanitized name once.
         """
         self.name = _cleanup_name(self.name)
+        self._sanitized_name = _cleanup_name(self.name)
+        self._sanitized_from = self.name
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Self:
+        """
+        Create the data from its JSON representation.
+
+        Args:
+            data (dict): The data, with the assets as dictionaries.
+
+        Returns:
+            Self: The data, with the assets converted to `Assets`.
+        """
+        assets = [Assets(**asset) for asset in data.get("assets", [])]
+        return cls(**{**data, "assets": assets})
 
     @property
     def sanitized_name(self):
         """
         Get the sanitized name of the craft essence.
 
+        It is computed once per instance, and again only if the name was
+        reassigned.
+
         Returns:
             str: The sanitized name of the craft essence.
         """
-        return _cleanup_name(self.name)
+        if self._sanitized_from is not self.name:
+            self._sanitized_name = _cleanup_name(self.name)
+            self._sanitized_from = self.name
+        return self._sanitized_name
 
     @property
     def is_empty(self):
@@ -99,11 +140,11 @@ class BaseData:
         return len(self.assets) == 0
 
 
-@dataclass
+@dataclass(slots=True)
 class ServantData(BaseData):
     class_name: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class CraftEssenceData(BaseData):
     pass
@@ -0,0 +1,167 @@
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from loguru import logger
+
+import utils
+from constants import NEGATIVE_CACHE_FILE
+from metrics import metrics
+from models import Assets
+
+# Time a permanently failing URL is skipped before it is tried again
+NEGATIVE_TTL = float(os.getenv("FGA_NEGATIVE_TTL_HOURS", "168")) * 60 * 60
+
+# Number of TTLs an expired URL is kept for, so a URL failing again keeps
+# its count, while URLs gone from the exports are eventually dropped
+RETENTION_TTLS = 4
+
+
+@dataclass(slots=True)
+class FailedUrl:
+    """
+    A URL that failed permanently.
+
+    Attributes:
+        status (int): The HTTP status of the last failure.
+        first_failed (float): The time of the first failure, in seconds
+            since the epoch.
+        last_failed (float): The time of the last failure, in seconds since
+            the epoch. The URL is skipped until `last_failed + ttl`.
+        failures (int): The number of times the URL failed, once per TTL.
+    """
+
+    status: int
+    first_failed: float
+    last_failed: float
+    failures: int = 1
+
+
+class NegativeCache:
+    """
+    Asset URLs that failed permanently, skipped until their TTL expires.
+    An expired URL is tried again, and forgotten once it downloads.
+
+    Without it, an asset gone from the CDN makes its entity differ from the
+    export on every run, so the entity is processed again and the URL
+    retried forever. The diff and the scheduling only consider the assets
+    not known to fail.
+
+    Attributes:
+        path (Path): The path to the negative cache file.
+        ttl (float): The seconds a failed URL is skipped for.
+        entries (dict[str, FailedUrl]): The failed URLs.
+        failed (set[str]): The URLs that failed in the current run.
+        skipped (set[str]): The URLs skipped in the current run.
+    """
+
+    def __init__(self, path: Path, ttl: float = NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries: dict[str, FailedUrl] = {}
+        self.failed: set[str] = set()
+        self.skipped: set[str] = set()
+
+    def is_failed(self, url: str) -> bool:
+        entry = self.entries.get(url)
+        return entry is not None and time.time() < entry.last_failed + self.ttl
+
+    def record(self, url: str, status: int):
+        """Record a permanent failure of a URL."""
+        now = time.time()
+        entry = self.entries.get(url)
+        if entry is None:
+            self.entries[url] = FailedUrl(status, now, now)
+        elif url not in self.failed:
+            entry.status = status
+            entry.last_failed = now
+            entry.failures += 1
+        self.failed.add(url)
+
+    def forget(self, url: str):
+        """Forget a URL that downloaded again."""
+        if self.entries.pop(url, None) is not None:
+            logger.info(f"Asset downloaded again after failing: {url}")
+
+    def filter(self, assets: list[Assets]) -> list[Assets]:
+        """Get the assets whose URL is not known to fail."""
+        return [asset for asset in assets if not self.is_failed(asset.url)]
+
+    def skip(self, assets: list[Assets]) -> list[Assets]:
+        """
+        Get the assets to download, recording the skipped ones.
+
+        Args:
+            assets (list[Assets]): The assets of an entity.
+
+        Returns:
+            list[Assets]: The assets whose URL is not known to fail.
+        """
+        scheduled = self.filter(assets)
+        if len(scheduled) != len(assets):
+            skipped = {asset.url for asset in assets} - {a.url for a in scheduled}
+            for url in skipped:
+                logger.debug(f"Skipping permanently failing asset: {url}")
+            self.skipped |= skipped
+        return scheduled
+
+    def prune(self) -> int:
+        """
+        Forget the URLs that expired `RETENTION_TTLS` TTLs ago.
+
+        Returns:
+            int: The number of forgotten URLs.
+        """
+        cutoff = time.time() - self.ttl * RETENTION_TTLS
+        pruned = [url for url, e in self.entries.items() if e.last_failed < cutoff]
+        for url in pruned:
+            del self.entries[url]
+        return len(pruned)
+
+    def report(self):
+        """Log the permanently failing URLs of the run and publish the counts."""
+        for url in sorted(self.failed):
+            entry = self.entries[url]
+            logger.warning(
+                f"Asset failed with {entry.status} in {entry.failures} runs, "
+                f"skipped for {self.ttl / 3600:.0f}h: {url}"
+            )
+        if self.failed or self.skipped:
+            logger.info(
+                f"{len(self.failed)} asset URLs failed permanently, "
+                f"{len(self.skipped)} known failing URLs skipped, "
+                f"{len(self.entries)} in the negative cache."
+            )
+
+        metrics.gauge("negative_cache_failed", len(self.failed))
+        metrics.gauge("negative_cache_skipped", len(self.skipped))
+        metrics.gauge("negative_cache_urls", len(self.entries))
+
+    async def load(self):
+        if not self.path.exists():
+            return
+
+        raw_data: dict | None = await utils.read_json(self.path)
+        if raw_data is None:
+            return
+
+        try:
+            self.entries = {url: FailedUrl(**entry) for url, entry in raw_data.items()}
+        except TypeError as e:
+            logger.warning(f"Ignoring invalid negative cache: {e}")
+            self.entries = {}
+
+        self.prune()
+
+    async def save(self):
+        if self.entries or self.path.exists():
+            await utils.write_json(
+                self.path,
+                {url: asdict(entry) for url, entry in self.entries.items()},
+            )
+        self.failed = set()
+        self.skipped = set()
+
+
+negative_cache = NegativeCache(NEGATIVE_CACHE_FILE)
@@ -0,0 +1,371 @@
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+from constants import ASSET_PACK_FILE, ASSET_PACK_INDEX_FILE, TMP_DIR
+from enums import SupportKind
+from region import REGIONS
+
+# `files` keeps every asset in its own file, `pack` appends them to the pack
+CACHE_BACKEND = os.getenv("FGA_CACHE_BACKEND", "files")
+
+# Every record is the key length and the data length, then the key and data
+HEADER = struct.Struct("<IQ")
+
+# Data length of a record deleting its key
+TOMBSTONE = 2**64 - 1
+
+
+def _split(key: str) -> tuple[str, str]:
+    directory, _, name = key.rpartition("/")
+    return directory, name
+
+
+class AssetPack:
+    """
+    Assets appended to a single pack file and read through a memory map.
+
+    The pack is the source of truth: every record carries its key and a
+    deleted key is a tombstone record, so the index can always be rebuilt by
+    scanning the pack. The saved index only spares the scan of the records
+    written before it was saved. The space of the deleted and replaced
+    records is reclaimed by `compact`.
+
+    The keys are the asset paths relative to `root`, so an asset has the
+    same key as the path it has with the file backend.
+
+    Attributes:
+        path (Path): The path to the pack file.
+        index_path (Path): The path to the saved index.
+        root (Path): The directory the keys are relative to.
+        directories (tuple[Path, ...]): The directories whose assets are
+            kept in the pack.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        index_path: Path,
+        root: Path,
+        directories: tuple[Path, ...],
+    ):
+        self.path = path
+        self.index_path = index_path
+        self.root = root
+        self.directories = directories
+
+        self._index: dict[str, tuple[int, int]] | None = None
+        self._children: dict[str, dict[str, int]] = {}
+        self._size = 0
+        self._dead = 0
+        self._map: mmap.mmap | None = None
+        self._lock = threading.RLock()
+
+    def key_for(self, file_path: Path) -> str | None:
+        """Get the key of a path, None if it is not kept in the pack."""
+        if not any(file_path.is_relative_to(d) for d in self.directories):
+            return None
+        return file_path.relative_to(self.root).as_posix()
+
+    def _ensure_loaded(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._load()
+
+    @property
+    def index(self) -> dict[str, tuple[int, int]]:
+        self._ensure_loaded()
+        assert self._index is not None
+        return self._index
+
+    def _load(self):
+        self._index = {}
+        self._children = {}
+        self._size = 0
+        self._dead = 0
+
+        pack_size = self.path.stat().st_size if self.path.exists() else 0
+        if pack_size and self.index_path.exists():
+            try:
+                saved = orjson.loads(self.index_path.read_bytes())
+                if saved["size"] <= pack_size:
+                    for key, (offset, length) in saved["entries"].items():
+                        self._set(key, offset, length)
+                    self._size = saved["size"]
+                    self._dead = saved["dead"]
+            except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Rebuilding the invalid asset pack index: {e}")
+                self._index = {}
+                self._children = {}
+
+        if self._size < pack_size:
+            self._scan(pack_size)
+
+    def _scan(self, end: int):
+        """Index the records written after the saved index."""
+        offset = self._size
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while offset + HEADER.size <= end:
+                key_length, data_length = HEADER.unpack(f.read(HEADER.size))
+                data_offset = offset + HEADER.size + key_length
+                if data_offset > end:
+                    break
+                key = f.read(key_length).decode()
+
+                if data_length == TOMBSTONE:
+                    self._forget(key)
+                    offset = data_offset
+                    continue
+
+                if data_offset + data_length > end:
+                    break
+
+                self._forget(key)
+                self._set(key, data_offset, data_length)
+                f.seek(data_length, os.SEEK_CUR)
+                offset = data_offset + data_length
+
+        if offset < end:
+            # The record of an interrupted write
+            logger.warning(f"Truncating {end - offset} bytes of a partial record.")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+        self._size = offset
+
+    def _set(self, key: str, offset: int, length: int):
+        assert self._index is not None
+        self._index[key] = (offset, length)
+        directory, name = _split(key)
+        self._children.setdefault(directory, {})[name] = length
+
+    def _forget(self, key: str):
+        assert self._index is not None
+        previous = self._index.pop(key, None)
+        if previous is None:
+            return
+
+        self._dead += previous[1]
+        directory, name = _split(key)
+        children = self._children[directory]
+        del children[name]
+        if not children:
+            del self._children[directory]
+
+    def _append(self, key: str, data: bytes | None):
+        encoded_key = key.encode()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(
+                HEADER.pack(len(encoded_key), TOMBSTONE if data is None else len(data))
+            )
+            f.write(encoded_key)
+            if data is not None:
+                f.write(data)
+
+        data_offset = self._size + HEADER.size + len(encoded_key)
+        self._forget(key)
+        if data is None:
+            self._size = data_offset
+        else:
+            self._set(key, data_offset, len(data))
+            self._size = data_offset + len(data)
+
+    def size_of(self, key: str) -> int | None:
+        """Get the size of the data of a key, None if it is not in the pack."""
+        entry = self.index.get(key)
+        return entry[1] if entry is not None else None
+
+    def listdir(self, directory: str) -> dict[str, int]:
+        """Get the file names and sizes below a directory key."""
+        self._ensure_loaded()
+        return dict(self._children.get(directory, {}))
+
+    def subdirectories(self, directory: str) -> list[str]:
+        """Get the names of the directories right below a directory key."""
+        self._ensure_loaded()
+        return sorted(
+            _split(key)[1] for key in self._children if _split(key)[0] == directory
+        )
+
+    def put(self, key: str, data: bytes):
+        """Append the data of a key, replacing its previous data."""
+        with self._lock:
+            self._ensure_loaded()
+            self._append(key, data)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self.index:
+                self._append(key, None)
+
+    def delete_directory(self, directory: str) -> int:
+        """
+        Delete every key below a directory key.
+
+        Returns:
+            int: The bytes deleted.
+        """
+        deleted = 0
+        with self._lock:
+            for name, size in self.listdir(directory).items():
+                self._append(f"{directory}/{name}", None)
+                deleted += size
+        return deleted
+
+    def get(self, key: str) -> memoryview | None:
+        """
+        Get the data of a key as a view of the memory-mapped pack, without
+        copying it.
+        """
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+
+        offset, length = entry
+        if length == 0:
+            return memoryview(b"")
+
+        with self._lock:
+            if self._map is None or len(self._map) < offset + length:
+                # The pack grew since it was mapped, the previous map is
+                # released once the views handed out from it are gone
+                with open(self.path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._map)[offset : offset + length]
+
+    @property
+    def live_bytes(self) -> int:
+        return sum(length for _, length in self.index.values())
+
+    @property
+    def dead_bytes(self) -> int:
+        self._ensure_loaded()
+        return self._dead
+
+    def flush(self):
+        """Save the index, so the next run does not scan the pack."""
+        with self._lock:
+            if self._index is None:
+                return
+
+            temp_path = self.index_path.with_name(f"{self.index_path.name}.part")
+            temp_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_bytes(
+                orjson.dumps(
+                    {"size": self._size, "dead": self._dead, "entries": self._index}
+                )
+            )
+            temp_path.replace(self.index_path)
+
+    def compact(self) -> int:
+        """
+        Rewrite the pack with only the live records, ordered by key so the
+        assets of an entity are contiguous.
+
+        Returns:
+            int: The bytes reclaimed.
+        """
+        with self._lock:
+            index = self.index
+            if not self.path.exists():
+                return 0
+
+            before = self._size
+            temp_path = self.path.with_name(f"{self.path.name}.part")
+            entries: list[tuple[str, int, int]] = []
+
+            offset = 0
+            with open(self.path, "rb") as source, open(temp_path, "wb") as f:
+                for key in sorted(index):
+                    data_offset, length = index[key]
+                    source.seek(data_offset)
+                    encoded_key = key.encode()
+                    f.write(HEADER.pack(len(encoded_key), length))
+                    f.write(encoded_key)
+                    f.write(source.read(length))
+                    offset += HEADER.size + len(encoded_key)
+                    entries.append((key, offset, length))
+                    offset += length
+
+            self._map = None
+            temp_path.replace(self.path)
+
+            self._index = {}
+            self._children = {}
+            for key, data_offset, length in entries:
+                self._set(key, data_offset, length)
+            self._size = offset
+            self._dead = 0
+            self.flush()
+
+        logger.info(
+            f"Compacted the asset pack from {before / 1024 / 1024:.1f} MiB "
+            f"to {offset / 1024 / 1024:.1f} MiB."
+        )
+        return before - offset
+
+    def import_files(self) -> int:
+        """
+        Move the asset files of the file backend into the pack.
+
+        Returns:
+            int: The number of files moved.
+        """
+        moved = 0
+        for directory in self.directories:
+            if not directory.exists():
+                continue
+
+            for file_path in sorted(directory.rglob("*")):
+                if not file_path.is_file():
+                    continue
+                key = self.key_for(file_path)
+                if key is None:
+                    continue
+                self.put(key, file_path.read_bytes())
+                file_path.unlink()
+                moved += 1
+
+            for sub_directory in sorted(directory.rglob("*"), reverse=True):
+                if sub_directory.is_dir() and not any(sub_directory.iterdir()):
+                    sub_directory.rmdir()
+
+        if moved:
+            logger.info(f"Moved {moved} asset files into the asset pack.")
+        return moved
+
+
+def packed(file_path: Path) -> tuple[AssetPack, str] | None:
+    """
+    Get the asset pack and the key of a path kept in it.
+
+    Args:
+        file_path (Path): The path of an asset or an asset directory.
+
+    Returns:
+        tuple[AssetPack, str] | None: The pack and the key, None if the path
+            is kept on disk.
+    """
+    if asset_pack is None:
+        return None
+    key = asset_pack.key_for(file_path)
+    return None if key is None else (asset_pack, key)
+
+
+asset_pack: AssetPack | None = (
+    AssetPack(
+        ASSET_PACK_FILE,
+        ASSET_PACK_INDEX_FILE,
+        TMP_DIR,
+        tuple(region.temp_dir(kind) for region in REGIONS for kind in SupportKind),
+    )
+    if CACHE_BACKEND == "pack"
+    else None
+)
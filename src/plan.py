@@ -0,0 +1,162 @@
+from collections.abc import AsyncIterable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+from enums import SupportKind
+from history import KindHistory
+from models import Assets, BaseData
+from negative import negative_cache
+from store import LocalDataStore
+from utils import is_downloaded
+
+
+@dataclass(slots=True)
+class PlanEntry:
+    """
+    The changes a run would make for a single entity.
+
+    Attributes:
+        idx (int): The index of the entity.
+        name (str): The sanitized name of the entity.
+        new (bool): True if the entity is not in the local data yet.
+        render (bool): True if the support images would be created.
+        downloads (list[Assets]): The assets that are not cached yet.
+        renamed_from (str | None): The previous name, if it changed.
+    """
+
+    idx: int
+    name: str
+    new: bool = False
+    render: bool = False
+    downloads: list[Assets] = field(default_factory=list)
+    renamed_from: str | None = None
+
+
+@dataclass(slots=True)
+class KindPlan:
+    """
+    The change set a run would make for a kind.
+
+    Attributes:
+        kind (SupportKind): The kind of the entities.
+        entries (list[PlanEntry]): The entities that would change.
+        deletes (list[int]): The local entries that are gone from the export.
+        total (int): The number of entities in the export.
+    """
+
+    kind: SupportKind
+    entries: list[PlanEntry] = field(default_factory=list)
+    deletes: list[int] = field(default_factory=list)
+    total: int = 0
+
+    @property
+    def downloads(self) -> list[Assets]:
+        return [asset for entry in self.entries for asset in entry.downloads]
+
+    @property
+    def renders(self) -> list[PlanEntry]:
+        return [entry for entry in self.entries if entry.render]
+
+    @property
+    def renames(self) -> list[PlanEntry]:
+        return [entry for entry in self.entries if entry.renamed_from is not None]
+
+    @property
+    def syncs(self) -> int:
+        """The number of entity directories copied to the repository."""
+        # Both the gray and the color output of every changed entity
+        return len(self.entries) * 2
+
+    def estimated_bytes(self, history: KindHistory) -> int:
+        return round(len(self.downloads) * history.asset_bytes)
+
+    def estimated_render_seconds(self, history: KindHistory) -> float:
+        return len(self.renders) * history.render_seconds
+
+
+async def build_plan[T: BaseData](
+    kind: SupportKind,
+    latest_data_list: AsyncIterable[T],
+    local_data: LocalDataStore[T],
+    temp_dir: Path,
+) -> KindPlan:
+    """
+    Compute the change set of a run over every entity, mirroring the
+    decisions of `data._process_generic_data` without the network or writes.
+
+    Args:
+        kind (SupportKind): The kind of the entities.
+        latest_data_list (AsyncIterable[T]): The latest data.
+        local_data (LocalDataStore[T]): The local data.
+        temp_dir (Path): The directory of the downloaded assets.
+
+    Returns:
+        KindPlan: The change set.
+    """
+    plan = KindPlan(kind=kind)
+    latest_indices: set[int] = set()
+
+    async for latest_data in latest_data_list:
+        plan.total += 1
+        latest_indices.add(latest_data.idx)
+
+        local_entry = await local_data.get(latest_data.idx)
+        entry = PlanEntry(idx=latest_data.idx, name=latest_data.sanitized_name)
+
+        if local_entry is None:
+            entry.new = True
+            entry.render = True
+        else:
+            if local_entry.sanitized_name != latest_data.sanitized_name:
+                entry.renamed_from = local_entry.sanitized_name
+            expected = negative_cache.filter(latest_data.assets)
+            if len(local_entry.assets) != len(expected):
+                entry.render = True
+
+        if not entry.render and entry.renamed_from is None:
+            continue
+
+        if entry.render:
+            download_dir = temp_dir / f"{latest_data.idx:04d}"
+            entry.downloads = [
+                asset
+                for asset in negative_cache.filter(latest_data.assets)
+                if not is_downloaded(download_dir / asset.file_name)
+            ]
+
+        plan.entries.append(entry)
+
+    if latest_indices:
+        plan.deletes = sorted(await local_data.indices() - latest_indices)
+
+    return plan
+
+
+def log_plan(plan: KindPlan, history: KindHistory):
+    """Log the change set of a kind."""
+    name = plan.kind.value
+
+    for entry in plan.entries:
+        status = "new" if entry.new else "changed" if entry.render else "renamed"
+        logger.info(f"{name} {entry.idx:04d} {entry.name} - {status}")
+        if entry.renamed_from is not None:
+            logger.info(f"    rename: {entry.renamed_from} -> {entry.name}")
+        for asset in entry.downloads:
+            logger.info(f"    download: {asset.url}")
+
+    for idx in plan.deletes:
+        logger.info(f"{name} {idx:04d} - removed from the export")
+
+    estimated_bytes = plan.estimated_bytes(history)
+    estimated_seconds = plan.estimated_render_seconds(history)
+    logger.info(
+        f"{name.upper()} plan: {plan.total} entities, "
+        f"{len(plan.downloads)} downloads (~{estimated_bytes / 1024:.1f} KiB), "
+        f"{len(plan.renders)} renders (~{estimated_seconds:.1f}s), "
+        f"{len(plan.renames)} renames, {len(plan.deletes)} deletes, "
+        f"{plan.syncs} directory syncs"
+    )
+    if history.downloads == 0 or history.renders == 0:
+        logger.info(f"{name.upper()} has no previous runs, estimates are partial.")
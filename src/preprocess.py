@@ -1,178 +1,399 @@
-import os
-from collections.abc import Callable, Coroutine
+import hashlib
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from itertools import pairwise
 from pathlib import Path
-from typing import Any
 
+import orjson
 from loguru import logger
 
 import utils
-from constants import (
-    LOCAL_CE_DATA,
-    LOCAL_SERVANT_DATA,
-    REMOTE_CE_DATA,
-    REMOTE_SERVANT_DATA,
-)
+from constants import SNAPSHOT_DIR
+from enums import SupportKind
+from metrics import Stage, metrics
 from models import (
     Assets,
     BaseData,
     CraftEssenceData,
     ServantData,
 )
+from region import PRIMARY_REGION, Region
+from store import LocalDataStore
 
-type T = BaseData
-IndexedT = dict[int, T]
-
-SERVANT_URL: str | None = os.getenv("SERVANT_URL", None)
-CE_URL: str | None = os.getenv("CE_URL", None)
+# Bump when the preprocessing output changes, to invalidate old snapshots
+SNAPSHOT_VERSION = 1
 
 
-async def fetch_local_ce_data() -> IndexedT:
+async def fetch_local_ce_data(
+    region: Region = PRIMARY_REGION,
+) -> LocalDataStore[CraftEssenceData]:
     return await _fetch_local_data(
-        name="craft essence",
-        local_data_path=LOCAL_CE_DATA,
+        name=f"{region.code} craft essence",
+        local_data_path=region.local_data(SupportKind.CRAFT_ESSENCE),
         class_type=CraftEssenceData,
+        legacy_data_path=region.legacy_local_data(SupportKind.CRAFT_ESSENCE),
     )
 
 
-async def fetch_local_servant_data() -> IndexedT:
+async def fetch_local_servant_data(
+    region: Region = PRIMARY_REGION,
+) -> LocalDataStore[ServantData]:
     return await _fetch_local_data(
-        name="servant",
-        local_data_path=LOCAL_SERVANT_DATA,
+        name=f"{region.code} servant",
+        local_data_path=region.local_data(SupportKind.SERVANT),
         class_type=ServantData,
+        legacy_data_path=region.legacy_local_data(SupportKind.SERVANT),
     )
 
 
-async def _fetch_local_data[T](
+async def _fetch_local_data[T: BaseData](
     name: str,
     local_data_path: Path,
     class_type: type[T],
-) -> dict[int, T]:
+    legacy_data_path: Path | None = None,
+) -> LocalDataStore[T]:
     """
-    Fetch local data from a JSON file. And then convert it to a dictionary
-    with the index as the key and the class as the value.
+    Open the local data store. The shards are loaded lazily, when the
+    records are first requested.
 
     Args:
         name (str): The name of the data.
-        local_data_path (Path): The path to the local data file.
+        local_data_path (Path): The path to the local data shard directory.
         class_type (type[T]): The class type to convert the data to.
+        legacy_data_path (Path | None): The single-file local data to migrate.
     """
     logger.info(f"Fetching local {name} data...")
 
-    if not local_data_path.exists():
-        logger.warning(f"Local {name} data file does not exist.")
-        return {}
+    if not local_data_path.exists() and not (
+        legacy_data_path is not None and legacy_data_path.exists()
+    ):
+        logger.warning(f"Local {name} data does not exist.")
+
+    return LocalDataStore(
+        name=name,
+        root=local_data_path,
+        class_type=class_type,
+        legacy_path=legacy_data_path,
+    )
 
-    # Read local craft essence data
-    raw_data: list[dict] | None = await utils.read_json(local_data_path)
-    if raw_data is None:
-        logger.error(f"Failed to read local {name} data.")
-        return {}
 
-    try:
-        data = {item["idx"]: class_type(**item) for item in raw_data}
-
-        return data
-    except KeyError as e:
-        logger.error(f"Key error while processing local {name} data: {e}")
-        return {}
-    except TypeError as e:
-        logger.error(f"Type error while processing local {name} data: {e}")
-        return {}
-    except Exception as e:
-        logger.error(f"Unexpected error while processing local {name} data: {e}")
-        return {}
-
-
-async def process_craft_essence() -> list[CraftEssenceData]:
-    if not CE_URL:
-        logger.error("Craft essence URL is not set.")
-        return []
+async def process_craft_essence(
+    region: Region = PRIMARY_REGION,
+) -> AsyncIterator[CraftEssenceData]:
+    url = region.url(SupportKind.CRAFT_ESSENCE)
+    if not url:
+        logger.error(f"{region.code} craft essence URL is not set.")
+        return
 
-    ce_data = await _process_data(
-        name="ce",
-        url=CE_URL,
-        save_data_path=REMOTE_CE_DATA,
+    count = 0
+    async for ce_data in _process_data(
+        name=region.key(SupportKind.CRAFT_ESSENCE),
+        url=url,
+        save_data_path=region.remote_data(SupportKind.CRAFT_ESSENCE),
         preprocess_func=_preprocess_ce,
-    )
-    if not ce_data:
-        logger.error("Failed to process craft essence data.")
-        return []
+        class_type=CraftEssenceData,
+    ):
+        count += 1
+        yield ce_data
 
-    return ce_data
+    if count == 0:
+        logger.error(f"Failed to process {region.code} craft essence data.")
 
 
-async def process_servant() -> list[ServantData]:
-    if not SERVANT_URL:
-        logger.error("Servant URL is not set.")
-        return []
+async def process_servant(
+    region: Region = PRIMARY_REGION,
+) -> AsyncIterator[ServantData]:
+    url = region.url(SupportKind.SERVANT)
+    if not url:
+        logger.error(f"{region.code} servant URL is not set.")
+        return
 
-    servant_data = await _process_data(
-        name="servant",
-        url=SERVANT_URL,
-        save_data_path=REMOTE_SERVANT_DATA,
+    count = 0
+    async for servant_data in _process_data(
+        name=region.key(SupportKind.SERVANT),
+        url=url,
+        save_data_path=region.remote_data(SupportKind.SERVANT),
+        preprocess_func=_preprocess_servant,
+        class_type=ServantData,
+    ):
+        count += 1
+        yield servant_data
+
+    if count == 0:
+        logger.error(f"Failed to process {region.code} servant data.")
+
+
+async def load_cached_craft_essence(
+    write_snapshot: bool = False,
+    region: Region = PRIMARY_REGION,
+) -> AsyncIterator[CraftEssenceData]:
+    """Load the last downloaded craft essence export without the network."""
+    async for ce_data in _load_cached_data(
+        name=region.key(SupportKind.CRAFT_ESSENCE),
+        save_data_path=region.remote_data(SupportKind.CRAFT_ESSENCE),
+        preprocess_func=_preprocess_ce,
+        class_type=CraftEssenceData,
+        write_snapshot=write_snapshot,
+    ):
+        yield ce_data
+
+
+async def load_cached_servant(
+    write_snapshot: bool = False,
+    region: Region = PRIMARY_REGION,
+) -> AsyncIterator[ServantData]:
+    """Load the last downloaded servant export without the network."""
+    async for servant_data in _load_cached_data(
+        name=region.key(SupportKind.SERVANT),
+        save_data_path=region.remote_data(SupportKind.SERVANT),
         preprocess_func=_preprocess_servant,
+        class_type=ServantData,
+        write_snapshot=write_snapshot,
+    ):
+        yield servant_data
+
+
+async def _load_cached_data[T: BaseData](
+    name: str,
+    save_data_path: Path,
+    preprocess_func: Callable[[list[dict]], AsyncIterator[T]],
+    class_type: type[T],
+    write_snapshot: bool = False,
+) -> AsyncIterator[T]:
+    """
+    Load the last downloaded export, or the last snapshot if the export
+    itself is gone.
+
+    Args:
+        name (str): The name of the data.
+        save_data_path (Path): The path the export was saved to.
+        preprocess_func (Callable): The function to preprocess the data.
+        class_type (type[T]): The class type of the processed data.
+        write_snapshot (bool): Whether to save the snapshot on a miss.
+    """
+    if save_data_path.exists():
+        async for item in _load_export(
+            name,
+            save_data_path,
+            preprocess_func,
+            class_type,
+            write_snapshot=write_snapshot,
+        ):
+            yield item
+        return
+
+    snapshot_data = await _read_snapshot(
+        SNAPSHOT_DIR / f"{name}.json", None, class_type
     )
-    if not servant_data:
-        logger.error("Failed to process servant data.")
-        return []
+    if not snapshot_data:
+        logger.error(f"No downloaded {name} export or snapshot found.")
+        return
 
-    return servant_data
+    logger.warning(f"No downloaded {name} export, using the last snapshot.")
+    for item in snapshot_data:
+        yield item
 
 
-async def _process_data[T](
+async def _process_data[T: BaseData](
     name: str,
     url: str,
     save_data_path: Path,
-    preprocess_func: Callable[[list[dict]], Coroutine[Any, Any, list[T]]],
-) -> list[T]:
+    preprocess_func: Callable[[list[dict]], AsyncIterator[T]],
+    class_type: type[T],
+) -> AsyncIterator[T]:
     """
     Fetch and process data from a URL, and save it to a local file.
 
+    The entries are yielded as they are produced, so the consumer can start
+    working on them before the whole export is processed.
+
+    If the downloaded export is byte-for-byte the same as the one the last
+    snapshot was built from, the snapshot is loaded instead of preprocessing.
+
     Args:
         name (str): The name of the data.
         url (str): The URL to fetch the data from.
         save_data_path (Path): The path to save the processed data.
         preprocess_func (Callable): The function to preprocess the data.
+        class_type (type[T]): The class type of the processed data.
     """
     logger.info(f"Processing {name} data...")
 
     if not url:
         logger.error(f"{name} URL is not set.")
-        return []
+        return
 
     # Download data
+    start = time.perf_counter()
     file_path = await utils.download_file(
         url=url,
         file_path=save_data_path,
     )
     if not file_path:
         logger.error(f"Failed to download {name} data.")
-        return []
+        return
+    metrics.record(
+        Stage.EXPORT_FETCH,
+        time.perf_counter() - start,
+        nbytes=file_path.stat().st_size,
+    )
+
+    async for item in _load_export(name, file_path, preprocess_func, class_type):
+        yield item
+
+
+async def _load_export[T: BaseData](
+    name: str,
+    file_path: Path,
+    preprocess_func: Callable[[list[dict]], AsyncIterator[T]],
+    class_type: type[T],
+    write_snapshot: bool = True,
+) -> AsyncIterator[T]:
+    """
+    Load and preprocess an export that is already on disk.
+
+    Args:
+        name (str): The name of the data.
+        file_path (Path): The path to the export.
+        preprocess_func (Callable): The function to preprocess the data.
+        class_type (type[T]): The class type of the processed data.
+        write_snapshot (bool): Whether to save the snapshot on a miss.
+    """
+    # Only the time spent here is recorded, not the time spent by the consumer
+    start = time.perf_counter()
 
     # Read data
-    raw_data: list[dict] | None = await utils.read_json(file_path)
-    if raw_data is None:
+    raw_bytes = await utils.read_bytes(file_path)
+    if raw_bytes is None:
         logger.error(f"Failed to read {name} data.")
-        return []
+        return
+
+    export_hash = hashlib.blake2b(raw_bytes, digest_size=16).hexdigest()
+    snapshot_path = SNAPSHOT_DIR / f"{name}.json"
+
+    snapshot_data = await _read_snapshot(snapshot_path, export_hash, class_type)
+    if snapshot_data:
+        logger.info(f"{name} export unchanged, loaded {len(snapshot_data)} entries.")
+        metrics.record(
+            Stage.PREPROCESS,
+            time.perf_counter() - start,
+            items=len(snapshot_data),
+            nbytes=len(raw_bytes),
+        )
+        for item in snapshot_data:
+            yield item
+        return
+
+    try:
+        raw_data: list[dict] = orjson.loads(raw_bytes)
+    except orjson.JSONDecodeError as e:
+        logger.error(f"Error decoding {name} data: {e}")
+        return
+
+    elapsed = time.perf_counter() - start
+
+    # Serialized as produced, the consumer updates the yielded items
+    processed_data: list[orjson.Fragment] = []
+    resume = time.perf_counter()
+    async for item in preprocess_func(raw_data):
+        processed_data.append(orjson.Fragment(orjson.dumps(item)))
+        elapsed += time.perf_counter() - resume
+        yield item
+        resume = time.perf_counter()
+    elapsed += time.perf_counter() - resume
+
+    metrics.record(
+        Stage.PREPROCESS, elapsed, items=len(processed_data), nbytes=len(raw_bytes)
+    )
 
-    processed_data = await preprocess_func(raw_data)
     if not processed_data:
         logger.error(f"No {name} data found.")
-        return []
+        return
+
+    if not write_snapshot:
+        return
+
+    await utils.write_json(
+        snapshot_path,
+        {
+            "version": SNAPSHOT_VERSION,
+            "hash": export_hash,
+            "data": processed_data,
+        },
+        indent=False,
+    )
 
     logger.info(f"{name} data processed successfully.")
-    return processed_data
 
 
-async def _preprocess_ce(raw_data: list[dict]) -> list[CraftEssenceData]:
-    sorted_data = sorted(raw_data, key=lambda x: x["collectionNo"])
+async def _read_snapshot[T: BaseData](
+    snapshot_path: Path,
+    export_hash: str | None,
+    class_type: type[T],
+) -> list[T]:
+    """
+    Load the preprocessed snapshot if it was built from the same export.
 
-    ce_data_list: list[CraftEssenceData] = []
+    Args:
+        snapshot_path (Path): The path to the snapshot file.
+        export_hash (str | None): The hash of the downloaded export, or None
+            to accept the snapshot of any export.
+        class_type (type[T]): The class type to convert the data to.
 
-    for ce in sorted_data:
-        collectionNo = ce.get("collectionNo", 0)
-        if collectionNo == 0:
-            continue
+    Returns:
+        list[T]: The snapshot data, or an empty list on a miss.
+    """
+    if not snapshot_path.exists():
+        return []
+
+    snapshot: dict | None = await utils.read_json(snapshot_path)
+    if snapshot is None:
+        return []
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return []
+
+    if export_hash is not None and snapshot.get("hash") != export_hash:
+        return []
+
+    try:
+        return [class_type.from_dict(item) for item in snapshot["data"]]
+    except (KeyError, TypeError) as e:
+        logger.warning(f"Discarding invalid snapshot {snapshot_path.name}: {e}")
+        return []
+
+
+def _index_by_collection_no(raw_data: list[dict]) -> Iterator[dict]:
+    """
+    Iterate the export entries in `collectionNo` order, skipping entries
+    without a collection number.
+
+    The preprocessing depends on the order, e.g. the second servant with a
+    name gets the class suffix. The exports are already in order, so one
+    pass over the collection numbers checks it and the entries are yielded
+    without sorting. Only an export out of order is sorted first, stably so
+    duplicates keep their export order.
+
+    Args:
+        raw_data (list[dict]): The raw export data.
+
+    Returns:
+        Iterator[dict]: The entries in `collectionNo` order.
+    """
+    numbers = [n for entry in raw_data if (n := entry.get("collectionNo", 0))]
+    entries = raw_data
+    if any(a > b for a, b in pairwise(numbers)):
+        logger.warning("Export is not in collectionNo order, sorting it.")
+        entries = sorted(raw_data, key=lambda entry: entry.get("collectionNo", 0))
+
+    for entry in entries:
+        if entry.get("collectionNo", 0) != 0:
+            yield entry
+
+
+async def _preprocess_ce(raw_data: list[dict]) -> AsyncIterator[CraftEssenceData]:
+    for ce in _index_by_collection_no(raw_data):
+        collectionNo = ce["collectionNo"]
 
         name = ce.get("name", "")
 
@@ -202,25 +423,17 @@ async def _preprocess_ce(raw_data: list[dict]) -> list[CraftEssenceData]:
             rarity=rarity,
         )
 
-        ce_data_list.append(new_data)
+        yield new_data
 
-    return ce_data_list
-
-
-async def _preprocess_servant(raw_data: list[dict]) -> list[ServantData]:
-    sorted_data = sorted(raw_data, key=lambda x: x["collectionNo"])
-
-    servant_data_list: list[ServantData] = []
 
+async def _preprocess_servant(raw_data: list[dict]) -> AsyncIterator[ServantData]:
     # To prevent duplicate names
     name_cache = set()
 
     playable_type = {"heroine", "normal"}
 
-    for data in sorted_data:
-        collectionNo = data.get("collectionNo", 0)
-        if collectionNo == 0:
-            continue
+    for data in _index_by_collection_no(raw_data):
+        collectionNo = data["collectionNo"]
 
         # Skip if not a playable servant
         servant_type = data.get("type", None)
@@ -283,6 +496,4 @@ async def _preprocess_servant(raw_data: list[dict]) -> list[ServantData]:
             rarity=rarity,
             assets=assets,
         )
-        servant_data_list.append(servant_data)
-
-    return servant_data_list
+        yield servant_data
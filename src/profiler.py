@@ -0,0 +1,228 @@
+import asyncio
+import dis
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+from pathlib import Path
+from types import CodeType, FrameType
+
+from loguru import logger
+
+import utils
+from constants import PROFILE_FILE, PROFILE_SUMMARY_FILE
+
+# Seconds between samples, low enough for the overhead to stay negligible
+SAMPLE_INTERVAL = 0.005
+
+# Leaf added to the stacks of threads running native code, e.g. OpenCV
+NATIVE_FRAME = "[native]"
+
+# Module of the render functions run in the worker threads
+RENDER_MODULE = "image"
+
+
+@lru_cache(maxsize=4096)
+def _call_offsets(code: CodeType) -> frozenset[int]:
+    """Get the offsets of the call instructions of a code object."""
+    return frozenset(
+        instruction.offset
+        for instruction in dis.get_instructions(code)
+        if instruction.opname.startswith("CALL")
+    )
+
+
+def _frame_label(frame: FrameType) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_qualname}"
+
+
+def _thread_stack(frame: FrameType) -> list[str]:
+    """
+    Get the stack of a thread from the root frame to the leaf.
+
+    A leaf frame stopped on a call instruction is running native code, as a
+    call into Python would have pushed another frame.
+    """
+    stack: list[str] = []
+    if frame.f_lasti in _call_offsets(frame.f_code):
+        stack.append(NATIVE_FRAME)
+
+    current: FrameType | None = frame
+    while current is not None:
+        stack.append(_frame_label(current))
+        current = current.f_back
+
+    stack.reverse()
+    return stack
+
+
+def _await_chain(coro) -> list[str]:
+    """Get the chain of coroutines a task is awaiting, from the task down."""
+    chain: list[str] = []
+    while coro is not None:
+        code = (
+            getattr(coro, "cr_code", None)
+            or getattr(coro, "ag_code", None)
+            or getattr(coro, "gi_code", None)
+        )
+        if code is None:
+            break
+        chain.append(code.co_qualname)
+        coro = (
+            getattr(coro, "cr_await", None)
+            or getattr(coro, "ag_await", None)
+            or getattr(coro, "gi_yieldfrom", None)
+        )
+    return chain
+
+
+class SamplingProfiler:
+    """
+    Sample the stacks of every thread and the await chains of every task of
+    the event loop from a background thread.
+
+    The thread stacks are written as collapsed stacks, the input of
+    `flamegraph.pl` and speedscope. The task samples are summarized as the
+    wall time spent in every coroutine.
+
+    Attributes:
+        interval (float): The seconds between samples.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.coroutine_inclusive: Counter[str] = Counter()
+        self.coroutine_leaf: Counter[str] = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop | None = None):
+        self._loop = loop
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(own_ident, now - last)
+            last = now
+
+    def _sample(self, own_ident: int, wall: float):
+        self.samples += 1
+        self.elapsed += wall
+
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            thread_name = names.get(ident, f"thread-{ident}")
+            self.stacks[(thread_name, *_thread_stack(frame))] += 1
+
+        if self._loop is None:
+            return
+
+        try:
+            tasks = asyncio.all_tasks(self._loop)
+        except RuntimeError:
+            # The task set changed while it was copied, skip this sample
+            return
+
+        for task in tasks:
+            chain = _await_chain(task.get_coro())
+            if not chain:
+                continue
+            for name in set(chain):
+                self.coroutine_inclusive[name] += wall
+            self.coroutine_leaf[chain[-1]] += wall
+
+    def collapsed(self) -> str:
+        """Format the thread stacks as collapsed stacks, one per line."""
+        return "".join(
+            f"{';'.join(stack)} {count}\n"
+            for stack, count in sorted(self.stacks.items())
+        )
+
+    def summary(self) -> str:
+        """
+        Summarize the wall time of the coroutines and the split between
+        Python and native code of every thread and of the renders.
+        """
+        lines = [
+            f"{self.samples} samples over {self.elapsed:.1f}s, "
+            f"every {self.interval * 1000:.0f}ms",
+            "",
+            "Coroutine wall time (inclusive / awaiting at the leaf):",
+        ]
+        for name, seconds in self.coroutine_inclusive.most_common():
+            leaf = self.coroutine_leaf.get(name, 0.0)
+            lines.append(f"  {seconds:10.3f}s {leaf:10.3f}s  {name}")
+
+        thread_split: dict[str, Counter[str]] = {}
+        render_split: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            thread_name, *frames = stack
+            kind = "native" if frames and frames[-1] == NATIVE_FRAME else "python"
+            thread_split.setdefault(thread_name, Counter())[kind] += count
+            if any(frame.startswith(f"{RENDER_MODULE}:") for frame in frames):
+                render_split[kind] += count
+
+        lines += ["", "Thread samples (python / native):"]
+        for thread_name, split in sorted(thread_split.items()):
+            lines.append(f"  {split['python']:8d} {split['native']:8d}  {thread_name}")
+
+        total = render_split.total()
+        if total:
+            lines += [
+                "",
+                f"Render samples: {total}, "
+                f"{render_split['native'] / total:.1%} in native code, "
+                f"{render_split['python'] / total:.1%} in Python",
+            ]
+
+        return "\n".join(lines) + "\n"
+
+    async def save(
+        self,
+        collapsed_path: Path = PROFILE_FILE,
+        summary_path: Path = PROFILE_SUMMARY_FILE,
+    ):
+        await utils.write_text(collapsed_path, self.collapsed())
+        await utils.write_text(summary_path, self.summary())
+        logger.info(f"Profile written to {collapsed_path} and {summary_path}")
+
+
+async def run_profiled(func: Callable[..., Awaitable[None]], *args):
+    """
+    Run a coroutine function under the sampling profiler and save the
+    profile, even if it exits early.
+
+    Args:
+        func (Callable[..., Awaitable[None]]): The coroutine function.
+        *args: The arguments of the function.
+    """
+    profiler = SamplingProfiler()
+    profiler.start(asyncio.get_running_loop())
+    try:
+        await func(*args)
+    finally:
+        profiler.stop()
+        await profiler.save()
@@ -0,0 +1,211 @@
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, replace
+from functools import partial
+from pathlib import Path
+
+import cv2
+from anyio import CapacityLimiter, create_task_group, to_thread
+from loguru import logger
+
+from cache import asset_cache
+from enums import SupportKind
+from image import create_support_ce_img, create_support_servant_img
+from layout import layout
+from models import BaseData
+from preprocess import fetch_local_ce_data, fetch_local_servant_data
+from region import PRIMARY_REGION, REGIONS, Region
+from store import LocalDataStore
+from utils import file_size, is_downloaded
+
+
+class MissingAssetError(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class RebuildTarget:
+    kind: SupportKind
+    fetch_local_data: Callable[[], Awaitable[LocalDataStore]]
+    temp_dir: Path
+    output_dir_base: Path
+    output_color_dir_base: Path
+    repo_dir_base: Path
+    repo_color_dir_base: Path
+    image_creation_func: Callable[[Path, Path, Path], None]
+    output_image_filename: str
+    region: Region = PRIMARY_REGION
+
+
+def _targets(region: Region) -> list[RebuildTarget]:
+    servant = SupportKind.SERVANT
+    ce = SupportKind.CRAFT_ESSENCE
+    return [
+        RebuildTarget(
+            kind=servant,
+            fetch_local_data=partial(fetch_local_servant_data, region),
+            temp_dir=region.temp_dir(servant),
+            output_dir_base=region.output_dir(servant),
+            output_color_dir_base=region.output_dir(servant, color=True),
+            repo_dir_base=region.repo_dir(servant),
+            repo_color_dir_base=region.repo_dir(servant, color=True),
+            image_creation_func=create_support_servant_img,
+            output_image_filename="support.png",
+            region=region,
+        ),
+        RebuildTarget(
+            kind=ce,
+            fetch_local_data=partial(fetch_local_ce_data, region),
+            temp_dir=region.temp_dir(ce),
+            output_dir_base=region.output_dir(ce),
+            output_color_dir_base=region.output_dir(ce, color=True),
+            repo_dir_base=region.repo_dir(ce),
+            repo_color_dir_base=region.repo_dir(ce, color=True),
+            image_creation_func=create_support_ce_img,
+            output_image_filename="ce.png",
+            region=region,
+        ),
+    ]
+
+
+TARGETS = [target for region in REGIONS for target in _targets(region)]
+
+
+async def _collect(
+    target: RebuildTarget, only: set[int] | None = None
+) -> tuple[list[BaseData], list[Path]]:
+    """
+    Get every local entity of a target and the cached assets it is missing.
+    With `only`, just the entities with these indices.
+
+    Returns:
+        tuple[list[BaseData], list[Path]]: The entities to render and the
+            paths of the missing assets.
+    """
+    local_data = await target.fetch_local_data()
+
+    entities: list[BaseData] = []
+    missing: list[Path] = []
+    for idx in sorted(await local_data.indices()):
+        if only is not None and idx not in only:
+            continue
+
+        entity = await local_data.get(idx)
+        if entity is None:
+            continue
+
+        if entity.is_empty:
+            logger.warning(
+                f"{target.region.key(target.kind)} {idx:04d} {entity.name} "
+                "has no assets, skipping."
+            )
+            continue
+
+        download_dir = target.temp_dir / f"{idx:04d}"
+        for asset in entity.assets:
+            asset_path = download_dir / asset.file_name
+            if not is_downloaded(asset_path):
+                missing.append(asset_path)
+
+        entities.append(entity)
+
+    return entities, missing
+
+
+def _render(target: RebuildTarget, entity: BaseData):
+    directory_name = f"{entity.idx:04d}"
+    output_dir = layout.ensure(target.output_dir_base / directory_name)
+    output_color_dir = layout.ensure(target.output_color_dir_base / directory_name)
+
+    (output_dir / f"{entity.sanitized_name}.txt").touch(exist_ok=True)
+    (output_color_dir / f"{entity.sanitized_name}.txt").touch(exist_ok=True)
+
+    target.image_creation_func(
+        target.temp_dir / directory_name,
+        output_dir / target.output_image_filename,
+        output_color_dir / target.output_image_filename,
+    )
+
+
+async def offline_rebuild(
+    workers: int | None = None,
+    direct: bool = False,
+    only: dict[SupportKind, set[int]] | None = None,
+    region: Region | None = None,
+) -> int:
+    """
+    Re-render every local entity purely from the cached assets, without
+    any network calls.
+
+    Every asset is checked before rendering starts, so a missing asset fails
+    the rebuild before any output is written.
+
+    Args:
+        workers (int | None): The number of render threads, defaults to the
+            number of CPUs.
+        direct (bool): Render straight into the repository instead of the
+            output directory.
+        only (dict[SupportKind, set[int]] | None): Only render the entities
+            with these indices, by kind.
+        region (Region | None): Only render the entities of a region,
+            defaults to every region.
+
+    Returns:
+        int: The number of rendered entities.
+    """
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Rebuilding every output from the asset cache, {workers} workers.")
+
+    jobs: list[tuple[RebuildTarget, BaseData]] = []
+    missing: list[Path] = []
+    for target in TARGETS:
+        if region is not None and target.region != region:
+            continue
+        if direct:
+            target = replace(
+                target,
+                output_dir_base=target.repo_dir_base,
+                output_color_dir_base=target.repo_color_dir_base,
+            )
+        entities, target_missing = await _collect(
+            target, None if only is None else only.get(target.kind, set())
+        )
+        jobs.extend((target, entity) for entity in entities)
+        missing.extend(target_missing)
+
+    if missing:
+        for asset_path in missing:
+            logger.error(f"Missing cached asset: {asset_path}")
+        raise MissingAssetError(f"{len(missing)} cached assets are missing.")
+
+    # Parallelism comes from the render threads, not from OpenCV itself
+    cv2.setNumThreads(1)
+    limiter = CapacityLimiter(workers)
+
+    start = time.perf_counter()
+    async with create_task_group() as tg:
+        for target, entity in jobs:
+            tg.start_soon(
+                lambda t, e: to_thread.run_sync(_render, t, e, limiter=limiter),
+                target,
+                entity,
+            )
+    elapsed = time.perf_counter() - start
+
+    for target, entity in jobs:
+        download_dir = target.temp_dir / f"{entity.idx:04d}"
+        asset_cache.record(
+            target.kind,
+            download_dir,
+            hits=len(entity.assets),
+            hit_bytes=sum(
+                file_size(download_dir / asset.file_name) for asset in entity.assets
+            ),
+        )
+
+    logger.info(
+        f"Rendered {len(jobs)} entities in {elapsed:.1f}s "
+        f"({len(jobs) / max(elapsed, 1e-9):.1f} entities/s)."
+    )
+    return len(jobs)
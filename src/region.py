@@ -0,0 +1,116 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from constants import DATA_DIR, JOURNAL_DIR, OUTPUT_DIR, REPO_DIR_PATH, TMP_DIR
+from enums import SupportKind
+
+# Comma-separated regions processed by a run, e.g. "JP,NA"
+DEFAULT_REGIONS = "JP"
+
+
+def _kind_directory(kind: SupportKind, color: bool) -> str:
+    return f"{kind.value}-color" if color else kind.value
+
+
+@dataclass(frozen=True, slots=True)
+class Region:
+    """
+    An export region, e.g. JP or NA, with its own exports, local data and
+    output trees.
+
+    The first configured region keeps the paths of a single-region setup,
+    e.g. `data/local-servant` and `fga-support/servant`. The others are
+    nested in a directory named after them, e.g. `data/na/local-servant`
+    and `fga-support/na/servant`.
+
+    Attributes:
+        code (str): The region code, e.g. "JP".
+        servant_url (str | None): The URL of the servant export.
+        ce_url (str | None): The URL of the craft essence export.
+        directory (str): The directory the paths are nested in, empty for
+            the first region.
+    """
+
+    code: str
+    servant_url: str | None = None
+    ce_url: str | None = None
+    directory: str = ""
+
+    def _nest(self, root: Path) -> Path:
+        return root / self.directory if self.directory else root
+
+    def key(self, kind: SupportKind) -> str:
+        """Get the name of a kind in this region, e.g. `na/servant`."""
+        return f"{self.directory}/{kind.value}" if self.directory else kind.value
+
+    def url(self, kind: SupportKind) -> str | None:
+        return self.servant_url if kind == SupportKind.SERVANT else self.ce_url
+
+    def remote_data(self, kind: SupportKind) -> Path:
+        return self._nest(DATA_DIR) / f"{kind.value}.json"
+
+    def local_data(self, kind: SupportKind) -> Path:
+        return self._nest(DATA_DIR) / f"local-{kind.value}"
+
+    def legacy_local_data(self, kind: SupportKind) -> Path | None:
+        """The single-file local data, only the first region had one."""
+        return None if self.directory else DATA_DIR / f"local-{kind.value}.json"
+
+    def journal(self, kind: SupportKind) -> Path:
+        return self._nest(JOURNAL_DIR) / f"{kind.value}.jsonl"
+
+    def temp_dir(self, kind: SupportKind) -> Path:
+        return self._nest(TMP_DIR) / kind.value
+
+    def output_dir(self, kind: SupportKind, color: bool = False) -> Path:
+        return self._nest(OUTPUT_DIR) / _kind_directory(kind, color)
+
+    def repo_dir(self, kind: SupportKind, color: bool = False) -> Path:
+        return self._nest(REPO_DIR_PATH) / _kind_directory(kind, color)
+
+    def bundle_dir(self, kind: SupportKind) -> Path:
+        """The grayscale images of a kind packed in shards, see `bundle`."""
+        return self._nest(REPO_DIR_PATH) / "bundle" / kind.value
+
+
+def load_regions(codes: str | None = None) -> list[Region]:
+    """
+    Configure the regions from `FGA_REGIONS`. The export URLs of a region
+    are read from `<CODE>_SERVANT_URL` and `<CODE>_CE_URL`, the first region
+    falls back to `SERVANT_URL` and `CE_URL`.
+
+    Args:
+        codes (str | None): The comma-separated region codes, defaults to
+            `FGA_REGIONS`.
+
+    Returns:
+        list[Region]: The regions, the first one keeps the single-region paths.
+    """
+    if codes is None:
+        codes = os.getenv("FGA_REGIONS", DEFAULT_REGIONS)
+
+    regions: list[Region] = []
+    for code in codes.split(","):
+        code = code.strip().upper()
+        if not code or any(region.code == code for region in regions):
+            continue
+
+        first = not regions
+        regions.append(
+            Region(
+                code=code,
+                servant_url=os.getenv(f"{code}_SERVANT_URL")
+                or (os.getenv("SERVANT_URL") if first else None),
+                ce_url=os.getenv(f"{code}_CE_URL")
+                or (os.getenv("CE_URL") if first else None),
+                directory="" if first else code.lower(),
+            )
+        )
+
+    return regions or load_regions(DEFAULT_REGIONS)
+
+
+REGIONS = load_regions()
+
+PRIMARY_REGION = REGIONS[0]
@@ -0,0 +1,158 @@
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+import utils
+from constants import FRAGMENTS_DIR, OUTPUT_DIR
+from enums import SupportKind
+from models import BaseData
+from store import LocalDataStore
+
+
+class ShardError(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class Shard:
+    """
+    A deterministic partition of the entities by `idx`.
+
+    Attributes:
+        index (int): The index of this shard, from 0 to `count - 1`.
+        count (int): The total number of shards.
+    """
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """
+        Parse a shard from the `i/n` notation.
+
+        Args:
+            value (str): The shard, e.g. `0/4`.
+
+        Returns:
+            Shard: The parsed shard.
+        """
+        try:
+            index, count = (int(part) for part in value.split("/"))
+        except ValueError as e:
+            raise ShardError(f"Invalid shard {value!r}, expected i/n") from e
+
+        if count < 1 or not 0 <= index < count:
+            raise ShardError(f"Invalid shard {value!r}, expected 0 <= i < n")
+
+        return cls(index=index, count=count)
+
+    @property
+    def name(self) -> str:
+        return f"{self.index}-of-{self.count}"
+
+    def owns(self, idx: int) -> bool:
+        return idx % self.count == self.index
+
+
+def fragment_path(kind: SupportKind, shard: Shard, root: Path = FRAGMENTS_DIR) -> Path:
+    return root / f"{kind.value}-{shard.name}.json"
+
+
+async def write_fragment[T: BaseData](kind: SupportKind, shard: Shard, items: list[T]):
+    """
+    Write the local data of the entities processed by a shard.
+
+    Args:
+        kind (SupportKind): The kind of the entities.
+        shard (Shard): The shard that processed them.
+        items (list[T]): The processed entities.
+    """
+    path = fragment_path(kind, shard)
+    await utils.write_json(
+        path,
+        {
+            "kind": kind.value,
+            "index": shard.index,
+            "count": shard.count,
+            "data": sorted(items, key=lambda x: x.idx),
+        },
+    )
+    logger.info(f"Wrote {len(items)} {kind.value} entries to {path}")
+
+
+async def merge_fragments[T: BaseData](
+    kind: SupportKind,
+    roots: list[Path],
+    local_data: LocalDataStore[T],
+) -> list[Path]:
+    """
+    Merge the local data fragments of every shard of a kind into the local
+    data store. The union of the fragments is the full export, so entries
+    missing from all of them are pruned.
+
+    Args:
+        kind (SupportKind): The kind of the entities.
+        roots (list[Path]): The directories to look for fragments in.
+        local_data (LocalDataStore[T]): The local data store to update.
+
+    Returns:
+        list[Path]: The merged fragment files.
+    """
+    fragments: dict[int, tuple[Path, dict]] = {}
+    counts: set[int] = set()
+
+    for root in roots:
+        for path in sorted(root.glob(f"{kind.value}-*-of-*.json")):
+            fragment: dict | None = await utils.read_json(path)
+            if fragment is None or fragment.get("kind") != kind.value:
+                raise ShardError(f"Invalid fragment: {path}")
+
+            counts.add(fragment["count"])
+            if fragment["index"] in fragments:
+                raise ShardError(
+                    f"Duplicate {kind.value} shard {fragment['index']}: {path}"
+                )
+            fragments[fragment["index"]] = (path, fragment)
+
+    if not fragments:
+        raise ShardError(f"No {kind.value} fragments found.")
+
+    if len(counts) != 1:
+        raise ShardError(f"Mixed {kind.value} shard counts: {sorted(counts)}")
+
+    count = counts.pop()
+    missing = sorted(set(range(count)) - set(fragments))
+    if missing:
+        raise ShardError(f"Missing {kind.value} shards {missing} of {count}.")
+
+    indices: set[int] = set()
+    for _, fragment in fragments.values():
+        for record in fragment["data"]:
+            await local_data.put(local_data.class_type.from_dict(record))
+            indices.add(record["idx"])
+
+    await local_data.prune(indices)
+    await local_data.flush()
+
+    logger.info(f"Merged {count} {kind.value} shards, {len(indices)} entries.")
+    return [path for path, _ in fragments.values()]
+
+
+def merge_outputs(roots: list[Path]):
+    """
+    Copy the output trees of the shards into the output directory, the
+    layout `directory.copy_output_to_repo` expects.
+
+    Args:
+        roots (list[Path]): The shard directories holding an `output` tree.
+    """
+    for root in roots:
+        output_dir = root / OUTPUT_DIR.name
+        if not output_dir.exists() or output_dir.resolve() == OUTPUT_DIR.resolve():
+            continue
+
+        shutil.copytree(output_dir, OUTPUT_DIR, dirs_exist_ok=True)
+        logger.info(f"Merged outputs from {output_dir}")
@@ -0,0 +1,238 @@
+import time
+from pathlib import Path
+
+import orjson
+from anyio import Lock
+from loguru import logger
+
+import utils
+from layout import layout
+from metrics import Stage, metrics
+from models import BaseData
+
+# Number of consecutive `idx` values stored in a single shard file
+SHARD_SIZE = 100
+
+
+class LocalDataStore[T: BaseData]:
+    """
+    Local data keyed by `idx` and sharded into JSON files.
+
+    Each shard file holds up to `SHARD_SIZE` consecutive indices. Shards are
+    only read when one of their records is requested, and only the shards
+    holding changed records are rewritten on `flush`.
+
+    Attributes:
+        name (str): The name of the data, used for logging.
+        root (Path): The directory holding the shard files.
+        class_type (type[T]): The class type the records are converted to.
+        legacy_path (Path | None): The single-file local data to migrate from.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        root: Path,
+        class_type: type[T],
+        legacy_path: Path | None = None,
+        shard_size: int = SHARD_SIZE,
+    ):
+        self.name = name
+        self.root = root
+        self.class_type = class_type
+        self.legacy_path = legacy_path
+        self.shard_size = shard_size
+
+        self._shards: dict[int, dict[int, dict]] = {}
+        self._items: dict[int, T] = {}
+        self._dirty: set[int] = set()
+        self._migrated = False
+        self._lock = Lock()
+
+    def _shard_id(self, idx: int) -> int:
+        return idx // self.shard_size
+
+    def _shard_path(self, shard_id: int) -> Path:
+        return self.root / f"{shard_id:04d}.json"
+
+    async def shard_ids(self) -> set[int]:
+        """
+        Get the ids of all the shards, both on disk and in memory.
+
+        The legacy local data is migrated first, its shards are only in
+        memory until flushed.
+        """
+        async with self._lock:
+            if not self._migrated:
+                await self._migrate_legacy()
+
+        on_disk: set[int] = set()
+        if self.root.exists():
+            on_disk = {int(path.stem) for path in self.root.glob("*.json")}
+        return on_disk | set(self._shards)
+
+    async def _migrate_legacy(self):
+        """Split the legacy single-file local data into shards."""
+        self._migrated = True
+        if self.root.exists() or self.legacy_path is None:
+            return
+        if not self.legacy_path.exists():
+            return
+
+        logger.info(f"Migrating local {self.name} data from {self.legacy_path}...")
+        raw_data: list[dict] | None = await utils.read_json(self.legacy_path)
+        if raw_data is None:
+            logger.error(f"Failed to read legacy local {self.name} data.")
+            return
+
+        for item in raw_data:
+            shard_id = self._shard_id(item["idx"])
+            self._shards.setdefault(shard_id, {})[item["idx"]] = item
+            self._dirty.add(shard_id)
+
+    async def _load_shard(self, shard_id: int) -> dict[int, dict]:
+        # Entities processed concurrently load a shard, or migrate, only once
+        async with self._lock:
+            if not self._migrated:
+                await self._migrate_legacy()
+
+            shard = self._shards.get(shard_id)
+            if shard is not None:
+                return shard
+
+            shard = {}
+            shard_path = self._shard_path(shard_id)
+            if shard_path.exists():
+                start = time.perf_counter()
+                raw_data: list[dict] | None = await utils.read_json(shard_path)
+                if raw_data is None:
+                    logger.error(
+                        f"Failed to read local {self.name} shard: {shard_path}"
+                    )
+                else:
+                    shard = {item["idx"]: item for item in raw_data}
+                    metrics.record(
+                        Stage.LOCAL_LOAD,
+                        time.perf_counter() - start,
+                        items=len(shard),
+                        nbytes=shard_path.stat().st_size,
+                    )
+
+            self._shards[shard_id] = shard
+            return shard
+
+    async def get(self, idx: int) -> T | None:
+        """
+        Get the record for an index, loading its shard if needed.
+
+        Args:
+            idx (int): The index of the record.
+
+        Returns:
+            T | None: The record, or None if it does not exist.
+        """
+        item = self._items.get(idx)
+        if item is not None:
+            return item
+
+        shard = await self._load_shard(self._shard_id(idx))
+        raw_item = shard.get(idx)
+        if raw_item is None:
+            return None
+
+        try:
+            item = self.class_type.from_dict(raw_item)
+        except TypeError as e:
+            logger.error(f"Type error while processing local {self.name} data: {e}")
+            return None
+
+        self._items[idx] = item
+        return item
+
+    async def put(self, item: T) -> bool:
+        """
+        Store a record, marking its shard as changed if the content differs.
+
+        Args:
+            item (T): The record to store.
+
+        Returns:
+            bool: True if the stored content changed, False otherwise.
+        """
+        shard_id = self._shard_id(item.idx)
+        shard = await self._load_shard(shard_id)
+
+        raw_item = orjson.loads(orjson.dumps(item))
+        self._items[item.idx] = item
+        if shard.get(item.idx) == raw_item:
+            return False
+
+        shard[item.idx] = raw_item
+        self._dirty.add(shard_id)
+        return True
+
+    async def indices(self) -> set[int]:
+        """Get the indices of every record, loading all the shards."""
+        indices: set[int] = set()
+        for shard_id in await self.shard_ids():
+            indices.update(await self._load_shard(shard_id))
+        return indices
+
+    async def prune(self, keep: set[int]) -> list[int]:
+        """
+        Remove every record whose index is not in `keep`.
+
+        Args:
+            keep (set[int]): The indices to keep.
+
+        Returns:
+            list[int]: The removed indices.
+        """
+        removed: list[int] = []
+        for shard_id in sorted(await self.shard_ids()):
+            shard = await self._load_shard(shard_id)
+            for idx in [idx for idx in shard if idx not in keep]:
+                del shard[idx]
+                self._items.pop(idx, None)
+                self._dirty.add(shard_id)
+                removed.append(idx)
+
+        if removed:
+            logger.info(f"Removed {len(removed)} stale local {self.name} entries.")
+        return removed
+
+    @property
+    def is_dirty(self) -> bool:
+        return len(self._dirty) > 0
+
+    async def flush(self) -> int:
+        """
+        Write the changed shards to disk.
+
+        Returns:
+            int: The number of shard files written or removed.
+        """
+        if not self._dirty:
+            logger.info(f"Local {self.name} data is unchanged, skipping write.")
+            return 0
+
+        layout.ensure(self.root)
+
+        for shard_id in sorted(self._dirty):
+            shard = self._shards[shard_id]
+            shard_path = self._shard_path(shard_id)
+            if not shard:
+                shard_path.unlink(missing_ok=True)
+                continue
+
+            await utils.write_json(shard_path, [shard[idx] for idx in sorted(shard)])
+
+        written = len(self._dirty)
+        self._dirty.clear()
+        logger.info(f"Wrote {written} local {self.name} data shard(s).")
+
+        if self.legacy_path is not None and self.legacy_path.exists():
+            self.legacy_path.unlink(missing_ok=True)
+            logger.info(f"Removed legacy local {self.name} data: {self.legacy_path}")
+
+        return written
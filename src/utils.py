@@ -1,12 +1,55 @@
 import asyncio
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import httpx
 import orjson
-from anyio import open_file
+from anyio import open_file, to_thread
 from loguru import logger
 
+from layout import layout
+from log import sampler
+from pack import packed
+
+# The limiter and the negative cache depend on the metrics, which write their
+# report through here. httpx is only imported once something is downloaded,
+# so the commands that never download start faster.
+if TYPE_CHECKING:
+    import httpx
+
+    from congestion import AdaptiveLimiter
+    from negative import NegativeCache
+
+# Seconds to wait before retrying a failed download
+RETRY_DELAY = 1
+
+# Upper bound of the `Retry-After` delay honored on a 429
+MAX_RETRY_AFTER = 30
+
+# Statuses meaning the file is gone, not retried, i.e. 404 and 410
+PERMANENT_STATUSES = frozenset({404, 410})
+
+# Shared HTTP client, so the connection pool stays warm between downloads
+_client: "httpx.AsyncClient | None" = None
+
+
+def get_client() -> "httpx.AsyncClient":
+    """Get the shared HTTP client, creating it on first use."""
+    import httpx
+
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient()
+    return _client
+
+
+async def close_client():
+    """Close the shared HTTP client."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 
 async def read_json(file_path: Path) -> Any | None:
     try:
@@ -25,68 +68,309 @@ async def read_json(file_path: Path) -> Any | None:
         return None
 
 
-async def write_json(file_path: Path, data):
+async def read_bytes(file_path: Path) -> bytes | None:
     try:
-        async with await open_file(file_path, "wb") as f:
-            await f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        async with await open_file(file_path, "rb") as f:
+            return await f.read()
+    except FileNotFoundError as e:
+        logger.error(f"Error reading file: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Error reading file: {e}")
+        return None
+
+
+async def write_json(file_path: Path, data, indent: bool = True):
+    option = orjson.OPT_INDENT_2 if indent else None
+    # Write next to the file and rename, so readers never see a partial file
+    temp_path = file_path.with_name(f"{file_path.name}.part")
+    try:
+        layout.ensure_parent(file_path)
+        async with await open_file(temp_path, "wb") as f:
+            await f.write(orjson.dumps(data, option=option))
+        temp_path.replace(file_path)
     except FileNotFoundError as e:
         logger.error(f"Error writing JSON file: {e}")
+        temp_path.unlink(missing_ok=True)
     except Exception as e:
         logger.error(f"Error writing JSON file: {e}")
+        temp_path.unlink(missing_ok=True)
+
+
+async def write_text(file_path: Path, text: str):
+    temp_path = file_path.with_name(f"{file_path.name}.part")
+    try:
+        layout.ensure_parent(file_path)
+        async with await open_file(temp_path, "w", encoding="utf-8") as f:
+            await f.write(text)
+        temp_path.replace(file_path)
+    except Exception as e:
+        logger.error(f"Error writing file: {e}")
+        temp_path.unlink(missing_ok=True)
+
+
+def write_if_changed(file_path: Path, data: bytes) -> bool:
+    """
+    Write a file atomically and only if its content changed, so unchanged
+    files in the repository are not touched.
+
+    Args:
+        file_path (Path): The path to the file.
+        data (bytes): The content of the file.
+
+    Returns:
+        bool: True if the file was written, False if it was unchanged.
+    """
+    try:
+        if file_path.stat().st_size == len(data) and file_path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+
+    # Write next to the file and rename, so readers never see a partial file
+    temp_path = file_path.with_name(f"{file_path.name}.part")
+    temp_path.write_bytes(data)
+    temp_path.replace(file_path)
+    return True
+
+
+def is_downloaded(file_path: Path) -> bool:
+    """
+    Check if a file was already downloaded.
+
+    Files of 100 bytes or less are error pages or interrupted downloads.
+
+    Args:
+        file_path (Path): The path to the file.
+
+    Returns:
+        bool: True if the file exists and looks complete, False otherwise.
+    """
+    entry = packed(file_path)
+    if entry is not None:
+        pack, key = entry
+        return (pack.size_of(key) or 0) > 100
+    return file_path.exists() and file_path.stat().st_size > 100
+
+
+def file_size(file_path: Path) -> int:
+    """Get the size of a file, which may be kept in the asset pack."""
+    entry = packed(file_path)
+    if entry is not None:
+        pack, key = entry
+        return pack.size_of(key) or 0
+    return file_path.stat().st_size
+
+
+def _is_congestion(response: "httpx.Response") -> bool:
+    """Check if an error response means the server is overloaded."""
+    # 429 Too Many Requests or any server error
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def _retry_after(response: "httpx.Response") -> float:
+    """Get the seconds of the `Retry-After` header, 0 if missing."""
+    try:
+        return min(float(response.headers.get("Retry-After", 0)), MAX_RETRY_AFTER)
+    except ValueError:
+        # HTTP dates are not worth parsing, fall back to the default delay
+        return 0
 
 
 async def download_file(
     url: str,
     file_path: Path,
     debug: bool = False,
+    limiter: "AdaptiveLimiter | None" = None,
+    negative_cache: "NegativeCache | None" = None,
 ) -> Path | None:
-    if file_path.exists() and file_path.stat().st_size > 100:
+    """
+    Download a file, unless it was already downloaded.
+
+    Assets kept in the asset pack are appended to it instead of written to
+    their path.
+
+    Args:
+        url (str): The URL to download.
+        file_path (Path): The path to save the file to.
+        debug (bool): Create an empty file instead of downloading.
+        limiter (AdaptiveLimiter | None): The limiter of the in-flight
+            downloads, adjusted with the outcome of every attempt.
+        negative_cache (NegativeCache | None): Where to record a URL that
+            failed permanently, which is then not retried, or forget it once
+            it downloads again.
+
+    Returns:
+        Path | None: The path to the file, None on error.
+    """
+    if is_downloaded(file_path):
         logger.debug(f"File already exists: {file_path}")
         return file_path
 
-    logger.info(f"Downloading file from url to {file_path}...")
+    logger.log(
+        sampler.level("download"), f"Downloading file from url to {file_path}..."
+    )
+    entry = packed(file_path)
+    if entry is None:
+        layout.ensure_parent(file_path)
 
     if debug:
         logger.debug(
             "Debug mode enabled. Skipping download and "
             f"Creating empty file {file_path.name}."
         )
+        if entry is not None:
+            await to_thread.run_sync(entry[0].put, entry[1], b"")
+            return file_path
         async with await open_file(file_path, "wb") as f:
             pass
         return file_path
 
+    import httpx
+
     retry = 3
 
     while retry > 0:
-        try:
-            async_file = await open_file(file_path, "wb")
-            async with (
-                httpx.AsyncClient() as client,
-                client.stream("GET", url) as response,
-                async_file as f,
-            ):
-                async for chunk in response.aiter_bytes():
-                    await f.write(chunk)
-            return file_path
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error occurred: {e}")
-            file_path.unlink(missing_ok=True)
-        except httpx.ConnectError as e:
-            logger.error(f"Connection error occurred: {e}")
-            file_path.unlink(missing_ok=True)
-        except httpx.TimeoutException as e:
-            logger.error(f"Timeout error occurred: {e}")
-            file_path.unlink(missing_ok=True)
-        except httpx.NetworkError as e:
-            logger.error(f"Network error occurred: {e}")
-            file_path.unlink(missing_ok=True)
-        except Exception as e:
-            logger.error(f"An error occurred: {e}")
-            file_path.unlink(missing_ok=True)
+        retry_delay = RETRY_DELAY
+        congested = False
+        slot_context = limiter.slot() if limiter is not None else nullcontext()
+        async with slot_context as slot:
+            try:
+                async with get_client().stream("GET", url) as response:
+                    # Never save an error page as the file
+                    response.raise_for_status()
+                    if entry is not None:
+                        # The pack is appended to with blocking I/O
+                        data = await response.aread()
+                        await to_thread.run_sync(entry[0].put, entry[1], data)
+                    else:
+                        async with await open_file(file_path, "wb") as f:
+                            async for chunk in response.aiter_bytes():
+                                await f.write(chunk)
+                if slot is not None:
+                    slot.succeed(response.num_bytes_downloaded)
+                if negative_cache is not None:
+                    negative_cache.forget(url)
+                return file_path
+            except httpx.HTTPStatusError as e:
+                logger.error(f"HTTP error occurred: {e}")
+                file_path.unlink(missing_ok=True)
+                if (
+                    negative_cache is not None
+                    and e.response.status_code in PERMANENT_STATUSES
+                ):
+                    negative_cache.record(url, e.response.status_code)
+                    return None
+                if _is_congestion(e.response):
+                    congested = True
+                    retry_delay = max(retry_delay, _retry_after(e.response))
+            except httpx.ConnectError as e:
+                logger.error(f"Connection error occurred: {e}")
+                file_path.unlink(missing_ok=True)
+                congested = True
+            except httpx.TimeoutException as e:
+                logger.error(f"Timeout error occurred: {e}")
+                file_path.unlink(missing_ok=True)
+                congested = True
+            except httpx.NetworkError as e:
+                logger.error(f"Network error occurred: {e}")
+                file_path.unlink(missing_ok=True)
+                congested = True
+            except Exception as e:
+                logger.error(f"An error occurred: {e}")
+                file_path.unlink(missing_ok=True)
+
+            if slot is not None and congested:
+                slot.congest()
 
         logger.error(f"Error downloading from Atlas {retry} retries left.")
-        await asyncio.sleep(1)
+        await asyncio.sleep(retry_delay)
 
         retry -= 1
 
     return None
+
+
+async def asset_validator(url: str) -> str | None:
+    """
+    Get what identifies the content behind a URL without downloading it,
+    i.e. its strong `ETag` and size from a `HEAD` request.
+
+    Args:
+        url (str): The URL to check.
+
+    Returns:
+        str | None: The validator, None if the server sends no strong `ETag`
+            or on error.
+    """
+    import httpx
+
+    try:
+        response = await get_client().head(url)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.debug(f"Error checking {url}: {e}")
+        return None
+
+    etag = response.headers.get("etag")
+    # A weak ETag does not promise the same bytes
+    if etag is None or etag.startswith("W/"):
+        return None
+    return f"{etag} {response.headers.get('content-length', '')}"
+
+
+async def download_if_modified(
+    url: str,
+    file_path: Path,
+    validators: dict[str, str],
+) -> bool | None:
+    """
+    Download a file with a conditional request, using the `ETag` and
+    `Last-Modified` validators of the previous response.
+
+    Args:
+        url (str): The URL to download.
+        file_path (Path): The path to save the file to.
+        validators (dict[str, str]): The validators of the previous response,
+            updated in place.
+
+    Returns:
+        bool | None: True if the file was downloaded, False if it is not
+            modified, None on error.
+    """
+    import httpx
+
+    headers: dict[str, str] = {}
+    if "etag" in validators:
+        headers["If-None-Match"] = validators["etag"]
+    if "last-modified" in validators:
+        headers["If-Modified-Since"] = validators["last-modified"]
+
+    layout.ensure_parent(file_path)
+    temp_path = file_path.with_name(f"{file_path.name}.part")
+
+    try:
+        async with get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == httpx.codes.NOT_MODIFIED:
+                return False
+
+            response.raise_for_status()
+
+            async with await open_file(temp_path, "wb") as f:
+                async for chunk in response.aiter_bytes():
+                    await f.write(chunk)
+
+            temp_path.replace(file_path)
+
+            validators.clear()
+            for header in ("etag", "last-modified"):
+                if header in response.headers:
+                    validators[header] = response.headers[header]
+            return True
+    except httpx.HTTPError as e:
+        logger.error(f"Error downloading {url}: {e}")
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+
+    temp_path.unlink(missing_ok=True)
+    return None
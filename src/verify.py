@@ -0,0 +1,233 @@
+import os
+import shutil
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+from anyio import CapacityLimiter, create_task_group, to_thread
+from loguru import logger
+
+from enums import SupportKind
+from manifest import BuildManifest, digest
+from models import BaseData
+from preprocess import fetch_local_ce_data, fetch_local_servant_data
+from region import PRIMARY_REGION, REGIONS, Region
+from store import LocalDataStore
+
+# Hashing is I/O bound, so more threads than CPUs keep the disk busy
+VERIFY_WORKERS = (os.cpu_count() or 1) * 4
+
+
+@dataclass(frozen=True, slots=True)
+class VerifyTarget:
+    kind: SupportKind
+    fetch_local_data: Callable[[], Awaitable[LocalDataStore]]
+    repo_dirs: tuple[Path, ...]
+    image_filename: str
+    region: Region = PRIMARY_REGION
+
+
+def _targets(region: Region) -> list[VerifyTarget]:
+    servant = SupportKind.SERVANT
+    ce = SupportKind.CRAFT_ESSENCE
+    return [
+        VerifyTarget(
+            kind=servant,
+            fetch_local_data=partial(fetch_local_servant_data, region),
+            repo_dirs=(region.repo_dir(servant), region.repo_dir(servant, color=True)),
+            image_filename="support.png",
+            region=region,
+        ),
+        VerifyTarget(
+            kind=ce,
+            fetch_local_data=partial(fetch_local_ce_data, region),
+            repo_dirs=(region.repo_dir(ce), region.repo_dir(ce, color=True)),
+            image_filename="ce.png",
+            region=region,
+        ),
+    ]
+
+
+TARGETS = [target for region in REGIONS for target in _targets(region)]
+
+
+@dataclass(slots=True)
+class VerifyReport:
+    """
+    The outcome of verifying the repository against the local data.
+
+    Attributes:
+        checked (int): The number of entity directories checked.
+        problems (dict[SupportKind, dict[int, list[str]]]): The problems of
+            the entities that need a rebuild, by kind and index.
+        orphans (list[Path]): The directories and files no entity accounts
+            for, e.g. removed entities or renamed txt files.
+        unrecorded (int): The outputs without a hash in the manifest, only
+            checked for presence.
+    """
+
+    checked: int = 0
+    problems: dict[SupportKind, dict[int, list[str]]] = field(default_factory=dict)
+    orphans: list[Path] = field(default_factory=list)
+    unrecorded: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems and not self.orphans
+
+    @property
+    def rebuild(self) -> dict[SupportKind, set[int]]:
+        """The indices of the entities to rebuild, by kind."""
+        return {kind: set(problems) for kind, problems in self.problems.items()}
+
+
+def _verify_entity(
+    target: VerifyTarget, entity: BaseData, manifest: BuildManifest
+) -> tuple[list[str], list[Path], int]:
+    """
+    Check the directories of an entity.
+
+    Returns:
+        tuple[list[str], list[Path], int]: The problems, the orphans and the
+            number of outputs without a recorded hash.
+    """
+    problems: list[str] = []
+    orphans: list[Path] = []
+    unrecorded = 0
+
+    directory_name = f"{entity.idx:04d}"
+    txt_name = f"{entity.sanitized_name}.txt"
+    expected = {txt_name, target.image_filename}
+
+    for repo_dir in target.repo_dirs:
+        entity_dir = repo_dir / directory_name
+        key = f"{repo_dir.name}/{directory_name}"
+        try:
+            names = set(os.listdir(entity_dir))
+        except FileNotFoundError:
+            if not entity.is_empty:
+                problems.append(f"{key} is missing")
+            continue
+
+        orphans.extend(entity_dir / name for name in sorted(names - expected))
+
+        # Entities without assets are never rendered
+        if entity.is_empty:
+            continue
+
+        if txt_name not in names:
+            problems.append(f"{key}/{txt_name} is missing")
+
+        if target.image_filename not in names:
+            problems.append(f"{key}/{target.image_filename} is missing")
+            continue
+
+        image_path = entity_dir / target.image_filename
+        image_key = manifest.key_for(image_path)
+        recorded = None if image_key is None else manifest.get(image_key)
+        if recorded is None:
+            unrecorded += 1
+        elif digest(image_path.read_bytes()) != recorded:
+            problems.append(f"{key}/{target.image_filename} does not match")
+
+    return problems, orphans, unrecorded
+
+
+async def verify_repo(
+    manifest: BuildManifest,
+    workers: int = VERIFY_WORKERS,
+    region: Region = PRIMARY_REGION,
+) -> VerifyReport:
+    """
+    Check every entity directory of a region in the repository against the
+    local data and the hashes of the build manifest, in parallel.
+
+    Args:
+        manifest (BuildManifest): The hashes of the rendered outputs.
+        workers (int): The number of threads checking the directories.
+        region (Region): The region to check.
+
+    Returns:
+        VerifyReport: The entities that need a rebuild and the orphans.
+    """
+    start = time.perf_counter()
+    report = VerifyReport()
+    limiter = CapacityLimiter(workers)
+
+    async def _check(target: VerifyTarget, entity: BaseData):
+        problems, orphans, unrecorded = await to_thread.run_sync(
+            _verify_entity, target, entity, manifest, limiter=limiter
+        )
+        report.checked += len(target.repo_dirs)
+        report.orphans.extend(orphans)
+        report.unrecorded += unrecorded
+        if problems:
+            report.problems.setdefault(target.kind, {})[entity.idx] = problems
+
+    for target in TARGETS:
+        if target.region != region:
+            continue
+
+        local_data = await target.fetch_local_data()
+        indices = await local_data.indices()
+        directory_names = {f"{idx:04d}" for idx in indices}
+
+        async with create_task_group() as tg:
+            for idx in sorted(indices):
+                entity = await local_data.get(idx)
+                if entity is not None:
+                    tg.start_soon(_check, target, entity)
+
+        for repo_dir in target.repo_dirs:
+            if not repo_dir.exists():
+                continue
+            report.orphans.extend(
+                Path(entry.path)
+                for entry in os.scandir(repo_dir)
+                if entry.name not in directory_names and not entry.name.startswith(".")
+            )
+
+    report.orphans.sort()
+    logger.info(
+        f"Verified {report.checked} {region.code} entity directories in "
+        f"{time.perf_counter() - start:.1f}s."
+    )
+    return report
+
+
+def log_report(report: VerifyReport, region: Region = PRIMARY_REGION):
+    for kind, problems in report.problems.items():
+        for idx, entity_problems in sorted(problems.items()):
+            logger.warning(
+                f"{region.key(kind)} {idx:04d} needs a rebuild: "
+                f"{', '.join(entity_problems)}"
+            )
+    for path in report.orphans:
+        logger.warning(f"Orphan: {path}")
+
+    if report.unrecorded:
+        logger.info(
+            f"{report.unrecorded} outputs have no recorded hash, "
+            "only their presence was checked."
+        )
+
+    if report.ok:
+        logger.info(f"The {region.code} repository matches the local data.")
+        return
+
+    entities = sum(len(problems) for problems in report.problems.values())
+    logger.warning(
+        f"{entities} entities need a rebuild, {len(report.orphans)} orphans found."
+    )
+
+
+def remove_orphans(orphans: list[Path]):
+    for path in orphans:
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+    if orphans:
+        logger.info(f"Removed {len(orphans)} orphans from the repository.")
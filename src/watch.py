@@ -0,0 +1,256 @@
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+
+from anyio import create_task_group, run_process, sleep
+from loguru import logger
+
+import directory
+import utils
+from bundle import write_bundles
+from cache import asset_cache
+from changes import change_feed
+from content import content_index
+from data import process_craft_essence_data, process_servant_data
+from enums import SupportKind
+from history import history
+from manifest import manifest
+from metrics import metrics
+from negative import negative_cache
+from preprocess import (
+    fetch_local_ce_data,
+    fetch_local_servant_data,
+    load_cached_craft_essence,
+    load_cached_servant,
+)
+from region import PRIMARY_REGION, REGIONS, Region
+from store import LocalDataStore
+
+# Longest wait between polls after failed polls in a row, in seconds
+MAX_BACKOFF = 3600
+
+
+class ExportWatcher:
+    """
+    Poll an export URL with conditional requests and process it on change.
+
+    The local data store is opened once and kept in memory between polls.
+
+    Attributes:
+        name (str): The name of the data.
+        url (str): The URL of the export.
+        file_path (Path): The path the export is downloaded to.
+        region (Region): The region of the export.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        file_path: Path,
+        load_func: Callable[[bool, Region], AsyncIterator],
+        process_func: Callable[..., Awaitable[None]],
+        local_data: LocalDataStore,
+        region: Region = PRIMARY_REGION,
+    ):
+        self.name = name
+        self.url = url
+        self.file_path = file_path
+        self.load_func = load_func
+        self.process_func = process_func
+        self.local_data = local_data
+        self.region = region
+        self.validators: dict[str, str] = {}
+
+    async def poll(self, debug: bool, dry_run: bool, direct: bool = False) -> bool:
+        """
+        Check the export for changes and process them.
+
+        Returns:
+            bool: True if the export changed and was processed.
+        """
+        downloaded = await utils.download_if_modified(
+            self.url, self.file_path, self.validators
+        )
+        if not downloaded:
+            if downloaded is False:
+                logger.debug(f"{self.name} export not modified.")
+            return False
+
+        logger.info(f"{self.name} export changed, processing...")
+        try:
+            await self.process_func(
+                self.load_func(True, self.region),
+                self.local_data,
+                debug,
+                dry_run,
+                direct=direct,
+                region=self.region,
+            )
+        except BaseException:
+            # Download the export again on the next poll to retry
+            self.validators.clear()
+            raise
+        return True
+
+
+async def watch(
+    interval: float,
+    debug: bool = False,
+    dry_run: bool = False,
+    exec_command: str | None = None,
+    direct: bool = False,
+):
+    """
+    Stay resident and process the exports whenever they change.
+
+    The local data, the HTTP connection pool and OpenCV stay loaded between
+    polls, so a change is processed without the cold start of a new run.
+
+    A failed poll or save is logged and the watcher keeps running. The
+    failed export is downloaded and processed again on the next poll, which
+    waits longer after every failure in a row, see `_backoff`.
+
+    Args:
+        interval (float): The seconds between polls.
+        debug (bool): Enable debug mode.
+        dry_run (bool): Enable dry run mode.
+        exec_command (str | None): A shell command to run after every change,
+            e.g. to commit and push the repository.
+        direct (bool): Render straight into the repository instead of the
+            output directory, unless in dry run mode.
+    """
+    for region in REGIONS:
+        if not region.servant_url or not region.ce_url:
+            logger.error(
+                f"{region.code} servant and craft essence URLs must be set. Exiting..."
+            )
+            return
+
+    try:
+        await directory.check_if_repo_exists()
+    except directory.RepositoryNotFoundError:
+        logger.error("Repository not found. Exiting...")
+        return
+
+    await history.load()
+    await negative_cache.load()
+    await manifest.load()
+    await content_index.load()
+    await asset_cache.load()
+
+    stores: dict[str, LocalDataStore] = {}
+    watchers: list[ExportWatcher] = []
+    for region in REGIONS:
+        for kind, fetch_func, load_func, process_func in (
+            (
+                SupportKind.SERVANT,
+                fetch_local_servant_data,
+                load_cached_servant,
+                process_servant_data,
+            ),
+            (
+                SupportKind.CRAFT_ESSENCE,
+                fetch_local_ce_data,
+                load_cached_craft_essence,
+                process_craft_essence_data,
+            ),
+        ):
+            name = region.key(kind)
+            stores[name] = await fetch_func(region)
+            watchers.append(
+                ExportWatcher(
+                    name=name,
+                    url=region.url(kind) or "",
+                    file_path=region.remote_data(kind),
+                    load_func=load_func,
+                    process_func=process_func,
+                    local_data=stores[name],
+                    region=region,
+                )
+            )
+
+    direct = direct and not dry_run
+
+    logger.info(f"Watching the exports every {interval:.0f}s...")
+
+    async def _poll(watcher: ExportWatcher, changed: list[bool], failed: list[str]):
+        # A failing export does not stop the others from being processed
+        try:
+            changed.append(await watcher.poll(debug, dry_run, direct))
+        except Exception:
+            logger.exception(f"Failed to process the {watcher.name} export.")
+            failed.append(watcher.name)
+
+    failures = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            changed: list[bool] = []
+            failed: list[str] = []
+
+            async with create_task_group() as tg:
+                for watcher in watchers:
+                    tg.start_soon(_poll, watcher, changed, failed)
+
+            if any(changed):
+                try:
+                    await history.save()
+                    negative_cache.report()
+                    await negative_cache.save()
+                    if not direct:
+                        await directory.copy_output_to_repo()
+                    await directory.remove_duplicate_txt_names()
+                    await write_bundles()
+                    if debug or dry_run:
+                        await asset_cache.save()
+                    else:
+                        await asset_cache.maintain(stores)
+                        await change_feed.save()
+                    await manifest.save()
+                    await content_index.save()
+                    await metrics.save()
+
+                    if exec_command:
+                        await _run_exec_command(exec_command)
+
+                    logger.info(
+                        f"Changes processed in {time.perf_counter() - start:.1f}s."
+                    )
+                except Exception:
+                    logger.exception("Failed to save the processed changes.")
+                    failed.append("save")
+
+            # Every processed change gets its own run report and change feed
+            metrics.reset()
+            change_feed.reset()
+
+            failures = failures + 1 if failed else 0
+            delay = _backoff(interval, failures)
+            if failures:
+                logger.warning(f"Polling again in {delay:.0f}s after a failure.")
+            await sleep(delay)
+    finally:
+        await utils.close_client()
+
+
+def _backoff(interval: float, failures: int) -> float:
+    """Double the poll interval for every failed poll in a row, up to a cap."""
+    if failures == 0:
+        return interval
+    return min(interval * 2**failures, max(interval, MAX_BACKOFF))
+
+
+async def _run_exec_command(command: str):
+    logger.info(f"Running: {command}")
+    try:
+        result = await run_process(command, check=False)
+    except OSError as e:
+        logger.error(f"Failed to run {command}: {e}")
+        return
+
+    if result.returncode != 0:
+        logger.error(
+            f"Command exited with {result.returncode}: "
+            f"{result.stderr.decode(errors='replace').strip()}"
+        )
@@ -0,0 +1,48 @@
+"""Entities and local data stores shared by the tests."""
+
+from pathlib import Path
+
+from models import Assets, BaseData, CraftEssenceData, ServantData
+from store import SHARD_SIZE, LocalDataStore
+
+STORE_NAMES: dict[type[BaseData], str] = {
+    ServantData: "servant",
+    CraftEssenceData: "ce",
+}
+
+
+def make_servant(idx: int, name: str | None = None, assets: int = 1) -> ServantData:
+    return ServantData(
+        idx=idx,
+        name=name or f"Servant {idx}",
+        rarity=5,
+        assets=[
+            Assets(key=f"ascension_{i}", url=f"https://example.com/{idx}_{i}.png")
+            for i in range(assets)
+        ],
+    )
+
+
+def make_ce(idx: int, name: str | None = None) -> CraftEssenceData:
+    return CraftEssenceData(
+        idx=idx,
+        name=name or f"CE {idx}",
+        rarity=5,
+        assets=[Assets(key="equip", url=f"https://example.com/{idx}.png")],
+    )
+
+
+def make_store[T: BaseData](
+    tmp_path: Path,
+    class_type: type[T],
+    legacy_path: Path | None = None,
+    shard_size: int = SHARD_SIZE,
+) -> LocalDataStore[T]:
+    name = STORE_NAMES[class_type]
+    return LocalDataStore(
+        name=name,
+        root=tmp_path / f"local-{name}",
+        class_type=class_type,
+        legacy_path=legacy_path,
+        shard_size=shard_size,
+    )
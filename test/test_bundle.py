@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+import pytest
+
+from bundle import BundleError, SupportBundle, build_bundles, open_bundles
+
+
+def _write(source_dir, idx: int, image: np.ndarray):
+    directory = source_dir / f"{idx:04d}"
+    directory.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(str(directory / "support.png"), image)
+
+
+def test_build_bundles(tmp_path):
+    source_dir = tmp_path / "servant"
+    bundle_dir = tmp_path / "bundle" / "servant"
+    rng = np.random.default_rng(0)
+    images = {
+        1: rng.integers(0, 256, (50, 157), dtype=np.uint8),
+        20: rng.integers(0, 256, (44, 125), dtype=np.uint8),
+        250: rng.integers(0, 256, (50, 157), dtype=np.uint8),
+    }
+    for idx, image in images.items():
+        _write(source_dir, idx, image)
+
+    assert build_bundles(source_dir, "support.png", bundle_dir) == 3
+    assert sorted(path.name for path in bundle_dir.iterdir()) == [
+        "000.bundle",
+        "002.bundle",
+    ]
+    bundles = open_bundles(bundle_dir)
+    assert [list(bundle) for bundle in bundles] == [[1, 20], [250]]
+    for bundle in bundles:
+        for idx in bundle:
+            assert np.array_equal(bundle[idx], images[idx])
+        assert all(entry.offset % 64 == 0 for entry in bundle.entries.values())
+        bundle.close()
+
+    # Unchanged images leave the bundles as is, a change only rewrites and
+    # decodes its own shard
+    assert build_bundles(source_dir, "support.png", bundle_dir) is None
+    untouched = (bundle_dir / "002.bundle").stat().st_mtime_ns
+    images[20] = 255 - images[20]
+    _write(source_dir, 20, images[20])
+    _write(source_dir, 3, images[1])
+    assert build_bundles(source_dir, "support.png", bundle_dir) == 2
+    assert (bundle_dir / "002.bundle").stat().st_mtime_ns == untouched
+    with SupportBundle(bundle_dir / "000.bundle") as bundle:
+        assert list(bundle) == [1, 3, 20]
+        assert bundle.plane(20) == images[20].tobytes()
+        assert bundle.plane(3) == bundle.plane(1)
+
+    # A shard without entities is removed
+    (source_dir / "0250" / "support.png").unlink()
+    assert build_bundles(source_dir, "support.png", bundle_dir) == 0
+    assert not (bundle_dir / "002.bundle").exists()
+
+
+def test_invalid_bundle(tmp_path):
+    bundle_dir = tmp_path / "bundle"
+    path = bundle_dir / "000.bundle"
+    bundle_dir.mkdir()
+    path.write_bytes(b"not a bundle" * 4)
+    with pytest.raises(BundleError):
+        SupportBundle(path)
+
+    # An invalid bundle is rebuilt from the images
+    _write(tmp_path / "servant", 1, np.zeros((2, 3), dtype=np.uint8))
+    assert build_bundles(tmp_path / "servant", "support.png", bundle_dir) == 1
+    with SupportBundle(path) as bundle:
+        assert bundle.plane(1) == bytes(6)
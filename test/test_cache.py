@@ -0,0 +1,81 @@
+import pytest
+
+from cache import AssetCache
+from enums import SupportKind
+from factories import make_store
+from models import Assets, ServantData
+
+
+def _asset(idx: int, i: int) -> Assets:
+    return Assets(key=f"ascension_{i}", url=f"https://example.com/{idx}_{i}.png")
+
+
+def _cache_files(root, idx: int, count: int, size: int = 200):
+    directory = root / f"{idx:04d}"
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        (directory / _asset(idx, i).file_name).write_bytes(b"0" * size)
+    return directory
+
+
+@pytest.fixture
+def cache(tmp_path) -> AssetCache:
+    return AssetCache(
+        tmp_path / "cache.json",
+        {SupportKind.SERVANT: tmp_path / "servant"},
+        max_bytes=1000,
+    )
+
+
+@pytest.mark.anyio
+async def test_collect(tmp_path, cache):
+    root = tmp_path / "servant"
+    _cache_files(root, 1, 2)
+    _cache_files(root, 2, 1)
+
+    store = make_store(tmp_path, ServantData)
+    # Servant 1 lost an asset and servant 2 is gone from the export
+    await store.put(ServantData(idx=1, name="A", rarity=5, assets=[_asset(1, 0)]))
+
+    cache.scan()
+    assert await cache.collect(SupportKind.SERVANT, store) == 400
+    assert [path.name for path in (root / "0001").iterdir()] == [_asset(1, 0).file_name]
+    assert not (root / "0002").exists()
+    assert list(cache.entries) == ["servant/0001"]
+
+
+def test_evict(tmp_path, cache):
+    root = tmp_path / "servant"
+    for idx in (1, 2, 3):
+        _cache_files(root, idx, 2)
+    cache.scan()
+
+    # Servant 1 is the most recently used, so it is kept
+    cache.entries["servant/0002"].last_used = 1
+    cache.entries["servant/0003"].last_used = 2
+    cache.record(SupportKind.SERVANT, root / "0001", hits=2, hit_bytes=400)
+
+    cache.max_bytes = 500
+    assert cache.evict() == ["servant/0002", "servant/0003"]
+    assert cache.size == 400
+    assert (root / "0001").exists()
+    assert not (root / "0002").exists()
+    assert cache.evict() == []
+
+
+@pytest.mark.anyio
+async def test_save_and_hit_rates(tmp_path, cache):
+    root = tmp_path / "servant"
+    directory = _cache_files(root, 1, 2)
+    cache.record(SupportKind.SERVANT, directory, hits=3, misses=1, hit_bytes=600)
+    await cache.save()
+
+    loaded = AssetCache(cache.path, cache.roots)
+    await loaded.load()
+    assert list(loaded.entries) == ["servant/0001"]
+    assert len(loaded.runs) == 1
+
+    loaded.record(SupportKind.SERVANT, directory, misses=1, miss_bytes=200)
+    rates = loaded.hit_rates()["servant"]
+    assert (rates.hits, rates.misses) == (3, 2)
+    assert (rates.hit_bytes, rates.miss_bytes) == (600, 200)
@@ -0,0 +1,50 @@
+import orjson
+import pytest
+
+import changes
+from changes import ChangeFeed
+from manifest import BuildManifest
+
+
+@pytest.mark.anyio
+async def test_change_feed(tmp_path, monkeypatch):
+    output = tmp_path / "output"
+    build_manifest = BuildManifest(tmp_path / "manifest.json", (output,))
+    monkeypatch.setattr(changes, "manifest", build_manifest)
+
+    outputs = (output / "servant/0001/support.png", output / "servant/0002/support.png")
+    for file_path in outputs:
+        build_manifest.record(file_path, file_path.parent.name.encode())
+
+    feed = ChangeFeed(tmp_path / "changes.json")
+    await feed.save()
+    assert not feed.path.exists()
+
+    feed.add("servant", 1, "Mash", outputs[:1])
+    feed.change("servant", 2, "Artoria", outputs[1:])
+    feed.rename("servant", 2, "Artoria", "Saber")
+    feed.remove("na/ce", [7, 5])
+    feed.change("servant", 1, "Mash", outputs[:1])
+    await feed.save()
+
+    data = orjson.loads(feed.path.read_bytes())
+    assert data["run"] == 1
+    servant = data["kinds"]["servant"]
+    # A new entity changed again in the same run is still new
+    key = "servant/0001/support.png"
+    assert servant["added"] == [
+        {"idx": 1, "name": "Mash", "outputs": {key: build_manifest.get(key)}}
+    ]
+    assert [entry["idx"] for entry in servant["changed"]] == [2]
+    assert servant["renamed"] == [
+        {"idx": 2, "name": "Artoria", "previous_name": "Saber"}
+    ]
+    assert data["kinds"]["na/ce"]["removed"] == [5, 7]
+    assert feed.empty
+
+    # A run without changes keeps the last feed, the next one continues it
+    await feed.save()
+    assert orjson.loads(feed.path.read_bytes())["run"] == 1
+    feed.remove("ce", [3])
+    await feed.save()
+    assert orjson.loads(feed.path.read_bytes())["run"] == 2
@@ -0,0 +1,103 @@
+import anyio
+import pytest
+
+from congestion import AdaptiveLimiter
+from metrics import metrics
+
+
+def test_additive_increase():
+    limiter = AdaptiveLimiter("test_increase", initial=2, maximum=4)
+
+    # A full window of successes adds one slot
+    limiter.on_success(0.1)
+    limiter.on_success(0.1)
+    assert limiter.window == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+
+    for _ in range(100):
+        limiter.on_success(0.1)
+    assert limiter.window == 4
+
+
+def test_multiplicative_decrease():
+    limiter = AdaptiveLimiter("test_decrease", initial=8, minimum=1)
+    limiter.on_success(0.01)
+
+    limiter.on_congestion()
+    assert limiter.window == pytest.approx(8 * 0.5 + 0.125 * 0.5)
+
+    # Failures within the same round trip only count once
+    window = limiter.window
+    limiter.latency = 60
+    limiter.on_congestion()
+    assert limiter.window == window
+
+    limiter.latency = 0
+    for _ in range(10):
+        limiter.on_congestion()
+    assert limiter.window == 1
+
+
+def test_latency_congestion():
+    limiter = AdaptiveLimiter("test_latency", initial=8)
+    limiter.on_success(0.1)
+    window = limiter.window
+
+    limiter.latency = 0
+    limiter.on_success(1.0)
+    assert limiter.window < window
+
+
+def test_window_gauge():
+    limiter = AdaptiveLimiter("test_gauge", initial=4)
+    limiter.latency = 0
+    limiter.on_congestion()
+
+    gauge = metrics.report()["gauges"]["test_gauge_window"]
+    assert gauge["max"] == 4
+    assert gauge["last"] == 2
+
+
+@pytest.mark.anyio
+async def test_in_flight_limit():
+    limiter = AdaptiveLimiter("test_in_flight", initial=3, maximum=3)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with limiter.slot() as slot:
+            peak = max(peak, limiter.in_flight)
+            await anyio.sleep(0.01)
+            slot.succeed(100)
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(12):
+            tg.start_soon(request)
+
+    assert peak == 3
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_increase_wakes_waiters():
+    limiter = AdaptiveLimiter("test_wake", initial=1, maximum=4)
+    entered: list[int] = []
+    done = anyio.Event()
+
+    async def request(i: int):
+        async with limiter.slot() as slot:
+            entered.append(i)
+            if i == 0:
+                await anyio.sleep(0.01)
+            else:
+                await done.wait()
+            slot.succeed(100)
+
+    async with anyio.create_task_group() as tg:
+        for i in range(3):
+            tg.start_soon(request, i)
+        # The success of the first request grows the window to 2, so both
+        # waiters get a slot right away
+        with anyio.fail_after(1):
+            while len(entered) < 3:
+                await anyio.sleep(0.01)
+        done.set()
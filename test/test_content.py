@@ -0,0 +1,161 @@
+import pytest
+from anyio import create_task_group
+
+import content
+from content import ContentIndex, asset_key
+from enums import SupportKind
+from manifest import BuildManifest, digest
+
+JP_URL = "https://static.atlasacademy.io/JP/Faces/f_100.png"
+NA_URL = "https://static.atlasacademy.io/NA/Faces/f_100.png"
+
+
+def _validators(monkeypatch, validators: dict[str, str]) -> list[str]:
+    checked: list[str] = []
+
+    async def asset_validator(url):
+        checked.append(url)
+        return validators.get(url)
+
+    monkeypatch.setattr(content.utils, "asset_validator", asset_validator)
+    return checked
+
+
+def _downloader(downloads: list, data: bytes = b"x" * 200):
+    def _download(file_path):
+        async def download():
+            downloads.append(file_path)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            file_path.write_bytes(data)
+            return file_path
+
+        return download
+
+    return _download
+
+
+@pytest.mark.anyio
+async def test_fetch_once(tmp_path, monkeypatch):
+    _validators(monkeypatch, {JP_URL: '"a" 200', NA_URL: '"a" 200'})
+    index = ContentIndex(tmp_path / "content.json", tmp_path)
+    jp_url, na_url = JP_URL, NA_URL
+    downloads: list = []
+    _download = _downloader(downloads)
+
+    # Both regions reference the same asset at the same time
+    jp_path = tmp_path / "servant" / "0001" / "f_100.png"
+    na_path = tmp_path / "na" / "servant" / "0001" / "f_100.png"
+    async with create_task_group() as tg:
+        tg.start_soon(index.fetch, jp_url, jp_path, _download(jp_path))
+        tg.start_soon(index.fetch, na_url, na_path, _download(na_path))
+
+    assert downloads == [jp_path]
+    assert na_path.read_bytes() == jp_path.read_bytes()
+    assert index.copied == 1
+
+    await index.save()
+    loaded = ContentIndex(index.path, tmp_path)
+    await loaded.load()
+    assert loaded.assets == {
+        "static.atlasacademy.io/Faces/f_100.png": {
+            "path": "servant/0001/f_100.png",
+            "url": jp_url,
+            "digest": digest(b"x" * 200),
+            "validator": '"a" 200',
+        }
+    }
+
+
+@pytest.mark.anyio
+async def test_fetch_localized(tmp_path, monkeypatch):
+    _validators(monkeypatch, {JP_URL: '"a" 200', NA_URL: '"b" 200'})
+    index = ContentIndex(tmp_path / "content.json", tmp_path)
+    downloads: list = []
+    _download = _downloader(downloads)
+
+    # The NA art of the same path differs, so it is downloaded too
+    jp_path = tmp_path / "servant" / "0001" / "f_100.png"
+    na_path = tmp_path / "na" / "servant" / "0001" / "f_100.png"
+    await index.fetch(JP_URL, jp_path, _download(jp_path))
+    await index.fetch(NA_URL, na_path, _download(na_path))
+    assert downloads == [jp_path, na_path]
+    assert index.copied == 0
+
+    # A source downloaded again is checked again
+    checked = _validators(monkeypatch, {NA_URL: '"c" 200', JP_URL: '"c" 200'})
+    na_path.write_bytes(b"y" * 200)
+    jp_path.unlink()
+    await index.fetch(JP_URL, jp_path, _download(jp_path))
+    assert jp_path.read_bytes() == b"y" * 200
+    assert index.copied == 1
+    assert checked == [NA_URL, JP_URL]
+
+
+def test_asset_key():
+    assert asset_key("https://example.com/JP/Faces/f_100.png") == (
+        "example.com/Faces/f_100.png"
+    )
+    assert asset_key("https://example.com/Faces/f_100.png") == (
+        "example.com/Faces/f_100.png"
+    )
+    assert asset_key("https://example.com/f_100.png") == "example.com/f_100.png"
+
+
+@pytest.mark.anyio
+async def test_render_once(tmp_path, monkeypatch):
+    output = tmp_path / "output"
+    monkeypatch.setattr(
+        content, "manifest", BuildManifest(tmp_path / "manifest.json", (output,))
+    )
+    index = ContentIndex(tmp_path / "content.json", tmp_path, shared=True)
+    rendered: list = []
+
+    def _entity(directory, data: bytes):
+        directory.mkdir(parents=True)
+        (directory / "ascension_1-f_100.png").write_bytes(data)
+        outputs = (
+            output / directory.relative_to(tmp_path) / "support.png",
+            output / directory.relative_to(tmp_path) / "color.png",
+        )
+
+        def render():
+            rendered.append(directory)
+            for file_path in outputs:
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                file_path.write_bytes(data + file_path.name.encode())
+                content.manifest.record(file_path, file_path.read_bytes())
+
+        return directory, outputs, render
+
+    jp = _entity(tmp_path / "servant" / "0001", b"same art")
+    na = _entity(tmp_path / "na" / "servant" / "0001", b"same art")
+    other = _entity(tmp_path / "na" / "servant" / "0002", b"other art")
+
+    assert await index.render(SupportKind.SERVANT, *jp)
+    assert not await index.render(SupportKind.SERVANT, *na)
+    assert await index.render(SupportKind.SERVANT, *other)
+
+    assert rendered == [jp[0], other[0]]
+    assert [path.read_bytes() for path in na[1]] == [
+        path.read_bytes() for path in jp[1]
+    ]
+
+    # Outputs changed behind the index are rendered again
+    jp[1][0].write_bytes(b"changed")
+    na[1][0].unlink()
+    assert await index.render(SupportKind.SERVANT, *na)
+
+
+@pytest.mark.anyio
+async def test_render_single_region(tmp_path, monkeypatch):
+    def _render_key(*args):
+        raise AssertionError("the assets are hashed")
+
+    monkeypatch.setattr(content, "render_key", _render_key)
+    index = ContentIndex(tmp_path / "content.json", tmp_path, shared=False)
+    rendered: list = []
+
+    assert await index.render(
+        SupportKind.SERVANT, tmp_path, (), lambda: rendered.append(True)
+    )
+    assert rendered == [True]
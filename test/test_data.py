@@ -0,0 +1,78 @@
+import pytest
+
+import data
+from changes import ChangeFeed
+from content import ContentIndex
+from enums import SupportKind
+from factories import make_ce, make_store
+from journal import Journal
+from models import CraftEssenceData
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.anyio
+async def test_resume_interrupted_run(tmp_path, monkeypatch):
+    output = tmp_path / "output"
+    output_color = tmp_path / "output-color"
+    journal_path = tmp_path / "ce.jsonl"
+    downloads: list[int] = []
+    rendered: list[str] = []
+
+    async def download_asset_files(assets, download_dir, kind):
+        downloads.append(int(download_dir.name))
+        return assets
+
+    def create_img(source, dest, dest_color):
+        rendered.append(source.name)
+        for file_path in (dest, dest_color):
+            file_path.write_bytes(b"ce")
+
+    monkeypatch.setattr(data, "download_asset_files", download_asset_files)
+    monkeypatch.setattr(
+        data, "content_index", ContentIndex(tmp_path / "content.json", tmp_path)
+    )
+    monkeypatch.setattr(data, "change_feed", ChangeFeed(tmp_path / "changes.json"))
+
+    # CE 1 was done before, CE 2 is gone from the export
+    store = make_store(tmp_path, CraftEssenceData)
+    for idx in (1, 2):
+        await store.put(make_ce(idx))
+    await store.flush()
+
+    # The interrupted run completed CE 3 and CE 4, only CE 3 kept its outputs
+    journal = Journal("ce", journal_path)
+    for idx in (3, 4):
+        await journal.append(make_ce(idx))
+    await journal.close()
+    for directory in (output, output_color):
+        (directory / "0003").mkdir(parents=True)
+        (directory / "0003" / "ce.png").write_bytes(b"ce")
+
+    store = make_store(tmp_path, CraftEssenceData)
+    await data._process_generic_data(
+        latest_data_list=_iterate([make_ce(idx) for idx in (1, 3, 4, 5)]),
+        local_data=store,
+        kind=SupportKind.CRAFT_ESSENCE,
+        temp_dir=tmp_path / "tmp",
+        output_dir_base=output,
+        output_color_dir_base=output_color,
+        image_creation_func=create_img,
+        output_image_filename="ce.png",
+        journal_path=journal_path,
+        name="ce",
+    )
+
+    assert sorted(downloads) == [4, 5]
+    assert sorted(rendered) == ["0004", "0005"]
+    assert (output_color / "0004" / "ce.png").exists()
+    changes = data.change_feed.kinds["ce"]
+    assert (set(changes.added), set(changes.changed)) == ({5}, {3, 4})
+    assert changes.removed == {2}
+
+    # The journal is compacted into the local data
+    assert not journal_path.exists()
+    assert await make_store(tmp_path, CraftEssenceData).indices() == {1, 3, 4, 5}
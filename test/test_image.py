@@ -5,7 +5,12 @@ import cv2
 import numpy as np
 import pytest
 
-from image import _read_images, create_support_ce_img, create_support_servant_img
+from image import (
+    _read_images,
+    create_support_ce_img,
+    create_support_servant_img,
+    write_image,
+)
 
 dir_path = Path(__file__).parent / "images"
 
@@ -362,3 +367,18 @@ class TestRealCEImage:
         _, max_val_color, _, _ = cv2.minMaxLoc(result_color)
 
         assert max_val_color > 0.8, "Template matching should have a high correlation"
+
+
+def test_write_image_only_when_changed(tmp_path, sample_image):
+    file_path = tmp_path / "support.png"
+    assert write_image(file_path, sample_image) is True
+    assert np.array_equal(cv2.imread(str(file_path)), sample_image)
+
+    # Unchanged content leaves the file alone
+    mtime = file_path.stat().st_mtime_ns
+    assert write_image(file_path, sample_image) is False
+    assert file_path.stat().st_mtime_ns == mtime
+
+    assert write_image(file_path, sample_image // 2) is True
+    assert np.array_equal(cv2.imread(str(file_path)), sample_image // 2)
+    assert not (tmp_path / "support.png.part").exists()
@@ -0,0 +1,51 @@
+import pytest
+
+from factories import make_ce, make_store
+from journal import Journal
+from models import CraftEssenceData
+
+
+@pytest.mark.anyio
+async def test_replay_without_journal(tmp_path):
+    journal = Journal("ce", tmp_path / "ce.jsonl")
+    assert await journal.replay(make_store(tmp_path, CraftEssenceData)) == 0
+
+
+@pytest.mark.anyio
+async def test_replay_interrupted_run(tmp_path):
+    journal_path = tmp_path / "ce.jsonl"
+
+    journal = Journal("ce", journal_path)
+    await journal.append(make_ce(1))
+    await journal.append(make_ce(2))
+    await journal.close()
+
+    # Simulate a run killed in the middle of a write
+    with open(journal_path, "ab") as f:
+        f.write(b'{"idx": 3, "na')
+
+    store = make_store(tmp_path, CraftEssenceData)
+    replayed = Journal("ce", journal_path)
+    assert await replayed.replay(store) == 2
+    assert replayed.replayed == [1, 2]
+
+    item = await store.get(2)
+    assert item is not None
+    assert item.name == "CE 2"
+    assert len(item.assets) == 1
+    assert await store.get(3) is None
+
+
+@pytest.mark.anyio
+async def test_compact(tmp_path):
+    journal_path = tmp_path / "ce.jsonl"
+
+    journal = Journal("ce", journal_path)
+    await journal.append(make_ce(1))
+
+    store = make_store(tmp_path, CraftEssenceData)
+    await journal.replay(store)
+    await journal.compact(store)
+
+    assert not journal_path.exists()
+    assert await make_store(tmp_path, CraftEssenceData).get(1) is not None
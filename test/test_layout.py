@@ -0,0 +1,43 @@
+import importlib
+from unittest import mock
+
+import constants
+from layout import DirectoryLayout
+
+
+def test_ensure_creates_nested(tmp_path):
+    directory = tmp_path / "a" / "b"
+    layout = DirectoryLayout()
+
+    assert layout.ensure(directory) == directory
+    assert directory.is_dir()
+
+
+def test_ensure_remembers_created(tmp_path):
+    layout = DirectoryLayout()
+    layout.ensure(tmp_path / "a" / "b")
+
+    with mock.patch("pathlib.Path.mkdir") as mock_mkdir:
+        layout.ensure(tmp_path / "a" / "b")
+        layout.ensure(tmp_path / "a")
+        layout.ensure_parent(tmp_path / "a" / "b" / "file.png")
+
+    mock_mkdir.assert_not_called()
+
+
+def test_forget(tmp_path):
+    layout = DirectoryLayout()
+    layout.ensure(tmp_path / "a" / "b")
+    layout.forget(tmp_path / "a")
+
+    with mock.patch("pathlib.Path.mkdir") as mock_mkdir:
+        layout.ensure(tmp_path / "a" / "b")
+
+    mock_mkdir.assert_called_once()
+
+
+def test_import_has_no_filesystem_effects():
+    with mock.patch("pathlib.Path.mkdir") as mock_mkdir:
+        importlib.reload(constants)
+
+    mock_mkdir.assert_not_called()
@@ -0,0 +1,58 @@
+import orjson
+import pytest
+from loguru import logger
+
+from log import BatchedJsonSink, LogSampler
+
+
+@pytest.fixture
+def json_log(tmp_path):
+    sink = BatchedJsonSink(tmp_path / "app.jsonl", batch_size=3, flush_interval=60)
+    handler = logger.add(sink, level="DEBUG", enqueue=True)
+    yield sink
+    logger.remove(handler)
+
+
+def _lines(sink: BatchedJsonSink) -> list[dict]:
+    if not sink.path.exists():
+        return []
+    return [orjson.loads(line) for line in sink.path.read_bytes().splitlines()]
+
+
+def test_batched_json_sink(json_log):
+    logger.bind(kind="servant").info("first")
+    logger.info("second")
+    logger.complete()
+    # The batch is not full yet
+    assert _lines(json_log) == []
+
+    logger.error("third")
+    logger.complete()
+    lines = _lines(json_log)
+    assert [line["message"] for line in lines] == ["first", "second", "third"]
+    assert lines[0]["level"] == "INFO"
+    assert lines[0]["extra"] == {"kind": "servant"}
+    assert lines[2]["function"] == "test_batched_json_sink"
+
+    logger.debug("last")
+    logger.complete()
+    json_log.stop()
+    assert _lines(json_log)[-1]["message"] == "last"
+
+
+def test_log_sampler(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("log.time.monotonic", lambda: now[0])
+    sampler = LogSampler(per_second=2)
+
+    assert [sampler.level("download") for _ in range(4)] == [
+        "INFO",
+        "INFO",
+        "DEBUG",
+        "DEBUG",
+    ]
+    # Other categories have their own rate
+    assert sampler.level("render") == "INFO"
+
+    now[0] += 1
+    assert sampler.level("download") == "INFO"
@@ -0,0 +1,61 @@
+import orjson
+import pytest
+
+from metrics import RunMetrics, Stage, _quantile
+
+
+def test_quantile():
+    samples = [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert _quantile(samples, 0.5) == 3.0
+    assert _quantile(samples, 0.95) == pytest.approx(4.8)
+    assert _quantile([], 0.5) == 0.0
+
+
+def test_report():
+    metrics = RunMetrics()
+    for seconds in (0.1, 0.2, 0.3):
+        metrics.record(Stage.DOWNLOAD, seconds, nbytes=1000)
+    with metrics.time(Stage.ENCODE, items=2):
+        pass
+
+    report = metrics.report()
+    download = report["stages"]["download"]
+    assert download["samples"] == 3
+    assert download["items"] == 3
+    assert download["bytes"] == 3000
+    assert download["p50_seconds"] == pytest.approx(0.2)
+    assert download["max_seconds"] == pytest.approx(0.3)
+    assert report["stages"]["encode"]["items"] == 2
+    # Stages without samples are left out
+    assert "sync" not in report["stages"]
+
+
+def test_prometheus():
+    metrics = RunMetrics()
+    metrics.record(Stage.DECODE, 0.5, items=4, nbytes=2048)
+
+    text = metrics.prometheus()
+    assert "# TYPE fga_support_stage_duration_seconds summary" in text
+    assert (
+        'fga_support_stage_duration_seconds{stage="decode",quantile="0.95"} 0.5' in text
+    )
+    assert 'fga_support_stage_duration_seconds_count{stage="decode"} 1' in text
+    assert 'fga_support_stage_bytes{stage="decode"} 2048' in text
+    assert text.endswith("\n")
+
+
+@pytest.mark.anyio
+async def test_save(tmp_path):
+    metrics = RunMetrics()
+    metrics.record(Stage.SYNC, 1.5)
+
+    report_path = tmp_path / "logs" / "run-report.json"
+    metrics_path = tmp_path / "logs" / "metrics.prom"
+    await metrics.save(report_path, metrics_path)
+
+    report = orjson.loads(report_path.read_bytes())
+    assert report["stages"]["sync"]["total_seconds"] == 1.5
+    assert 'stage="sync"' in metrics_path.read_text()
+
+    metrics.reset()
+    assert metrics.report()["stages"] == {}
@@ -1,3 +1,5 @@
+import orjson
+
 from models import (
     Assets,
     BaseData,
@@ -84,6 +86,16 @@ class TestBaseData:
         base_data.name = "Tést:Name"
         assert base_data.sanitized_name == "Test Name"
 
+    def test_sanitized_name_is_memoized(self):
+        base_data = BaseData(idx=1, name="Tést:Name", rarity=5)
+        assert base_data.sanitized_name is base_data.sanitized_name
+        # The computed name is not part of the stored data
+        assert "_sanitized_name" not in orjson.loads(orjson.dumps(base_data))
+
+    def test_slots(self):
+        base_data = BaseData(idx=1, name="Test", rarity=5)
+        assert not hasattr(base_data, "__dict__")
+
     def test_is_empty_true(self):
         base_data = BaseData(idx=1, name="Test", rarity=5)
         assert base_data.is_empty is True
@@ -0,0 +1,70 @@
+import time
+
+import httpx
+import pytest
+
+import utils
+from models import Assets
+from negative import NegativeCache
+
+
+def _asset(i: int) -> Assets:
+    return Assets(key=f"ascension_{i}", url=f"https://example.com/{i}.png")
+
+
+@pytest.fixture
+def cache(tmp_path) -> NegativeCache:
+    return NegativeCache(tmp_path / "negative.json", ttl=60)
+
+
+def test_skip(cache):
+    assets = [_asset(1), _asset(2)]
+    cache.record(assets[0].url, 404)
+
+    assert cache.filter(assets) == [assets[1]]
+    assert cache.skipped == set()
+    assert cache.skip(assets) == [assets[1]]
+    assert cache.skipped == {assets[0].url}
+
+    # Expired URLs are tried again and forgotten once they download
+    cache.entries[assets[0].url].last_failed -= 61
+    assert cache.filter(assets) == assets
+    cache.forget(assets[0].url)
+    assert cache.entries == {}
+
+
+@pytest.mark.anyio
+async def test_load_save(cache):
+    cache.record("https://example.com/old.png", 410)
+    cache.entries["https://example.com/old.png"].last_failed = time.time() - 1000
+    cache.record("https://example.com/new.png", 404)
+    await cache.save()
+    assert cache.failed == set()
+
+    # URLs expired for several TTLs are dropped
+    loaded = NegativeCache(cache.path, ttl=60)
+    await loaded.load()
+    assert list(loaded.entries) == ["https://example.com/new.png"]
+    assert loaded.is_failed("https://example.com/new.png")
+
+
+@pytest.mark.anyio
+async def test_download_file_not_found(tmp_path, cache, monkeypatch):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(404, content=b"not found")
+
+    monkeypatch.setattr(
+        utils, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+    # A permanent failure is recorded and not retried
+    url = "https://example.com/gone.png"
+    assert (
+        await utils.download_file(url, tmp_path / "a.png", negative_cache=cache) is None
+    )
+    assert len(requests) == 1
+    assert cache.failed == {url}
+    assert cache.entries[url].status == 404
@@ -0,0 +1,116 @@
+import cv2
+import httpx
+import numpy as np
+import pytest
+
+import pack
+import utils
+from image import _read_images
+from pack import AssetPack
+
+
+@pytest.fixture
+def asset_pack(tmp_path, monkeypatch) -> AssetPack:
+    asset_pack = AssetPack(
+        tmp_path / "assets.pack",
+        tmp_path / "assets.pack.json",
+        tmp_path,
+        (tmp_path / "servant",),
+    )
+    monkeypatch.setattr(pack, "asset_pack", asset_pack)
+    return asset_pack
+
+
+def _reopen(asset_pack: AssetPack) -> AssetPack:
+    return AssetPack(
+        asset_pack.path,
+        asset_pack.index_path,
+        asset_pack.root,
+        asset_pack.directories,
+    )
+
+
+def test_put_get_delete(asset_pack):
+    asset_pack.put("servant/0001/a.png", b"a" * 10)
+    asset_pack.put("servant/0001/b.png", b"b" * 20)
+    asset_pack.put("servant/0001/a.png", b"A" * 30)
+    asset_pack.delete("servant/0001/b.png")
+
+    assert bytes(asset_pack.get("servant/0001/a.png")) == b"A" * 30
+    assert asset_pack.get("servant/0001/b.png") is None
+    assert asset_pack.listdir("servant/0001") == {"a.png": 30}
+    assert asset_pack.subdirectories("servant") == ["0001"]
+    assert asset_pack.dead_bytes == 30
+
+
+def test_reload_scans_unsaved_records(asset_pack):
+    asset_pack.put("servant/0001/a.png", b"a" * 10)
+    asset_pack.flush()
+    asset_pack.put("servant/0002/a.png", b"b" * 10)
+    asset_pack.delete("servant/0001/a.png")
+
+    # A record cut short by an interrupted write is dropped
+    with open(asset_pack.path, "ab") as f:
+        f.write(pack.HEADER.pack(3, 100) + b"key" + b"x" * 5)
+
+    reopened = _reopen(asset_pack)
+    assert list(reopened.index) == ["servant/0002/a.png"]
+    assert bytes(reopened.get("servant/0002/a.png")) == b"b" * 10
+    assert reopened.path.stat().st_size == asset_pack._size
+
+
+def test_compact(asset_pack):
+    for i in range(3):
+        asset_pack.put(f"servant/0001/{i}.png", bytes([i]) * 100)
+    view = asset_pack.get("servant/0001/0.png")
+    asset_pack.delete("servant/0001/1.png")
+
+    # The deleted record and its tombstone are reclaimed
+    record = pack.HEADER.size + len("servant/0001/1.png")
+    assert asset_pack.compact() == 100 + 2 * record
+    assert asset_pack.dead_bytes == 0
+    assert bytes(asset_pack.get("servant/0001/2.png")) == b"\x02" * 100
+    # Views handed out before the compaction stay valid
+    assert bytes(view) == b"\x00" * 100
+    assert _reopen(asset_pack).index == asset_pack.index
+
+
+def test_read_images_from_pack(tmp_path, asset_pack):
+    image = np.full((8, 8, 3), 200, dtype=np.uint8)
+    asset_pack.put("servant/0001/a.png", cv2.imencode(".png", image)[1].tobytes())
+
+    images = _read_images(tmp_path / "servant" / "0001")
+    assert len(images) == 1
+    assert np.array_equal(images[0], image)
+    assert not (tmp_path / "servant").exists()
+
+
+@pytest.mark.anyio
+async def test_download_file_into_pack(tmp_path, asset_pack, monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=b"x" * 200)
+
+    monkeypatch.setattr(
+        utils, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+    file_path = tmp_path / "servant" / "0001" / "a.png"
+    assert await utils.download_file("https://x/a.png", file_path) == file_path
+    assert not file_path.exists()
+    assert utils.is_downloaded(file_path)
+    assert utils.file_size(file_path) == 200
+
+    # Paths outside the packed directories stay files
+    export_path = tmp_path / "servant.json"
+    assert await utils.download_file("https://x/e.json", export_path) == export_path
+    assert export_path.read_bytes() == b"x" * 200
+
+
+def test_import_files(tmp_path, asset_pack):
+    directory = tmp_path / "servant" / "0001"
+    directory.mkdir(parents=True)
+    (directory / "a.png").write_bytes(b"a" * 10)
+
+    assert asset_pack.import_files() == 1
+    assert not directory.exists()
+    assert asset_pack.listdir("servant/0001") == {"a.png": 10}
@@ -0,0 +1,55 @@
+import pytest
+
+from enums import SupportKind
+from factories import make_servant, make_store
+from history import KindHistory
+from models import ServantData
+from plan import build_plan
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+@pytest.mark.anyio
+async def test_build_plan(tmp_path):
+    store = make_store(tmp_path, ServantData)
+    for servant in (
+        make_servant(1),
+        make_servant(2),
+        make_servant(3, name="Old"),
+        make_servant(4),
+    ):
+        await store.put(servant)
+
+    # The first asset of the changed servant is already downloaded
+    cached = tmp_path / "tmp" / "0002" / "ascension_0-2_0.png"
+    cached.parent.mkdir(parents=True)
+    cached.write_bytes(b"0" * 200)
+
+    latest = [
+        make_servant(1),
+        make_servant(2, assets=3),
+        make_servant(3, name="New"),
+        make_servant(5),
+    ]
+    plan = await build_plan(
+        SupportKind.SERVANT, _iterate(latest), store, tmp_path / "tmp"
+    )
+
+    assert plan.total == 4
+    assert [entry.idx for entry in plan.entries] == [2, 3, 5]
+    assert [entry.idx for entry in plan.renders] == [2, 5]
+    assert [entry.renamed_from for entry in plan.renames] == ["Old"]
+    assert [asset.key for asset in plan.downloads] == [
+        "ascension_1",
+        "ascension_2",
+        "ascension_0",
+    ]
+    assert plan.deletes == [4]
+    assert plan.syncs == 6
+
+    history = KindHistory(asset_bytes=1000, render_seconds=0.5)
+    assert plan.estimated_bytes(history) == 3000
+    assert plan.estimated_render_seconds(history) == 1.0
@@ -0,0 +1,138 @@
+import orjson
+import pytest
+
+import preprocess
+from enums import SupportKind
+from models import ServantData
+from region import PRIMARY_REGION
+
+RAW_SERVANTS = [
+    {
+        "collectionNo": 1,
+        "name": "Mash Kyrielight",
+        "type": "heroine",
+        "className": "shielder",
+        "rarity": 4,
+        "extraAssets": {
+            "faces": {"ascension": {"1": "https://example.com/JP/Faces/f_800.png"}}
+        },
+    },
+    {
+        "collectionNo": 2,
+        "name": "Altria Pendragon",
+        "type": "normal",
+        "className": "saber",
+        "rarity": 5,
+        "extraAssets": {
+            "faces": {
+                "ascension": {
+                    "1": "https://example.com/JP/Faces/f_1000000.png",
+                    "2": "https://example.com/JP/Faces/f_1000001.png",
+                }
+            }
+        },
+    },
+    {"collectionNo": 0, "name": "Enemy", "type": "enemy"},
+]
+
+
+@pytest.fixture
+def export_file(tmp_path, monkeypatch):
+    export_path = tmp_path / "servant.json"
+    export_path.write_bytes(orjson.dumps(RAW_SERVANTS))
+
+    async def _download_file(url, file_path, debug=False):
+        return export_path
+
+    monkeypatch.setattr(preprocess.utils, "download_file", _download_file)
+    monkeypatch.setattr(preprocess, "SNAPSHOT_DIR", tmp_path / "snapshot")
+    (tmp_path / "snapshot").mkdir()
+    return export_path
+
+
+def _stream(calls: list[int]):
+    async def _preprocess(raw_data):
+        calls.append(len(raw_data))
+        async for item in preprocess._preprocess_servant(raw_data):
+            yield item
+
+    return preprocess._process_data(
+        name="servant",
+        url="https://example.com/servant.json",
+        save_data_path=PRIMARY_REGION.remote_data(SupportKind.SERVANT),
+        preprocess_func=_preprocess,
+        class_type=ServantData,
+    )
+
+
+async def _process(calls: list[int]) -> list[ServantData]:
+    return [item async for item in _stream(calls)]
+
+
+@pytest.mark.anyio
+async def test_preprocess_servant():
+    servants = [item async for item in preprocess._preprocess_servant(RAW_SERVANTS)]
+
+    assert [servant.idx for servant in servants] == [1, 2]
+    assert servants[1].name == "Artoria Pendragon"
+    assert servants[1].class_name == "Saber"
+    assert [asset.key for asset in servants[1].assets] == [
+        "ascension_1",
+        "ascension_2",
+    ]
+
+
+@pytest.mark.anyio
+async def test_duplicate_names_out_of_order():
+    def _raw(collection_no: int, class_name: str) -> dict:
+        return {
+            "collectionNo": collection_no,
+            "name": "Foo",
+            "type": "normal",
+            "className": class_name,
+        }
+
+    raw_servants = [_raw(5, "saber"), {"collectionNo": 0}, _raw(3, "archer")]
+    servants = [item async for item in preprocess._preprocess_servant(raw_servants)]
+
+    # The lower collection number keeps the plain name, whatever the order
+    assert [(servant.idx, servant.name) for servant in servants] == [
+        (3, "Foo"),
+        (5, "Foo (Saber)"),
+    ]
+
+
+@pytest.mark.anyio
+async def test_snapshot_hit_skips_preprocess(export_file):
+    calls: list[int] = []
+
+    first = await _process(calls)
+    second = await _process(calls)
+
+    assert calls == [3]
+    assert second == first
+    assert second[1].assets[0].url_file_name == "f_1000000.png"
+
+
+@pytest.mark.anyio
+async def test_snapshot_miss_on_changed_export(export_file):
+    calls: list[int] = []
+
+    await _process(calls)
+    export_file.write_bytes(orjson.dumps(RAW_SERVANTS[:2]))
+    await _process(calls)
+
+    assert calls == [3, 2]
+
+
+@pytest.mark.anyio
+async def test_snapshot_ignores_consumer_updates(export_file):
+    calls: list[int] = []
+
+    # The consumer keeps only the downloaded assets, as `_process_generic_data`
+    async for item in _stream(calls):
+        item.assets = []
+
+    servants = await _process(calls)
+    assert calls == [3]
+    assert [len(servant.assets) for servant in servants] == [1, 2]
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import time
+
+import anyio
+import pytest
+
+from profiler import NATIVE_FRAME, SamplingProfiler, run_profiled
+
+
+def _busy_python(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+@pytest.mark.anyio
+async def test_sampling_profiler(tmp_path, monkeypatch):
+    profiler = SamplingProfiler(interval=0.001)
+
+    async def waiter():
+        await anyio.sleep(0.2)
+
+    profiler.start(asyncio.get_running_loop())
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(waiter)
+        await anyio.to_thread.run_sync(_busy_python, 0.1)
+        # A thread blocked in native code
+        await anyio.to_thread.run_sync(time.sleep, 0.1)
+    profiler.stop()
+
+    assert profiler.samples > 0
+    assert profiler.coroutine_inclusive["test_sampling_profiler.<locals>.waiter"] > 0
+
+    stacks = profiler.collapsed().splitlines()
+    assert any("test_profiler:_busy_python" in line for line in stacks)
+    assert any(NATIVE_FRAME in line for line in stacks)
+    assert "Coroutine wall time" in profiler.summary()
+
+
+@pytest.mark.anyio
+async def test_run_profiled(tmp_path, monkeypatch):
+    saved: list[SamplingProfiler] = []
+
+    async def save(self):
+        saved.append(self)
+
+    monkeypatch.setattr(SamplingProfiler, "save", save)
+
+    async def failing():
+        await anyio.sleep(0.02)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await run_profiled(failing)
+
+    # The profile is saved and the sampler stopped even on errors
+    assert len(saved) == 1
+    assert not any(t.name == "sampling-profiler" for t in threading.enumerate())
@@ -0,0 +1,91 @@
+import pytest
+
+import rebuild
+from enums import SupportKind
+from factories import make_servant, make_store
+from models import ServantData
+from rebuild import MissingAssetError, RebuildTarget, offline_rebuild
+
+
+async def _target(
+    tmp_path, servants: list[ServantData], rendered: list
+) -> RebuildTarget:
+    store = make_store(tmp_path, ServantData)
+    for servant in servants:
+        await store.put(servant)
+
+    async def fetch_local_data():
+        return store
+
+    return RebuildTarget(
+        kind=SupportKind.SERVANT,
+        fetch_local_data=fetch_local_data,
+        temp_dir=tmp_path / "tmp",
+        output_dir_base=tmp_path / "output",
+        output_color_dir_base=tmp_path / "output-color",
+        repo_dir_base=tmp_path / "repo",
+        repo_color_dir_base=tmp_path / "repo-color",
+        image_creation_func=lambda source, dest, dest_color: rendered.append(source),
+        output_image_filename="support.png",
+    )
+
+
+def _cache(tmp_path, servant: ServantData):
+    for asset in servant.assets:
+        path = tmp_path / "tmp" / f"{servant.idx:04d}" / asset.file_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"0" * 200)
+
+
+@pytest.mark.anyio
+async def test_offline_rebuild(tmp_path, monkeypatch):
+    servants = [
+        make_servant(1, assets=2),
+        make_servant(2, assets=2),
+        make_servant(3, assets=0),
+    ]
+    for servant in servants:
+        _cache(tmp_path, servant)
+
+    rendered: list = []
+    target = await _target(tmp_path, servants, rendered)
+    monkeypatch.setattr(rebuild, "TARGETS", [target])
+
+    # The servant without assets is skipped
+    assert await offline_rebuild(workers=2) == 2
+    assert sorted(path.name for path in rendered) == ["0001", "0002"]
+    assert (tmp_path / "output" / "0001" / "Servant 1.txt").exists()
+    assert (tmp_path / "output-color" / "0002" / "Servant 2.txt").exists()
+
+
+@pytest.mark.anyio
+async def test_offline_rebuild_missing_asset(tmp_path, monkeypatch):
+    servants = [make_servant(1, assets=2), make_servant(2, assets=2)]
+    _cache(tmp_path, servants[0])
+
+    rendered: list = []
+    target = await _target(tmp_path, servants, rendered)
+    monkeypatch.setattr(rebuild, "TARGETS", [target])
+
+    with pytest.raises(MissingAssetError, match="2 cached assets"):
+        await offline_rebuild()
+
+    # Nothing is rendered before every asset is found
+    assert rendered == []
+    assert not (tmp_path / "output").exists()
+
+
+@pytest.mark.anyio
+async def test_offline_rebuild_direct(tmp_path, monkeypatch):
+    servants = [make_servant(1, assets=2)]
+    _cache(tmp_path, servants[0])
+
+    rendered: list = []
+    target = await _target(tmp_path, servants, rendered)
+    monkeypatch.setattr(rebuild, "TARGETS", [target])
+
+    # The outputs go straight into the repository
+    assert await offline_rebuild(direct=True) == 1
+    assert (tmp_path / "repo" / "0001" / "Servant 1.txt").exists()
+    assert (tmp_path / "repo-color" / "0001" / "Servant 1.txt").exists()
+    assert not (tmp_path / "output").exists()
@@ -0,0 +1,40 @@
+from constants import (
+    DATA_DIR,
+    LEGACY_LOCAL_SERVANT_DATA,
+    LOCAL_SERVANT_DATA,
+    OUTPUT_CE_COLOR_DIR,
+    REPO_DIR_PATH,
+    TEMP_SERVANT_DIR,
+    TMP_DIR,
+)
+from enums import SupportKind
+from region import load_regions
+
+
+def test_load_regions(monkeypatch):
+    monkeypatch.setenv("SERVANT_URL", "https://example.com/JP/servant.json")
+    monkeypatch.setenv("NA_SERVANT_URL", "https://example.com/NA/servant.json")
+    monkeypatch.delenv("NA_CE_URL", raising=False)
+
+    jp, na = load_regions("jp, NA,JP,")
+
+    # The first region keeps the single-region paths
+    assert jp.code == "JP"
+    assert jp.servant_url == "https://example.com/JP/servant.json"
+    assert jp.local_data(SupportKind.SERVANT) == LOCAL_SERVANT_DATA
+    assert jp.legacy_local_data(SupportKind.SERVANT) == LEGACY_LOCAL_SERVANT_DATA
+    assert jp.temp_dir(SupportKind.SERVANT) == TEMP_SERVANT_DIR
+    assert jp.output_dir(SupportKind.CRAFT_ESSENCE, color=True) == OUTPUT_CE_COLOR_DIR
+    assert jp.key(SupportKind.SERVANT) == "servant"
+
+    assert na.servant_url == "https://example.com/NA/servant.json"
+    assert na.ce_url is None
+    assert na.local_data(SupportKind.SERVANT) == DATA_DIR / "na" / "local-servant"
+    assert na.legacy_local_data(SupportKind.SERVANT) is None
+    assert na.temp_dir(SupportKind.SERVANT) == TMP_DIR / "na" / "servant"
+    assert na.repo_dir(SupportKind.SERVANT, color=True) == (
+        REPO_DIR_PATH / "na" / "servant-color"
+    )
+    assert na.key(SupportKind.SERVANT) == "na/servant"
+
+    assert [region.code for region in load_regions("")] == ["JP"]
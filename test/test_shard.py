@@ -0,0 +1,71 @@
+import orjson
+import pytest
+
+from enums import SupportKind
+from factories import make_store
+from models import CraftEssenceData
+from shard import Shard, ShardError, merge_fragments
+
+
+def test_parse():
+    assert Shard.parse("1/4") == Shard(index=1, count=4)
+    assert Shard.parse("1/4").name == "1-of-4"
+
+
+@pytest.mark.parametrize("value", ["", "1", "a/b", "4/4", "-1/4", "0/0"])
+def test_parse_invalid(value):
+    with pytest.raises(ShardError):
+        Shard.parse(value)
+
+
+def test_owns_partitions_every_idx():
+    shards = [Shard(index=i, count=3) for i in range(3)]
+    for idx in range(1, 100):
+        assert sum(shard.owns(idx) for shard in shards) == 1
+
+
+def _write_fragment(root, index: int, count: int, indices: list[int]):
+    root.mkdir(parents=True, exist_ok=True)
+    (root / f"ce-{index}-of-{count}.json").write_bytes(
+        orjson.dumps(
+            {
+                "kind": "ce",
+                "index": index,
+                "count": count,
+                "data": [
+                    CraftEssenceData(idx=idx, name=f"CE {idx}", rarity=5)
+                    for idx in indices
+                ],
+            }
+        )
+    )
+
+
+@pytest.mark.anyio
+async def test_merge_fragments(tmp_path):
+    store = make_store(tmp_path, CraftEssenceData)
+    await store.put(CraftEssenceData(idx=7, name="Removed", rarity=5))
+    await store.flush()
+
+    _write_fragment(tmp_path / "a", 0, 2, [2, 4])
+    _write_fragment(tmp_path / "b", 1, 2, [1, 3])
+
+    merged = await merge_fragments(
+        SupportKind.CRAFT_ESSENCE, [tmp_path / "a", tmp_path / "b"], store
+    )
+
+    assert len(merged) == 2
+    assert await make_store(tmp_path, CraftEssenceData).indices() == {1, 2, 3, 4}
+
+
+@pytest.mark.anyio
+async def test_merge_fragments_missing_shard(tmp_path):
+    _write_fragment(tmp_path / "a", 0, 3, [3])
+    _write_fragment(tmp_path / "a", 2, 3, [2])
+
+    with pytest.raises(ShardError, match=r"Missing ce shards \[1\]"):
+        await merge_fragments(
+            SupportKind.CRAFT_ESSENCE,
+            [tmp_path / "a"],
+            make_store(tmp_path, CraftEssenceData),
+        )
@@ -0,0 +1,54 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+
+# Modules only the rendering and download commands may import
+HEAVY_MODULES = {"cv2", "numpy", "httpx", "httpcore"}
+
+# Generous bound of the cumulative `import main` time, in microseconds
+IMPORT_BUDGET_US = 1_000_000
+
+
+def _import_times(args: list[str], root: Path) -> dict[str, int]:
+    """
+    Run Python with `-X importtime` and get the cumulative import time of
+    every imported module, in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=SRC_DIR,
+        env={"FGA_ROOT": str(root), "PYTHONPATH": str(SRC_DIR)},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    times: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_main(tmp_path):
+    times = _import_times(["-c", "import main"], tmp_path)
+
+    assert "main" in times
+    assert HEAVY_MODULES.isdisjoint(times)
+    assert times["main"] < IMPORT_BUDGET_US
+
+
+@pytest.mark.parametrize(
+    "command", [["--help"], ["--plan"], ["verify"], ["cache", "stats"]]
+)
+def test_light_commands(tmp_path, command):
+    times = _import_times(["main.py", *command], tmp_path)
+
+    # The script itself is not listed, but everything it imports is
+    assert "preprocess" in times
+    assert HEAVY_MODULES.isdisjoint(times)
@@ -0,0 +1,112 @@
+import orjson
+import pytest
+from anyio import create_task_group
+
+from factories import make_servant, make_store
+from models import ServantData
+from store import LocalDataStore
+
+
+def _store(tmp_path, legacy_path=None) -> LocalDataStore[ServantData]:
+    return make_store(tmp_path, ServantData, legacy_path=legacy_path, shard_size=10)
+
+
+@pytest.mark.anyio
+async def test_get_missing(tmp_path):
+    store = _store(tmp_path)
+    assert await store.get(1) is None
+
+
+@pytest.mark.anyio
+async def test_put_and_flush_writes_only_changed_shards(tmp_path):
+    store = _store(tmp_path)
+    for idx in (1, 2, 15):
+        await store.put(make_servant(idx))
+    assert await store.flush() == 2
+
+    shard_files = sorted(path.name for path in store.root.iterdir())
+    assert shard_files == ["0000.json", "0001.json"]
+
+    store = _store(tmp_path)
+    assert await store.put(make_servant(15)) is False
+    assert await store.flush() == 0
+
+    assert await store.put(make_servant(15, assets=2)) is True
+    mtime = (store.root / "0000.json").stat().st_mtime_ns
+    assert await store.flush() == 1
+    assert (store.root / "0000.json").stat().st_mtime_ns == mtime
+
+
+@pytest.mark.anyio
+async def test_get_loads_lazily(tmp_path):
+    store = _store(tmp_path)
+    await store.put(make_servant(1, name="Mash"))
+    await store.put(make_servant(25))
+    await store.flush()
+
+    store = _store(tmp_path)
+    item = await store.get(1)
+    assert item is not None
+    assert item.name == "Mash"
+    assert len(item.assets) == 1
+    assert await store.shard_ids() == {0, 2}
+    assert set(store._shards) == {0}
+
+
+@pytest.mark.anyio
+async def test_prune(tmp_path):
+    store = _store(tmp_path)
+    for idx in (1, 2, 15):
+        await store.put(make_servant(idx))
+    await store.flush()
+
+    store = _store(tmp_path)
+    assert await store.prune({1, 2}) == [15]
+    await store.flush()
+
+    assert not (store.root / "0001.json").exists()
+    assert await _store(tmp_path).get(15) is None
+
+
+@pytest.mark.anyio
+async def test_legacy_migration(tmp_path):
+    legacy_path = tmp_path / "local-servant.json"
+    legacy_path.write_bytes(orjson.dumps([make_servant(1), make_servant(12)]))
+
+    store = _store(tmp_path, legacy_path=legacy_path)
+    assert await store.get(12) is not None
+    assert await store.flush() == 2
+    assert not legacy_path.exists()
+
+    assert await _store(tmp_path).get(1) is not None
+
+
+@pytest.mark.anyio
+async def test_legacy_migration_before_get(tmp_path):
+    legacy_path = tmp_path / "local-servant.json"
+    legacy_path.write_bytes(orjson.dumps([make_servant(1), make_servant(12)]))
+
+    # Listing and pruning see the legacy data without a `get` first
+    assert await _store(tmp_path, legacy_path=legacy_path).indices() == {1, 12}
+    store = _store(tmp_path, legacy_path=legacy_path)
+    assert await store.prune({12}) == [1]
+    await store.flush()
+    assert await _store(tmp_path).indices() == {12}
+
+
+@pytest.mark.anyio
+async def test_concurrent_get_during_migration(tmp_path):
+    legacy_path = tmp_path / "local-servant.json"
+    legacy_path.write_bytes(orjson.dumps([make_servant(1), make_servant(2)]))
+    store = _store(tmp_path, legacy_path=legacy_path)
+
+    # Entities are processed concurrently, none may see the shard unmigrated
+    found: list = []
+
+    async def _get(idx: int):
+        found.append(await store.get(idx))
+
+    async with create_task_group() as tg:
+        for idx in (1, 2):
+            tg.start_soon(_get, idx)
+    assert sorted(item.idx for item in found if item is not None) == [1, 2]
@@ -0,0 +1,66 @@
+import httpx
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def mock_client(monkeypatch):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=b"[]", headers={"ETag": '"v1"'})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(utils, "_client", client)
+    return requests
+
+
+@pytest.mark.anyio
+async def test_download_if_modified(tmp_path, mock_client):
+    file_path = tmp_path / "servant.json"
+    validators: dict[str, str] = {}
+
+    assert await utils.download_if_modified("https://x/e.json", file_path, validators)
+    assert file_path.read_bytes() == b"[]"
+    assert validators == {"etag": '"v1"'}
+
+    assert (
+        await utils.download_if_modified("https://x/e.json", file_path, validators)
+        is False
+    )
+    assert mock_client[1].headers["If-None-Match"] == '"v1"'
+    assert not (tmp_path / "servant.json.part").exists()
+
+
+def test_is_downloaded(tmp_path):
+    file_path = tmp_path / "asset.png"
+    assert utils.is_downloaded(file_path) is False
+
+    file_path.write_bytes(b"0" * 100)
+    assert utils.is_downloaded(file_path) is False
+
+    file_path.write_bytes(b"0" * 101)
+    assert utils.is_downloaded(file_path) is True
+
+
+@pytest.mark.anyio
+async def test_download_file_http_error(tmp_path, monkeypatch):
+    statuses = iter([500, 429, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = next(statuses)
+        return httpx.Response(status, content=b"x" * 200 if status == 200 else b"err")
+
+    monkeypatch.setattr(utils, "RETRY_DELAY", 0)
+    monkeypatch.setattr(
+        utils, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+    # The error pages are retried instead of being saved as the file
+    file_path = tmp_path / "asset.png"
+    assert await utils.download_file("https://x/a.png", file_path) == file_path
+    assert file_path.read_bytes() == b"x" * 200
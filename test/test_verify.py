@@ -0,0 +1,78 @@
+import pytest
+
+import verify
+from enums import SupportKind
+from factories import make_servant, make_store
+from manifest import BuildManifest, digest
+from models import ServantData
+from verify import VerifyTarget, verify_repo
+
+
+def _publish(manifest: BuildManifest, repo, servant: ServantData, data: bytes):
+    for name in ("servant", "servant-color"):
+        directory = repo / name / f"{servant.idx:04d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"{servant.sanitized_name}.txt").touch()
+        (directory / "support.png").write_bytes(data)
+        manifest.record(directory / "support.png", data)
+
+
+@pytest.mark.anyio
+async def test_verify_repo(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    manifest = BuildManifest(tmp_path / "manifest.json", (repo,))
+    servants = [make_servant(1), make_servant(2), make_servant(3)]
+
+    store = make_store(tmp_path, ServantData)
+    for servant in servants:
+        await store.put(servant)
+
+    async def fetch_local_data():
+        return store
+
+    monkeypatch.setattr(
+        verify,
+        "TARGETS",
+        [
+            VerifyTarget(
+                kind=SupportKind.SERVANT,
+                fetch_local_data=fetch_local_data,
+                repo_dirs=(repo / "servant", repo / "servant-color"),
+                image_filename="support.png",
+            )
+        ],
+    )
+
+    _publish(manifest, repo, servants[0], b"one")
+    _publish(manifest, repo, servants[1], b"two")
+    # Servant 2 was changed behind the manifest, servant 3 never published
+    (repo / "servant-color" / "0002" / "support.png").write_bytes(b"changed")
+    # A renamed txt file and a removed servant are orphans
+    (repo / "servant" / "0001" / "Old Name.txt").touch()
+    (repo / "servant" / "0009").mkdir()
+
+    report = await verify_repo(manifest, workers=2)
+
+    assert report.checked == 6
+    assert report.rebuild == {SupportKind.SERVANT: {2, 3}}
+    assert report.problems[SupportKind.SERVANT][2] == [
+        "servant-color/0002/support.png does not match"
+    ]
+    assert report.orphans == [
+        repo / "servant" / "0001" / "Old Name.txt",
+        repo / "servant" / "0009",
+    ]
+    assert not report.ok
+
+
+@pytest.mark.anyio
+async def test_manifest_load_save(tmp_path):
+    manifest = BuildManifest(tmp_path / "manifest.json", (tmp_path / "output",))
+    manifest.record(tmp_path / "output" / "ce" / "0001" / "ce.png", b"ce")
+    # Only the outputs are recorded
+    manifest.record(tmp_path / "other.png", b"other")
+    await manifest.save()
+
+    loaded = BuildManifest(manifest.path, manifest.roots)
+    await loaded.load()
+    assert loaded.hashes == {"ce/0001/ce.png": digest(b"ce")}
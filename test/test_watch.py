@@ -0,0 +1,37 @@
+import pytest
+
+import watch
+from watch import MAX_BACKOFF, ExportWatcher, _backoff
+
+
+def test_backoff():
+    assert _backoff(300, 0) == 300
+    assert _backoff(300, 1) == 600
+    assert _backoff(300, 3) == 2400
+    assert _backoff(300, 10) == MAX_BACKOFF
+    assert _backoff(7200, 5) == 7200
+
+
+@pytest.mark.anyio
+async def test_failed_poll_is_retried(tmp_path, monkeypatch):
+    async def _download_if_modified(url, file_path, validators):
+        validators["etag"] = '"v1"'
+        return file_path
+
+    async def _process(*args, **kwargs):
+        raise ValueError("bad export")
+
+    monkeypatch.setattr(watch.utils, "download_if_modified", _download_if_modified)
+    watcher = ExportWatcher(
+        name="servant",
+        url="https://example.com/servant.json",
+        file_path=tmp_path / "servant.json",
+        load_func=lambda *args: None,
+        process_func=_process,
+        local_data=None,
+    )
+
+    with pytest.raises(ValueError):
+        await watcher.poll(debug=False, dry_run=False)
+    # The export is downloaded again instead of being seen as not modified
+    assert watcher.validators == {}